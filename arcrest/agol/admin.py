@@ -1343,8 +1343,15 @@ class AGOL(BaseAGOLClass):
                             proxy_url=self._proxy_url)
         return jres
       #----------------------------------------------------------------------
-    def addFile(self, file_path, agol_type, name, tags, description,folder=None):
-        """ loads a file to AGOL """
+    def addFile(self, file_path, agol_type, name, tags, description,folder=None,
+                callback=None):
+        """ loads a file to AGOL
+            The file is streamed from disk, so files of any size can be
+            uploaded.
+            Inputs:
+               callback - optional function called as callback(bytes sent,
+                          total bytes) while the file is uploaded
+        """
         params = {
             "f" : "json",
             "filename" : os.path.basename(file_path),
@@ -1372,7 +1379,8 @@ class AGOL(BaseAGOLClass):
                                    port=parsed.port,
                                    ssl=parsed.scheme.lower() == 'https',
                                    proxy_port=self._proxy_port,
-                                   proxy_url=self._proxy_url)
+                                   proxy_url=self._proxy_url,
+                                   callback=callback)
         res = self._unicode_convert(json.loads(res))
         return res
     #----------------------------------------------------------------------
@@ -10,19 +10,14 @@
 """
 
 import os
-import urllib
-import urllib2
 import json
-import httplib
 import zipfile
 import glob
 import calendar
 import datetime
-import mimetypes
-import mimetools
-import gzip
-import math
-from cStringIO import StringIO
+from ..web.transport import get_transport
+from ..common import codec
+from ..web.tokencache import get_token_cache
 
 ########################################################################
 class Geometry(object):
@@ -43,8 +38,21 @@ class BaseAGOLClass(object):
     _tokenurl = 'https://www.arcgis.com/sharing/rest/generateToken'
     _proxy_url = None
     _proxy_port = None
-    def initURL(self,org_url=None, rest_url=None,token_url=None,referer_url=None):
-
+    _transport = None
+    def initURL(self,org_url=None, rest_url=None,token_url=None,referer_url=None,
+                ssl=False):
+        """
+           sets the urls used by the class
+           Inputs:
+              org_url - organization url
+              rest_url - sharing rest url, defaults to <org_url>/sharing/rest
+              token_url - url used to generate tokens
+              referer_url - referer used when generating tokens
+              ssl - if True, the organization only accepts https
+                    requests, all requests to it are sent over https.
+                    Organizations given as https:// urls are treated the
+                    same way.
+        """
         if org_url is not None and org_url != '':
             if not org_url.startswith('http://') and not org_url.startswith('https://'):
                 org_url = 'http://' + org_url
@@ -73,8 +81,11 @@ class BaseAGOLClass(object):
         else:
             self._referer_url = referer_url
 
-
-
+        transport = self._get_transport()
+        if ssl or self._org_url.startswith('https://'):
+            transport.require_ssl(self._org_url)
+        if ssl or self._url.startswith('https://'):
+            transport.require_ssl(self._url)
     #----------------------------------------------------------------------
     def _unzip_file(self, zip_file, out_folder):
         """ unzips a file to a given folder """
@@ -101,64 +112,71 @@ class BaseAGOLClass(object):
         files.sort()
         return files
     #----------------------------------------------------------------------
-    def _download_file(self, url, save_path, file_name, proxy_url=None, proxy_port=None):
+    def _get_transport(self):
+        """ returns the Transport object used for web requests """
+        if self._transport is None:
+            return get_transport()
+        return self._transport
+    #----------------------------------------------------------------------
+    def _download_file(self, url, save_path, file_name, proxy_url=None, proxy_port=None,
+                       param_dict=None):
         """ downloads a file """
-        try:
-            if proxy_url is not None:
-                if proxy_port is None:
-                    proxy_port = 80
-                proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                           "https":"https://%s:%s" % (proxy_url, proxy_port)}
-                proxy_support = urllib2.ProxyHandler(proxies)
-                opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-                urllib2.install_opener(opener)
-           
-            file_data = urllib2.urlopen(url)
-            total_size = int(file_data.info().getheader('Content-Length').strip())
-            downloaded = 0
-            CHUNK = 4096
-            
-            with open(save_path + os.sep + file_name, 'wb') as out_file:
-                while True:
-                    chunk = file_data.read(CHUNK)
-                    downloaded += len(chunk)
-                    if not chunk: break
-                    #print str(int(math.floor(float(downloaded) / float(total_size) * 100 ))) + "% download"
-                                                      
-                    out_file.write(chunk)       
-               
-            return save_path + os.sep + file_name
-        except urllib2.HTTPError, e:
-            print "HTTP Error:",e.code , url
-            return False
-        except urllib2.URLError, e:
-            print "URL Error:",e.reason , url
-            return False
+        return self._get_transport().download(url=url,
+                                              save_path=save_path,
+                                              file_name=file_name,
+                                              proxy_url=proxy_url,
+                                              proxy_port=proxy_port,
+                                              param_dict=param_dict)
+    #----------------------------------------------------------------------
+    def _download_unzip(self, url, out_folder, proxy_url=None, proxy_port=None,
+                        param_dict=None):
+        """ downloads a zip file and extracts it as it streams """
+        return self._get_transport().download_unzip(url=url,
+                                                    out_folder=out_folder,
+                                                    proxy_url=proxy_url,
+                                                    proxy_port=proxy_port,
+                                                    param_dict=param_dict)
     #----------------------------------------------------------------------
     def generate_token(self, referer=None, tokenURL=None,
                        proxy_url=None, proxy_port=None):
-        """ generates a token for a feature service """
+        """ generates a token for a feature service
+
+            Tokens are shared through the process wide token cache, so
+            all the service objects using the same token url, username
+            and referer reuse one token until it is about to expire.
+        """
         if referer is None:
             referer=self._referer_url
         if tokenURL is None:
             tokenUrl  = self._tokenurl
+        else:
+            tokenUrl = tokenURL
 
         query_dict = {'username': self._username,
                       'password': self._password,
                       'expiration': str(60),
                       'referer': referer,
                       'f': 'json'}
-        token = self._do_post(url=tokenUrl,
-                              param_dict=query_dict,
-                              proxy_url=proxy_url,
-                              proxy_port=proxy_port)
+        def generate():
+            return self._do_post(url=tokenUrl,
+                                 param_dict=query_dict,
+                                 proxy_url=proxy_url,
+                                 proxy_port=proxy_port)
+        token = get_token_cache().get(token_url=tokenUrl,
+                                      username=self._username,
+                                      referer=referer,
+                                      generator=generate,
+                                      password=self._password)
         if "token" not in token:
             self._token = None
             return token
         else:
             httpPrefix = self._url
-            if token['ssl'] == True:
+            if token.get('ssl', False) == True:
                 httpPrefix = self._surl
+                transport = self._get_transport()
+                transport.require_ssl(self._url)
+                transport.require_ssl(self._org_url)
             self._token = token['token']
             return token['token'], httpPrefix
     #----------------------------------------------------------------------
@@ -184,70 +202,34 @@ class BaseAGOLClass(object):
     #----------------------------------------------------------------------
     def _do_post(self, url, param_dict, proxy_url=None, proxy_port=None):
         """ performs the POST operation and returns dictionary result """
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-            urllib2.install_opener(opener)
-        request = urllib2.Request(url, urllib.urlencode(param_dict))
-        result = urllib2.urlopen(request).read()
-        if result =="":
-            return ""
-        jres = json.loads(result)
-        if 'error' in jres:
-            if jres['error']['message'] == 'Request not made over ssl':
-                if url.startswith('http://'):
-                    url = url.replace('http://', 'https://')
-                    return self._do_post( url, param_dict, proxy_url, proxy_port)
-
-        return self._unicode_convert(jres)
+        result = self._get_transport().post(url=url,
+                                            param_dict=param_dict,
+                                            referer=self._referer_url,
+                                            proxy_url=proxy_url,
+                                            proxy_port=proxy_port)
+        return result
     #----------------------------------------------------------------------
     def _do_get(self, url, param_dict, header={}, proxy_url=None, proxy_port=None,compress=True):
         """ performs a get operation """
-        format_url = url + "?%s" % urllib.urlencode(param_dict)
-
-        headers = [('Referer', self._referer_url),
-                   ('User-Agent', self._useragent)]
-
-        if compress:
-            headers.append(('Accept-encoding', 'gzip'))
-        opener= None
-
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support)#, urllib2.HTTPHandler(debuglevel=1)
-            #urllib2.install_opener(opener)
-        else:
-            opener = urllib2.build_opener()
-        opener.addheaders = headers
-        resp = opener.open(format_url)
-
-        #request = urllib2.Request(url, headers=header)
-        #resp = urllib2.urlopen(request)
-        if resp.info().get('Content-Encoding') == 'gzip':
-            buf = StringIO(resp.read())
-            f = gzip.GzipFile(fileobj=buf)
-            resp_data = f.read()
-        else:
-            resp_data = resp.read()
-        if resp_data == "" or resp_data == None or resp_data == 'null':
-            return ""
-        result = json.loads(resp_data)
-        if 'error' in result:
-            if result['error']['message'] == 'Request not made over ssl':
-                if url.startswith('http://'):
-                    url = url.replace('http://', 'https://')
-                    return self._do_get(url=url, param_dict=param_dict ,proxy_url=proxy_url, proxy_port=proxy_port,compress=compress)
-        return self._unicode_convert(result)
+        result = self._get_transport().get(url=url,
+                                           param_dict=param_dict,
+                                           headers=header,
+                                           referer=self._referer_url,
+                                           proxy_url=proxy_url,
+                                           proxy_port=proxy_port,
+                                           compress=compress)
+        return result
     #----------------------------------------------------------------------
-    def _post_multipart(self, host, selector, fields, files, ssl=False,port=80,proxy_url=None,proxy_port=None):
+    def _do_get_bytes(self, url, param_dict, header={}, proxy_url=None, proxy_port=None):
+        """ performs a get operation and returns the raw response body """
+        return self._get_transport().get_bytes(url=url,
+                                               param_dict=param_dict,
+                                               headers=header,
+                                               referer=self._referer_url,
+                                               proxy_url=proxy_url,
+                                               proxy_port=proxy_port)
+    #----------------------------------------------------------------------
+    def _post_multipart(self, host, selector, fields, files, ssl=False,port=80,proxy_url=None,proxy_port=None,callback=None):
         """ performs a multi-post to AGOL or AGS
             Inputs:
                host - string - root url (no http:// or https://)
@@ -259,6 +241,8 @@ class BaseAGOLClass(object):
                ssl - option to use SSL
                proxy_url - string - url to proxy server
                proxy_port - interger - port value if not on port 80
+               callback - optional function called as callback(bytes sent,
+                          total bytes) while the files are uploaded
 
             Output:
                JSON response as dictionary
@@ -273,73 +257,15 @@ class BaseAGOLClass(object):
                                fields=params
                                )
         """
-        boundary, body = self._encode_multipart_formdata(fields, files)
-        headers = {
-        'User-Agent': "ArcREST",
-        'Content-Type': 'multipart/form-data; boundary=%s' % boundary
-        }
-
-
-
-        if proxy_url:
-            if ssl:
-                h = httplib.HTTPSConnection(proxy_url, proxy_port)
-                h.request('POST', 'https://' + host + selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(proxy_url, proxy_port)
-                h.request('POST', 'http://' + host + selector, body, headers)
-        else:
-            if ssl:
-                h = httplib.HTTPSConnection(host,port)
-                h.request('POST', selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(host,port)
-                h.request('POST', selector, body, headers)
-
-        resp_data = h.getresponse().read()
-        if resp_data =="":
-            return ""
-        result = json.loads(resp_data)
-        if 'error' in result:
-            if result['error']['message'] == 'Request not made over ssl':
-                return self._post_multipart(host=host, selector=selector, fields=fields, files=files, ssl=True,port=port,proxy_url=proxy_url,proxy_port=proxy_port)
-        return resp_data
-    #----------------------------------------------------------------------
-    def _encode_multipart_formdata(self, fields, files):
-        boundary = mimetools.choose_boundary()
-        buf = StringIO()
-        for (key, value) in fields.iteritems():
-            buf.write('--%s\r\n' % boundary)
-            buf.write('Content-Disposition: form-data; name="%s"' % key)
-            buf.write('\r\n\r\n' + self._tostr(value) + '\r\n')
-        for (key, filepath, filename) in files:
-            if os.path.isfile(filepath):
-                buf.write('--%s\r\n' % boundary)
-                buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
-                buf.write('Content-Type: %s\r\n' % (self._get_content_type(filename)))
-                file = open(filepath, "rb")
-                try:
-                    buf.write('\r\n' + file.read() + '\r\n')
-                finally:
-                    file.close()
-        buf.write('--' + boundary + '--\r\n\r\n')
-        buf = buf.getvalue()
-        return boundary, buf
-    #----------------------------------------------------------------------
-    def _get_content_type(self, filename):
-        """ gets the content type of a file """
-        mntype = mimetypes.guess_type(filename)[0]
-        filename, fileExtension = os.path.splitext(filename)
-        if mntype is None and\
-            fileExtension.lower() == ".csv":
-            mntype = "text/csv"
-        elif mntype is None and \
-            fileExtension.lower() == ".sd":
-            mntype = "File/sd"
-        elif mntype is None:
-            #mntype = 'application/octet-stream'
-            mntype= "File/%s" % fileExtension.replace('.', '')
-        return mntype
+        return self._get_transport().post_multipart(host=host,
+                                                    selector=selector,
+                                                    fields=fields,
+                                                    files=files,
+                                                    ssl=ssl,
+                                                    port=port,
+                                                    proxy_url=proxy_url,
+                                                    proxy_port=proxy_port,
+                                                    callback=callback)
     #----------------------------------------------------------------------
     def _tostr(self,obj):
         """ converts a object to list, if object is a list, it creates a
@@ -353,11 +279,4 @@ class BaseAGOLClass(object):
     #----------------------------------------------------------------------
     def _unicode_convert(self, obj):
         """ converts unicode to anscii """
-        if isinstance(obj, dict):
-            return {self._unicode_convert(key): self._unicode_convert(value) for key, value in obj.iteritems()}
-        elif isinstance(obj, list):
-            return [self._unicode_convert(element) for element in obj]
-        elif isinstance(obj, unicode):
-            return obj.encode('utf-8')
-        else:
-            return obj
\ No newline at end of file
+        return codec.convert(obj)
\ No newline at end of file
@@ -12,6 +12,7 @@ import os
 import copy
 import json
 import arcpy
+from ..common import codec
 from base import Geometry
 import datetime
 import calendar
@@ -354,8 +355,8 @@ class Point(Geometry):
     #----------------------------------------------------------------------
     def __str__(self):
         """ returns the object as a string """
-        return json.dumps(self.asDictionary,
-                          default=_date_handler)
+        return codec.dumps(self.asDictionary,
+                           default=_date_handler)
     #----------------------------------------------------------------------
     @property
     def spatialReference(self):
@@ -372,8 +373,8 @@ class Point(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary,
+                                default=_date_handler)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -509,8 +510,8 @@ class MultiPoint(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary,
+                                default=_date_handler)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -591,8 +592,8 @@ class Polyline(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary,
+                                default=_date_handler)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -672,8 +673,8 @@ class Polygon(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary,
+                                default=_date_handler)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -771,8 +772,8 @@ class Envelope(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary,
+                                default=_date_handler)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -800,8 +801,7 @@ class Feature(object):
     def __init__(self, json_string):
         """Constructor"""
         if type(json_string) is dict:
-            self._json = json.dumps(json_string,
-                                    default=_date_handler)
+            # the JSON string is only built when asJSON is used
             self._dict = json_string
         elif type(json_string) is str:
             self._dict = json.loads(json_string)
@@ -814,7 +814,7 @@ class Feature(object):
         if field_name in self.fields:
             if not value is None:
                 self._dict['attributes'][field_name] = _unicode_convert(value)
-                self._json = json.dumps(self._dict, default=_date_handler)
+                self._json = None
             else:
                 pass
         elif field_name.upper() in ['SHAPE', 'SHAPE@', "GEOMETRY"]:
@@ -838,7 +838,7 @@ class Feature(object):
                     }
                 else:
                     return False
-                self._json = json.dumps(self._dict, default=_date_handler)
+                self._json = None
             elif isinstance(value, arcpy.Geometry):
                 if isinstance(value, arcpy.PointGeometry):
                     self.set_value( field_name, Point(value,value.spatialReference.factoryCode))
@@ -879,6 +879,13 @@ class Feature(object):
         return self._dict
     #----------------------------------------------------------------------
     @property
+    def asJSON(self):
+        """ returns the feature as a JSON string """
+        if self._json is None:
+            self._json = codec.dumps(self._dict, default=_date_handler)
+        return self._json
+    #----------------------------------------------------------------------
+    @property
     def asRow(self):
         """ converts a feature to a list for insertion into an insert cursor
             Output:
@@ -962,13 +969,4 @@ class Feature(object):
 #----------------------------------------------------------------------
 def _unicode_convert(obj):
     """ converts unicode to anscii """
-    if isinstance(obj, dict):
-        return {_unicode_convert(key): \
-                _unicode_convert(value) \
-                for key, value in obj.iteritems()}
-    elif isinstance(obj, list):
-        return [_unicode_convert(element) for element in obj]
-    elif isinstance(obj, unicode):
-        return obj.encode('utf-8')
-    else:
-        return obj
\ No newline at end of file
+    return codec.convert(obj)
\ No newline at end of file
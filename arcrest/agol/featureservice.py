@@ -12,13 +12,20 @@ import types
 from base import BaseAGOLClass
 import layer as servicelayers
 import common
-from filters import LayerDefinitionFilter, GeometryFilter, TimeFilter
+from filters import LayerDefinitionFilter, GeometryFilter, TimeFilter, \
+     JSONGeometryFilter
 from base import Geometry
 import urlparse
 import urllib
 import os
 import json
 import mimetypes
+from ..web.polling import poll
+from ..web.workerpool import WorkerPool
+from ..common.replicastore import ReplicaStore
+
+# createReplica job statuses after which the job no longer changes
+_REPLICA_JOB_ENDED = ("completed", "completedwitherrors", "failed")
 
 ########################################################################
 class FeatureService(BaseAGOLClass):
@@ -545,7 +552,7 @@ class FeatureService(BaseAGOLClass):
         }
         if not self._token is None:
             params["token"] = self._token
-        url = self._url + "/replicas/%s" + replica_id
+        url = self._url + "/replicas/%s" % replica_id
         return self._do_get(url, param_dict=params,
                             proxy_url=self._proxy_url,
                             proxy_port=self._proxy_port)
@@ -559,7 +566,10 @@ class FeatureService(BaseAGOLClass):
                       returnAttachmentDatabyURL=True,
                       returnAsFeatureClass=None,
                       outputFormat='FILEGDB',
-                      out_path=None
+                      out_path=None,
+                      async=False,
+                      poll_strategy=None,
+                      timeout=None
                       ):
         """ generates a replica
             Inputs:
@@ -583,11 +593,17 @@ class FeatureService(BaseAGOLClass):
                returnAsFeatureClass - Deprecated and replaced with outputFormat
                outputFormat - [sqlite,filegdb,json] The types of features that can be return
                out_path - Path where the replica will be saved.  If not provided, the url to the replica
-                                    will be returned.
+                                    will be returned.  Zipped FILEGDB and SQLite replicas are
+                                    extracted while they download.
+               async - If true, the server creates the replica as a job and its status is
+                       polled with exponential backoff, instead of holding one request open
+                       until the replica is ready.
+               poll_strategy - arcrest.web.polling.Backoff used to poll an async replica
+               timeout - seconds to wait for an async replica, None waits forever
         """
         if not returnAsFeatureClass is None:
             print "ReturnAsFeatureClass has been replaced with outputFormat"
-        
+
         if self.extractEnabled or self.syncEnabled:
             url = self._url + "/createReplica"
             params = {
@@ -596,85 +612,340 @@ class FeatureService(BaseAGOLClass):
                 "layers": layers,
                 "returnAttachmentDatabyURL" : returnAttachmentDatabyURL,
                 "returnAttachments" : returnAttachments,
-                "async" : False,
+                "async" : async,
                 "dataFormat": outputFormat
-                
+
             }
             if not self._token is None:
                 params["token"] = self._token
+            if not layerQueries is None:
+                if isinstance(layerQueries, dict):
+                    layerQueries = json.dumps(layerQueries)
+                params['layerQueries'] = layerQueries
             if not geometryFilter is None and \
                isinstance(geometryFilter, GeometryFilter):
                 gf = geometryFilter.filter
                 params['geometryType'] = gf['geometryType']
                 params['geometry'] = gf['geometry']
                 params['inSR'] = gf['inSR']
-            if outputFormat == 'filegdb':
-            
-              
+            outputFormat = outputFormat.lower()
+            if outputFormat == 'filegdb' or self.syncEnabled == False:
                 params['syncModel'] = 'none'
-                res = self._do_post(url=url, param_dict=params,
-                                    proxy_url=self._proxy_url,
-                                    proxy_port=self._proxy_port)
-                if res.has_key("responseUrl"):
-                    zipURL = res["responseUrl"]
-                    if not out_path is None:
-                        if os.path.isdir(out_path) == False:
-                            os.makedirs(out_path)                        
-                        dl_file = self._download_file(url=zipURL,
-                                            save_path=out_path,
-                                            file_name=os.path.basename(zipURL)
-                                            )
-                        
-                        existing_files = self._list_files(path=out_path + os.sep + "*.gdb")
-                        self._unzip_file(zip_file=dl_file, out_folder=out_path)
-                        os.remove(dl_file)              
-                        return list(set(self._list_files(path=out_path + os.sep + "*.gdb")) - set(existing_files)) 
-                    else:
-                        return zipURL
-                else:
-                    return res
-            elif self.syncEnabled == False:
-                params['syncModel'] = 'none'
-                
-                res = self._do_post(url=url, param_dict=params, proxy_url=self._proxy_url, proxy_port=self._proxy_port)
-                if res.has_key("URL") or res.has_key("responseUrl"):
-                    if res.has_key("URL"):                    
-                        URL = res["URL"]
-                    else:
-                        URL = res["responseUrl"]
-                    if not out_path is None:
-                        if os.path.isdir(out_path) == False:
-                            os.makedirs(out_path)                                                
-                        dl_file = self._download_file(url=URL,
-                                            save_path=out_path,
-                                            file_name=os.path.basename(URL)
-                                            )
-    
-                        return dl_file 
-                    else:
-                        return URL  
-                else:
-                    return res            
+            res = self._submit_replica(url=url, params=params, async=async,
+                                       poll_strategy=poll_strategy,
+                                       timeout=timeout)
+            if not isinstance(res, dict) or \
+               not (res.has_key("URL") or res.has_key("responseUrl")):
+                return res
+            if res.has_key("URL"):
+                URL = res["URL"]
             else:
-              
-                res = self._do_post(url=url, param_dict=params, proxy_url=self._proxy_url, proxy_port=self._proxy_port)
-                if res.has_key("URL") or res.has_key("responseUrl"):
-                    if res.has_key("URL"):                    
-                        URL = res["URL"]
-                    else:
-                        URL = res["responseUrl"]
-                    if not out_path is None:
-                        if os.path.isdir(out_path) == False:
-                            os.makedirs(out_path)                                                                        
-                        dl_file = self._download_file(url=URL,
-                                            save_path=out_path,
-                                            file_name=os.path.basename(URL)
-                                            )
-                            
-                        return dl_file 
-                    else:                  
-                        return URL                  
-                else:
-                    return res            
+                URL = res["responseUrl"]
+            if out_path is None:
+                return URL
+            if os.path.isdir(out_path) == False:
+                os.makedirs(out_path)
+            download_params = None
+            if not self._token is None:
+                download_params = {"token" : self._token}
+            if outputFormat in ('filegdb', 'sqlite') and \
+               urlparse.urlparse(URL).path.lower().endswith(".zip"):
+                extracted = self._download_unzip(url=URL,
+                                                 out_folder=out_path,
+                                                 proxy_url=self._proxy_url,
+                                                 proxy_port=self._proxy_port,
+                                                 param_dict=download_params)
+                if extracted == False or outputFormat != 'filegdb':
+                    return extracted
+                # the geodatabase folders the archive contained
+                root = os.path.abspath(out_path)
+                gdbs = set()
+                for path in extracted:
+                    top = os.path.relpath(path, root).split(os.sep)[0]
+                    if top.lower().endswith(".gdb"):
+                        gdbs.add(os.path.join(out_path, top))
+                return sorted(gdbs)
+            return self._download_file(url=URL,
+                                       save_path=out_path,
+                                       file_name=os.path.basename(urlparse.urlparse(URL).path),
+                                       proxy_url=self._proxy_url,
+                                       proxy_port=self._proxy_port,
+                                       param_dict=download_params)
 
-        return "Not Supported"
\ No newline at end of file
+        return "Not Supported"
+    #----------------------------------------------------------------------
+    def _submit_replica(self, url, params, async, poll_strategy, timeout):
+        """
+           posts a createReplica request.  Async requests return a status
+           url right away, it is polled until the job ends and the status
+           is returned with the replica url as responseUrl.
+        """
+        res = self._do_post(url=url, param_dict=params,
+                            proxy_url=self._proxy_url,
+                            proxy_port=self._proxy_port)
+        if not async or not isinstance(res, dict) or \
+           not res.has_key("statusUrl"):
+            return res
+        status_params = {"f" : "json"}
+        if not self._token is None:
+            status_params["token"] = self._token
+        def check():
+            return self._do_get(url=res["statusUrl"],
+                                param_dict=status_params,
+                                proxy_url=self._proxy_url,
+                                proxy_port=self._proxy_port)
+        def done(status):
+            return not isinstance(status, dict) or \
+                   status.has_key("error") or \
+                   str(status.get("status", "")).lower() in _REPLICA_JOB_ENDED
+        status = poll(check, done, strategy=poll_strategy, timeout=timeout)
+        if isinstance(status, dict) and status.has_key("resultUrl") and \
+           str(status.get("status", "")).lower() != "failed":
+            status["responseUrl"] = status["resultUrl"]
+        return status
+    #----------------------------------------------------------------------
+    def create_replicas(self,
+                        replicaName,
+                        layers,
+                        layerQueries=None,
+                        geometryFilter=None,
+                        returnAttachments=False,
+                        returnAttachmentDatabyURL=True,
+                        outputFormat='FILEGDB',
+                        out_path=None,
+                        async=True,
+                        poll_strategy=None,
+                        timeout=None,
+                        max_workers=4):
+        """
+           creates one replica per layer, several at the same time
+           Inputs:
+              replicaName - prefix of the replica names, each replica is
+                            named <replicaName>_<layer id>
+              layers - layer ids as a list or a comma seperated string
+              out_path - each replica is saved in out_path/<layer id>.  If
+                         not provided, the urls to the replicas are returned.
+              max_workers - number of replicas requested at the same time
+              For the other inputs, see createReplica.
+           Output:
+              dictionary of layer id to the createReplica result
+        """
+        if isinstance(layers, basestring):
+            ids = [l.strip() for l in layers.split(",") if l.strip() != ""]
+        else:
+            ids = [str(l) for l in layers]
+        if isinstance(layerQueries, basestring):
+            layerQueries = json.loads(layerQueries)
+        if not layerQueries is None:
+            # layer ids are compared as strings, ie: {0 : {...}}
+            layerQueries = dict((str(k), v) for k, v in layerQueries.iteritems())
+        def create(layer_id):
+            queries = None
+            if not layerQueries is None and layerQueries.has_key(layer_id):
+                queries = {layer_id : layerQueries[layer_id]}
+            path = None
+            if not out_path is None:
+                path = os.path.join(out_path, layer_id)
+            return layer_id, self.createReplica(
+                replicaName="%s_%s" % (replicaName, layer_id),
+                layers=layer_id,
+                layerQueries=queries,
+                geometryFilter=geometryFilter,
+                returnAttachments=returnAttachments,
+                returnAttachmentDatabyURL=returnAttachmentDatabyURL,
+                outputFormat=outputFormat,
+                out_path=path,
+                async=async,
+                poll_strategy=poll_strategy,
+                timeout=timeout)
+        if len(ids) == 0:
+            return {}
+        with WorkerPool(max_workers=min(max_workers, len(ids))) as pool:
+            return dict(pool.imap(create, ids))
+    #----------------------------------------------------------------------
+    def synchronizeReplica(self,
+                           replicaID,
+                           replicaServerGen=None,
+                           syncLayers="perReplica",
+                           syncDirection="download",
+                           edits=None,
+                           returnIdsForAdds=False,
+                           returnAttachmentDatabyURL=True,
+                           transportType="esriTransportTypeEmbedded",
+                           dataFormat="json",
+                           async=False,
+                           poll_strategy=None,
+                           timeout=None):
+        """
+           synchronizes a replica with the feature service
+           Inputs:
+              replicaID - The replicaID returned by the feature service
+                          when the replica was created.
+              replicaServerGen - server generation the replica was last
+                                 synchronized to, for perReplica replicas
+              syncLayers - "perReplica" or a list of {"id", "serverGen",
+                           "syncDirection"} for replicas synchronized per
+                           layer
+              syncDirection - download, upload or bidirectional
+              edits - list of the edits uploaded to the service
+              returnIdsForAdds - if true, the object ids of the uploaded
+                                 adds are returned
+              returnAttachmentDatabyURL - if true, attachments are returned
+                                          as urls
+              transportType - esriTransportTypeEmbedded or
+                              esriTransportTypeUrl
+              dataFormat - json or sqlite
+              async - if true, the synchronization runs as a server job
+                      whose status is polled with exponential backoff
+              poll_strategy - arcrest.web.polling.Backoff used to poll an
+                              async synchronization
+              timeout - seconds to wait for an async synchronization,
+                        None waits forever
+           Output:
+              dictionary response.  JSON changes published at a url are
+              downloaded and returned in the response as for the embedded
+              transport.
+        """
+        url = self._url + "/synchronizeReplica"
+        params = {
+            "f" : "json",
+            "replicaID" : replicaID,
+            "transportType" : transportType,
+            "returnIdsForAdds" : returnIdsForAdds,
+            "returnAttachmentDatabyURL" : returnAttachmentDatabyURL,
+            "syncDirection" : syncDirection,
+            "async" : async,
+            "dataFormat" : dataFormat
+        }
+        if not self._token is None:
+            params["token"] = self._token
+        if not replicaServerGen is None:
+            params["replicaServerGen"] = replicaServerGen
+        if isinstance(syncLayers, list):
+            syncLayers = json.dumps(syncLayers)
+        params["syncLayers"] = syncLayers
+        if not edits is None:
+            if isinstance(edits, list):
+                edits = json.dumps(edits)
+            params["edits"] = edits
+        res = self._submit_replica(url=url, params=params, async=async,
+                                   poll_strategy=poll_strategy,
+                                   timeout=timeout)
+        if not isinstance(res, dict) or res.has_key("edits") or \
+           not res.has_key("responseUrl") or dataFormat != "json":
+            return res
+        param_dict = {}
+        if not self._token is None:
+            param_dict["token"] = self._token
+        changes = self._do_get(url=res["responseUrl"], param_dict=param_dict,
+                               proxy_url=self._proxy_url,
+                               proxy_port=self._proxy_port)
+        if isinstance(changes, dict) and not changes.has_key("error"):
+            for k, v in res.iteritems():
+                if not changes.has_key(k):
+                    changes[k] = v
+        return changes
+    #----------------------------------------------------------------------
+    def sync_replica(self, replicaID, store_path, async=False,
+                     poll_strategy=None, timeout=None):
+        """
+           keeps a local SQLite copy of a replica current.  The first call
+           reads the replica's layers in full and saves the replica server
+           generation, every later call downloads only the changes made
+           since the saved generation with synchronizeReplica and applies
+           them to the copy.
+           The first copy applies the replica's geometry and layer
+           queries, as read from replicaInfo.
+           Inputs:
+              replicaID - The replicaID returned by the feature service
+                          when the replica was created.
+              store_path - SQLite file holding the copy, see
+                           arcrest.common.replicastore.ReplicaStore
+              async - if true, synchronizeReplica runs as a server job
+              poll_strategy - arcrest.web.polling.Backoff used to poll an
+                              async synchronization
+              timeout - seconds to wait for an async synchronization
+           Output:
+              dictionary with the number of adds, updates and deletes
+              applied, the new serverGen and full, true for the first
+              copy.  The service's response is returned on errors.
+        """
+        with ReplicaStore(store_path, url=self._url,
+                          replica_id=replicaID) as store:
+            if store.lastSync is None:
+                return self._copy_replica(replicaID, store)
+            layer_gens = [l for l in store.layerServerGens
+                          if not l['serverGen'] is None]
+            syncLayers = "perReplica"
+            if len(layer_gens) > 0:
+                syncLayers = [{"id" : l['id'],
+                               "serverGen" : l['serverGen'],
+                               "syncDirection" : "download"}
+                              for l in layer_gens]
+            res = self.synchronizeReplica(replicaID=replicaID,
+                                          replicaServerGen=store.serverGen,
+                                          syncLayers=syncLayers,
+                                          async=async,
+                                          poll_strategy=poll_strategy,
+                                          timeout=timeout)
+            if not isinstance(res, dict) or res.has_key("error"):
+                return res
+            counts = store.apply(edits=res.get('edits'),
+                                 serverGen=res.get('replicaServerGen'),
+                                 layerServerGens=res.get('layerServerGens'))
+            counts['serverGen'] = store.serverGen
+            counts['full'] = False
+            return counts
+    #----------------------------------------------------------------------
+    def _copy_replica(self, replicaID, store):
+        """ fills an empty ReplicaStore with the features of a replica """
+        info = self.replicaInfo(replicaID)
+        if not isinstance(info, dict) or info.has_key("error"):
+            return info
+        # the generation is read first, changes made during the copy are
+        # downloaded again by the next synchronization
+        serverGen = info.get('replicaServerGen')
+        layer_gens = info.get('layerServerGens')
+        if info.get('syncModel') != 'perLayer':
+            layer_gens = None
+        ids = info.get('layers') or [l['id'] for l in layer_gens or []]
+        # the copy holds the same features as the replica, later syncs
+        # only send the changes inside its filter
+        geometryFilter = None
+        if isinstance(info.get('geometry'), dict):
+            geometryFilter = JSONGeometryFilter(
+                info['geometry'],
+                geometryType=info.get('geometryType'),
+                spatialFilter=info.get('spatialRel') or "esriSpatialRelIntersects")
+        layerQueries = info.get('layerQueries') or {}
+        if isinstance(layerQueries, basestring):
+            layerQueries = json.loads(layerQueries)
+        layerQueries = dict((str(k), v) for k, v in layerQueries.iteritems())
+        loaded = 0
+        for layer_id in ids:
+            layer = servicelayers.FeatureLayer(url=self._url + "/%s" % layer_id,
+                                               username=self._username,
+                                               password=self._password,
+                                               token_url=self._token_url,
+                                               proxy_url=self._proxy_url,
+                                               proxy_port=self._proxy_port)
+            store.set_key_field(layer_id,
+                                layer.globalIdField or layer.objectIdField)
+            query = layerQueries.get(str(layer_id)) or {}
+            option = str(query.get('queryOption', 'useFilter')).lower()
+            if option == "none":
+                # the replica holds the layer's schema only
+                continue
+            where = "1=1"
+            layerFilter = None
+            if option != "all":
+                where = query.get('where') or "1=1"
+                if query.get('useGeometry', True):
+                    layerFilter = geometryFilter
+            loaded += store.load(layer_id, layer.iter_query(where=where,
+                                                            out_fields="*",
+                                                            geometryFilter=layerFilter,
+                                                            returnGeometry=True))
+        store.apply(serverGen=serverGen, layerServerGens=layer_gens)
+        return {"adds" : loaded, "updates" : 0, "deletes" : 0,
+                "serverGen" : store.serverGen, "full" : True}
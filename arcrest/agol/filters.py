@@ -144,6 +144,56 @@ class GeometryFilter(BaseFilter):
     #----------------------------------------------------------------------
 
 ########################################################################
+class JSONGeometryFilter(GeometryFilter):
+    """ creates a geometry filter from an Esri JSON geometry, ie: the
+        geometry a replica was created with
+        Inputs:
+           geometry - Esri JSON geometry dictionary
+           geometryType - the geometry type, guessed from the geometry
+                          if not provided
+           spatialFilter - see GeometryFilter
+       Raises:
+          AttributeError for invalid inputs
+    """
+    #----------------------------------------------------------------------
+    def __init__(self, geometry, geometryType=None,
+                 spatialFilter="esriSpatialRelIntersects"):
+        """Constructor"""
+        if geometryType is None and isinstance(geometry, dict):
+            for key, value in (("rings", "esriGeometryPolygon"),
+                               ("paths", "esriGeometryPolyline"),
+                               ("points", "esriGeometryMultipoint"),
+                               ("xmin", "esriGeometryEnvelope"),
+                               ("x", "esriGeometryPoint")):
+                if geometry.has_key(key):
+                    geometryType = value
+                    break
+        if not isinstance(geometry, dict) or geometryType is None or \
+           spatialFilter not in self._allowedFilters:
+            raise AttributeError("geometry must be an Esri JSON geometry and "+ \
+                                 "spatialFilter must be of value: " + \
+                                 "%s" % ", ".join(self._allowedFilters))
+        self._geomObject = geometry
+        self._geomType = geometryType
+        self._spatialAction = spatialFilter
+        self._spatialReference = geometry.get('spatialReference')
+    #----------------------------------------------------------------------
+    @property
+    def geometryType(self):
+        """ returns the geometry type """
+        return self._geomType
+    #----------------------------------------------------------------------
+    @property
+    def filter(self):
+        """ returns the key/value pair of a geometry filter """
+        inSR = self._spatialReference
+        if isinstance(inSR, dict):
+            inSR = inSR.get('wkid') or json.dumps(inSR)
+        return {"geometryType":self._geomType,
+                "geometry": json.dumps(self._geomObject),
+                "spatialRel": self.spatialRelation,
+                "inSR" : inSR}
+########################################################################
 class TimeFilter(BaseFilter):
     """ Implements the time filter """
     _startTime = None
@@ -14,12 +14,22 @@ import common
 import filters
 import featureservice
 from base import BaseAGOLClass
+from ..web.paging import OIDPager
+from ..common.columnar import to_columns
+from ..common.features import compact_features
+from ..common.syncindex import SyncIndex, feature_hash, key_value, \
+     attribute_hash, ATTRIBUTES_PREFIX
+from ..common import codec
+from ..common import pbf
+from ..web.workerpool import WorkerPool, host_slot, DEFAULT_MAX_WORKERS
+from ..web.editbatch import EditBatcher, iter_edits, DEFAULT_MAX_BYTES
 import os
 import json
 import math
 import urlparse
 import mimetypes
 import uuid
+import itertools
 ########################################################################
 class FeatureLayer(BaseAGOLClass):
     """
@@ -500,7 +510,7 @@ class FeatureLayer(BaseAGOLClass):
                                        ssl=parsed.scheme.lower() == 'https',
                                        proxy_url=self._proxy_url,
                                        proxy_port=self._proxy_port)
-            return self._unicode_convert(json.loads(res))
+            return codec.loads(res)
         else:
             return "Attachments are not supported for this feature service."
     #----------------------------------------------------------------------
@@ -550,7 +560,7 @@ class FeatureLayer(BaseAGOLClass):
                                    ssl=parsed.scheme.lower() == 'https',
                                    proxy_port=self._proxy_port,
                                    proxy_url=self._proxy_url)
-        return self._unicode_convert(json.loads(res))
+        return codec.loads(res)
     #----------------------------------------------------------------------
     def listAttachments(self, oid):
         """ list attachements for a given OBJECT ID """
@@ -563,6 +573,142 @@ class FeatureLayer(BaseAGOLClass):
         return self._do_get(url, params, proxy_port=self._proxy_port,
                             proxy_url=self._proxy_url)
     #----------------------------------------------------------------------
+    def bulk_add_attachments(self, mapping, max_workers=DEFAULT_MAX_WORKERS,
+                             progress_path=None):
+        """ uploads many attachments in parallel.  Files are streamed
+            from disk, and with a progress file an interrupted run can be
+            started again without uploading the same files twice.
+            Inputs:
+               mapping - dictionary of object id to a file path or a list
+                         of file paths, or an iterable of (object id, file
+                         path) tuples
+               max_workers - number of uploads running at the same time,
+                             requests to one host are also limited by
+                             arcrest.web.workerpool.set_host_limit
+               progress_path - optional file where every completed upload
+                               is recorded.  Uploads already recorded are
+                               skipped.
+            Output:
+               dictionary with the number of files uploaded and skipped
+               and the failures as (object id, file path, response) tuples
+        """
+        if self.hasAttachments != True:
+            return "Attachments are not supported for this feature service."
+        if isinstance(mapping, dict):
+            pairs = ((oid, path) for oid, paths in mapping.iteritems()
+                     for path in ([paths] if isinstance(paths, basestring) else paths))
+        else:
+            pairs = iter(mapping)
+        done = _read_progress(progress_path)
+        summary = {"uploaded" : 0, "skipped" : 0, "failed" : []}
+        def pending():
+            for oid, path in pairs:
+                if (str(oid), path) in done:
+                    summary['skipped'] += 1
+                    continue
+                yield oid, path
+        def upload(item):
+            oid, path = item
+            try:
+                with host_slot(self._url):
+                    return oid, path, self.addAttachment(oid, path)
+            except Exception, e:
+                return oid, path, {"error" : {"message" : str(e)}}
+        progress = None
+        if progress_path is not None:
+            progress = open(progress_path, "ab")
+        pool = WorkerPool(max_workers=max_workers)
+        try:
+            for oid, path, res in pool.imap(upload, pending()):
+                result = res.get('addAttachmentResult', {}) if isinstance(res, dict) else {}
+                if result.get('success', False):
+                    summary['uploaded'] += 1
+                    if progress is not None:
+                        progress.write(codec.dumps({"oid" : oid,
+                                                    "path" : path,
+                                                    "attachmentId" : result.get('objectId')}) + "\n")
+                        progress.flush()
+                else:
+                    summary['failed'].append((oid, path, res))
+        finally:
+            pool.shutdown()
+            if progress is not None:
+                progress.close()
+        return summary
+    #----------------------------------------------------------------------
+    def download_attachments(self, oids, out_dir,
+                             max_workers=DEFAULT_MAX_WORKERS):
+        """ downloads the attachments of many features in parallel.  Each
+            file is saved as <out_dir>/<object id>/<attachment id>_<name>,
+            streamed through a .part file.  Files already downloaded with
+            the expected size are skipped, so an interrupted run resumes
+            where it stopped.
+            Inputs:
+               oids - iterable of object ids
+               out_dir - folder receiving the files
+               max_workers - number of features processed at the same time
+            Output:
+               dictionary with the number of files downloaded and skipped
+               and the failures as (object id, attachment id, message)
+               tuples
+        """
+        params = {}
+        if self._token is not None:
+            params['token'] = self._token
+        def download(oid):
+            results = []
+            try:
+                with host_slot(self._url):
+                    infos = self.listAttachments(oid)
+            except Exception, e:
+                return [(oid, None, "failed", str(e))]
+            if 'error' in infos:
+                return [(oid, None, "failed", infos['error'])]
+            folder = os.path.join(out_dir, str(oid))
+            for info in infos.get('attachmentInfos', []):
+                file_name = "%s_%s" % (info['id'], os.path.basename(info['name']))
+                path = os.path.join(folder, file_name)
+                if os.path.isfile(path) and \
+                   ('size' not in info or os.path.getsize(path) == info['size']):
+                    results.append((oid, info['id'], "skipped", None))
+                    continue
+                if not os.path.isdir(folder):
+                    try:
+                        os.makedirs(folder)
+                    except OSError:
+                        pass
+                url = self._url + "/%s/attachments/%s" % (oid, info['id'])
+                try:
+                    with host_slot(self._url):
+                        saved = self._download_file(url=url,
+                                                    save_path=folder,
+                                                    file_name=file_name,
+                                                    proxy_url=self._proxy_url,
+                                                    proxy_port=self._proxy_port,
+                                                    param_dict=params)
+                except Exception, e:
+                    saved = False
+                    message = str(e)
+                else:
+                    message = "download failed"
+                if saved == False:
+                    results.append((oid, info['id'], "failed", message))
+                else:
+                    results.append((oid, info['id'], "downloaded", None))
+            return results
+        summary = {"downloaded" : 0, "skipped" : 0, "failed" : []}
+        pool = WorkerPool(max_workers=max_workers)
+        try:
+            for results in pool.imap(download, oids):
+                for oid, attachment_id, status, message in results:
+                    if status == "failed":
+                        summary['failed'].append((oid, attachment_id, message))
+                    else:
+                        summary[status] += 1
+        finally:
+            pool.shutdown()
+        return summary
+    #----------------------------------------------------------------------
     def create_fc_template(self, out_path, out_name):
         """creates a featureclass template on local disk"""
         fields = self.fields
@@ -600,7 +746,9 @@ class FeatureLayer(BaseAGOLClass):
               returnIDsOnly=False,
               returnCountOnly=False,
               returnFeatureClass=False,
-              out_fc=None):
+              out_fc=None,
+              compact=False,
+              format="json"):
         """ queries a feature service based on a sql statement
             Inputs:
                where - the selection sql statement
@@ -623,37 +771,28 @@ class FeatureLayer(BaseAGOLClass):
                                     returned as feature class
                out_fc - only valid if returnFeatureClass is set to True.
                         Output location of query.
+               compact - if True, CompactFeature objects sharing one field
+                         schema are returned instead of Feature objects.
+                         They use a fraction of the memory.
+               format - "json" (default) or "pbf".  pbf requests the
+                        protocol buffer response, which is smaller and
+                        faster to decode, the results are the same.  The
+                        layer must list PBF in supportedQueryFormats.
             Output:
                A list of Feature Objects (default) or a path to the output featureclass if
                returnFeatureClass is set to True.
          """
-        params = {"f": "json",
-                  "where": where,
-                  "outFields": out_fields,
-                  "returnGeometry" : returnGeometry,
-                  "returnIdsOnly" : returnIDsOnly,
-                  "returnCountOnly" : returnCountOnly,
-                  }
-        if not self._token is None:
-            params["token"] = self._token
-        if not timeFilter is None and \
-           isinstance(timeFilter, filters.TimeFilter):
-            params['time'] = timeFilter.filter
-        if not geometryFilter is None and \
-           isinstance(geometryFilter, filters.GeometryFilter):
-            gf = geometryFilter.filter
-            params['geometry'] = gf['geometry']
-            params['geometryType'] = gf['geometryType']
-            params['spatialRelationship'] = gf['spatialRel']
-            params['inSR'] = gf['inSR']
-        fURL = self._url + "/query"
-        results = self._do_get(fURL, params, proxy_port=self._proxy_port,
-                               proxy_url=self._proxy_url)
-        if 'error' in results:
-            raise ValueError (results)
+        params = self._query_params(where=where,
+                                    out_fields=out_fields,
+                                    timeFilter=timeFilter,
+                                    geometryFilter=geometryFilter,
+                                    returnGeometry=returnGeometry)
+        params["returnIdsOnly"] = returnIDsOnly
+        params["returnCountOnly"] = returnCountOnly
+        results = self._query(params, format=format)
         if not returnCountOnly and not returnIDsOnly:
             if returnFeatureClass:
-                json_text = json.dumps(results)
+                json_text = codec.dumps(results)
                 temp = common.scratchFolder() + os.sep + uuid.uuid4().get_hex() + ".json"
                 with open(temp, 'wb') as writer:
                     writer.write(json_text)
@@ -663,6 +802,10 @@ class FeatureLayer(BaseAGOLClass):
                                                    out_fc=out_fc)
                 os.remove(temp)
                 return fc
+            elif compact:
+                return compact_features(results['features'],
+                                        geometryType=results.get('geometryType'),
+                                        spatialReference=results.get('spatialReference'))
             else:
                 feats = []
                 for res in results['features']:
@@ -793,6 +936,254 @@ class FeatureLayer(BaseAGOLClass):
             yield l[i*newn:i*newn+newn]
         yield l[n*newn-newn:]
     #----------------------------------------------------------------------
+    def _query_params(self,
+                      where="1=1",
+                      out_fields="*",
+                      timeFilter=None,
+                      geometryFilter=None,
+                      returnGeometry=True):
+        """ returns the parameters shared by all the query calls """
+        params = {"f": "json",
+                  "where": where,
+                  "outFields": out_fields,
+                  "returnGeometry" : returnGeometry
+                  }
+        if not self._token is None:
+            params["token"] = self._token
+        if not timeFilter is None and \
+           isinstance(timeFilter, filters.TimeFilter):
+            params['time'] = timeFilter.filter
+        if not geometryFilter is None and \
+           isinstance(geometryFilter, filters.GeometryFilter):
+            gf = geometryFilter.filter
+            params['geometry'] = gf['geometry']
+            params['geometryType'] = gf['geometryType']
+            params['spatialRelationship'] = gf['spatialRel']
+            params['inSR'] = gf['inSR']
+        return params
+    #----------------------------------------------------------------------
+    def _query(self, params, format="json"):
+        """ performs a query request and raises ValueError on an error
+            Inputs:
+               params - query parameters
+               format - "json" or "pbf", pbf responses are decoded to the
+                        same dictionary as the JSON response
+        """
+        fURL = self._url + "/query"
+        if format == "pbf":
+            params = dict(params)
+            params["f"] = "pbf"
+            data = self._do_get_bytes(fURL, params, proxy_port=self._proxy_port,
+                                      proxy_url=self._proxy_url)
+            if pbf.is_pbf(data):
+                return pbf.decode(data)
+            # errors are always returned as JSON
+            results = codec.loads(data)
+        elif format == "json":
+            results = self._do_get(fURL, params, proxy_port=self._proxy_port,
+                                   proxy_url=self._proxy_url)
+        else:
+            raise ValueError("format must be json or pbf")
+        if 'error' in results:
+            raise ValueError (results)
+        return results
+    #----------------------------------------------------------------------
+    def query_pages(self,
+                    where="1=1",
+                    out_fields="*",
+                    timeFilter=None,
+                    geometryFilter=None,
+                    returnGeometry=True,
+                    page_size=None,
+                    max_workers=DEFAULT_MAX_WORKERS,
+                    format="json"):
+        """ reads every record matching a sql statement.  The object ids
+            are split into ranges of page_size records that are queried in
+            parallel, and the pages are returned in object id order.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               timeFilter - a TimeFilter object to limit the records
+               geometryFilter - a GeometryFilter object to limit the
+                                records
+               returnGeometry - true means a geometry will be returned,
+                                else just the attributes
+               page_size - records in each page, defaults to the layer's
+                           maxRecordCount
+               max_workers - number of pages queried at the same time,
+                             requests to one host are also limited by
+                             arcrest.web.workerpool.set_host_limit
+               format - "json" or "pbf", the format the pages are
+                        requested in
+            Output:
+               generator of query results (dictionaries) one per page
+        """
+        params = self._query_params(where=where,
+                                    timeFilter=timeFilter,
+                                    geometryFilter=geometryFilter,
+                                    returnGeometry=False)
+        params["returnIdsOnly"] = True
+        res = self._query(params)
+        if page_size is None:
+            page_size = self.maxRecordCount
+        def fetch(sql):
+            return self._query(self._query_params(where=sql,
+                                                  out_fields=out_fields,
+                                                  timeFilter=timeFilter,
+                                                  geometryFilter=geometryFilter,
+                                                  returnGeometry=returnGeometry),
+                               format=format)
+        return iter(OIDPager(url=self._url,
+                             fetch=fetch,
+                             oid_field=res['objectIdFieldName'],
+                             oids=res['objectIds'],
+                             where=where,
+                             page_size=page_size,
+                             max_workers=max_workers))
+    #----------------------------------------------------------------------
+    def _supportsPagination(self):
+        """ returns True if the layer accepts resultOffset queries """
+        capabilities = self.advancedQueryCapabilities
+        if isinstance(capabilities, dict):
+            return capabilities.get("supportsPagination", False) == True
+        return False
+    #----------------------------------------------------------------------
+    def _offset_pages(self, params, page_size, format="json"):
+        """ yields query results paged with resultOffset """
+        params = dict(params)
+        params["orderByFields"] = self.objectIdField
+        params["resultRecordCount"] = page_size
+        offset = 0
+        while True:
+            params["resultOffset"] = offset
+            with host_slot(self._url):
+                results = self._query(params, format=format)
+            count = len(results.get('features', []))
+            yield results
+            if count == 0 or \
+               (count < page_size and \
+                not results.get('exceededTransferLimit', False)):
+                break
+            offset += count
+    #----------------------------------------------------------------------
+    def iter_query(self,
+                   where="1=1",
+                   out_fields="*",
+                   timeFilter=None,
+                   geometryFilter=None,
+                   returnGeometry=True,
+                   page_size=None,
+                   max_workers=1,
+                   compact=False,
+                   format="json"):
+        """ queries a feature service one page at a time.  Only a single
+            page (or max_workers pages when paging by object id) is held
+            in memory, so any number of records can be read.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               timeFilter - a TimeFilter object to limit the records
+               geometryFilter - a GeometryFilter object to limit the
+                                records
+               returnGeometry - true means a geometry will be returned,
+                                else just the attributes
+               page_size - records in each page, defaults to the layer's
+                           maxRecordCount
+               max_workers - number of pages queried at the same time
+                             when the layer does not support pagination
+                             and object id ranges are used
+               compact - if True, CompactFeature objects sharing one field
+                         schema are returned instead of Feature objects
+               format - "json" or "pbf", the format the pages are
+                        requested in
+            Output:
+               generator of Feature objects
+        """
+        if page_size is None:
+            page_size = self.maxRecordCount
+        if self._supportsPagination():
+            params = self._query_params(where=where,
+                                        out_fields=out_fields,
+                                        timeFilter=timeFilter,
+                                        geometryFilter=geometryFilter,
+                                        returnGeometry=returnGeometry)
+            pages = self._offset_pages(params, page_size, format=format)
+        else:
+            pages = self.query_pages(where=where,
+                                     out_fields=out_fields,
+                                     timeFilter=timeFilter,
+                                     geometryFilter=geometryFilter,
+                                     returnGeometry=returnGeometry,
+                                     page_size=page_size,
+                                     max_workers=max_workers,
+                                     format=format)
+        schema = None
+        for page in pages:
+            features = page.get('features', [])
+            if compact:
+                features = compact_features(features, schema=schema,
+                                            geometryType=page.get('geometryType'),
+                                            spatialReference=page.get('spatialReference'))
+                if len(features) > 0:
+                    schema = features[0].schema
+            del page
+            # pop from the end so converted records can be freed early
+            features.reverse()
+            while len(features) > 0:
+                if compact:
+                    yield features.pop()
+                else:
+                    yield common.Feature(features.pop())
+    #----------------------------------------------------------------------
+    def query_columns(self,
+                      where="1=1",
+                      out_fields="*",
+                      timeFilter=None,
+                      geometryFilter=None,
+                      returnGeometry=True,
+                      page_size=None,
+                      max_workers=DEFAULT_MAX_WORKERS,
+                      use_numpy=True,
+                      format="json"):
+        """ queries a feature service and returns the records as columns
+            instead of Feature objects.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               timeFilter - a TimeFilter object to limit the records
+               geometryFilter - a GeometryFilter object to limit the
+                                records
+               returnGeometry - true means a geometry will be returned,
+                                else just the attributes
+               page_size - records in each page, defaults to the layer's
+                           maxRecordCount
+               max_workers - number of pages queried at the same time
+               use_numpy - if True and NumPy is installed, the columns are
+                           NumPy arrays typed from the layer's fields
+                           (dates as datetime64[ms]), else lists
+               format - "json" or "pbf", pbf pages are smaller and their
+                        coordinates are decoded with NumPy when installed
+            Output:
+               dictionary of field name to column.  Point geometries are
+               returned as x and y float64 columns.
+        """
+        pages = self.query_pages(where=where,
+                                 out_fields=out_fields,
+                                 timeFilter=timeFilter,
+                                 geometryFilter=geometryFilter,
+                                 returnGeometry=returnGeometry,
+                                 page_size=page_size,
+                                 max_workers=max_workers,
+                                 format=format)
+        geometryType = None
+        if returnGeometry:
+            geometryType = self.geometryType
+        return to_columns(pages=pages,
+                          fields=self.fields,
+                          out_fields=out_fields,
+                          geometryType=geometryType,
+                          use_numpy=use_numpy)
+    #----------------------------------------------------------------------
     def get_local_copy(self, out_path, includeAttachments=False):
         """ exports the whole feature service to a feature class
             Input:
@@ -817,29 +1208,19 @@ class FeatureLayer(BaseAGOLClass):
                                                   out_path=out_path)[0]
         else:
             result_features = []
-            res = self.query(returnIDsOnly=True)
-            OIDS = res['objectIds']
-            OIDS.sort()
-            OIDField = res['objectIdFieldName']
-            count = len(OIDS)
-            if count <= self.maxRecordCount:
-                bins = 1
-            else:
-                bins = count / self.maxRecordCount
-                v = count % self.maxRecordCount
-                if v > 0:
-                    bins += 1
-            chunks = self._chunks(OIDS, bins)
-            for chunk in chunks:
-                chunk.sort()
-                sql = "%s >= %s and %s <= %s" % (OIDField, chunk[0],
-                                                 OIDField, chunk[len(chunk) -1])
+            for page in self.query_pages():
+                temp = common.scratchFolder() + os.sep + uuid.uuid4().get_hex() + ".json"
+                with open(temp, 'wb') as writer:
+                    writer.write(codec.dumps(page))
+                    writer.flush()
+                del writer
                 temp_base = "a" + uuid.uuid4().get_hex()[:6] + "a"
                 temp_fc = r"%s\%s" % (common.scratchGDB(), temp_base)
-                temp_fc = self.query(where=sql,
-                                     returnFeatureClass=True,
-                                     out_fc=temp_fc)
+                temp_fc = common.json_to_featureclass(json_file=temp,
+                                                      out_fc=temp_fc)
+                os.remove(temp)
                 result_features.append(temp_fc)
+                del page
             return common.merge_feature_class(merges=result_features,
                                               out_fc=out_path)
     #----------------------------------------------------------------------
@@ -864,13 +1245,13 @@ class FeatureLayer(BaseAGOLClass):
         if self._token is not None:
             params['token'] = self._token
         if isinstance(features, common.Feature):
-            params['features'] = json.dumps([features.asDictionary])
+            params['features'] = codec.dumps([features.asDictionary])
         elif isinstance(features, list):
             vals = []
             for feature in features:
                 if isinstance(feature, common.Feature):
                     vals.append(feature.asDictionary)
-            params['features'] = json.dumps(vals)
+            params['features'] = codec.dumps(vals)
         else:
             return {'message' : "invalid inputs"}
         updateURL = self._url + "/updateFeatures"
@@ -967,18 +1348,215 @@ class FeatureLayer(BaseAGOLClass):
             params['token'] = self._token
         if len(addFeatures) > 0 and \
            isinstance(addFeatures[0], common.Feature):
-            params['adds'] = json.dumps([f.asDictionary for f in addFeatures],
-                                        default=common._date_handler)
+            params['adds'] = codec.dumps([f.asDictionary for f in addFeatures],
+                                         default=common._date_handler)
         if len(updateFeatures) > 0 and \
            isinstance(updateFeatures[0], common.Feature):
-            params['updates'] = json.dumps([f.asDictionary for f in updateFeatures],
-                                           default=common._date_handler)
+            params['updates'] = codec.dumps([f.asDictionary for f in updateFeatures],
+                                            default=common._date_handler)
         if deleteFeatures is not None and \
            isinstance(deleteFeatures, str):
             params['deletes'] = deleteFeatures
         return self._do_post(url=editURL, param_dict=params, proxy_port=self._proxy_port,
                              proxy_url=self._proxy_url)
     #----------------------------------------------------------------------
+    def apply_edits_batched(self,
+                            addFeatures=None,
+                            updateFeatures=None,
+                            deleteFeatures=None,
+                            edits=None,
+                            gdbVersion=None,
+                            rollbackOnFailure=True,
+                            max_bytes=DEFAULT_MAX_BYTES,
+                            max_workers=4,
+                            target_seconds=10.0):
+        """
+           applies any number of edits with a series of applyEdits
+           requests.  Batches are sized by payload bytes and by the time
+           the server takes to apply them, and are sent concurrently.  If
+           a batch fails, it is split until the failing records are
+           isolated, so every other record is applied.
+           Inputs:
+              addFeatures - iterable of features to add (common.Feature
+                            objects or feature dictionaries)
+              updateFeatures - iterable of features to update
+              deleteFeatures - iterable of object ids, or a comma
+                               delimited string of object ids, to delete
+              edits - iterable of ("adds"|"updates"|"deletes", value)
+                      tuples, sent after the other inputs
+              gdbVersion - Geodatabase version to apply the edits.
+              rollbackOnFailure - rollbackOnFailure parameter of every
+                                  request.  Either way the report lists
+                                  the result of each record.
+              max_bytes - largest payload of a request
+              max_workers - number of requests sent at the same time
+              target_seconds - time each request should take, the batch
+                               size grows or shrinks to match it
+           Output:
+              arcrest.web.editbatch.EditReport, its asDictionary property
+              is shaped like the applyEdits response
+        """
+        params = {"f": "json"}
+        if self._token is not None:
+            params['token'] = self._token
+        if gdbVersion is not None:
+            params['gdbVersion'] = gdbVersion
+        def post(param_dict):
+            return self._do_post(url=self._url + "/applyEdits",
+                                 param_dict=param_dict,
+                                 proxy_port=self._proxy_port,
+                                 proxy_url=self._proxy_url)
+        def encode(feature):
+            return codec.dumps(feature, default=common._date_handler)
+        batcher = EditBatcher(url=self._url,
+                              post=post,
+                              params=params,
+                              rollbackOnFailure=rollbackOnFailure,
+                              encode=encode,
+                              max_bytes=max_bytes,
+                              target_seconds=target_seconds,
+                              max_workers=max_workers)
+        changes = iter_edits(adds=addFeatures,
+                             updates=updateFeatures,
+                             deletes=deleteFeatures)
+        if edits is not None:
+            changes = itertools.chain(changes, edits)
+        return batcher.run(changes)
+    #----------------------------------------------------------------------
+    def sync_from(self,
+                  source,
+                  key_field,
+                  index_path,
+                  fields=None,
+                  deleteMissing=True,
+                  gdbVersion=None,
+                  rollbackOnFailure=True,
+                  max_workers=4,
+                  allowEmpty=False):
+        """
+           makes the layer match a source by sending only the features
+           that changed since the last sync.  The attributes and geometry
+           of each source row are hashed and compared with a local index
+           of what is on the layer: new keys are added, rows whose hash
+           changed are updated and, with deleteMissing, keys no longer in
+           the source are deleted.  The first sync (or a sync with a new
+           index file) builds the index from the layer.  That index only holds hashes of
+           the attributes, since the geometries the server returns are
+           reprojected and rounded: during the first sync a row whose
+           attributes match the layer is not sent, even if its geometry
+           differs, and its full hash is saved for the next syncs.
+           Inputs:
+              source - iterable of common.Feature objects, CompactFeature
+                       objects or feature dictionaries
+              key_field - attribute uniquely identifying a row in both the
+                          source and the layer
+              index_path - SQLite file holding the index
+              fields - attributes compared, defaults to the attributes of
+                       the first source row (without the object id)
+              deleteMissing - if True, features whose key is not in the
+                              source are deleted
+              gdbVersion - Geodatabase version to apply the edits.
+              rollbackOnFailure - rollbackOnFailure parameter of the
+                                  applyEdits requests
+              max_workers - number of requests sent at the same time
+              allowEmpty - with deleteMissing, a source without any row
+                           raises ValueError, since it would delete every
+                           feature of the layer, unless allowEmpty is True
+           Output:
+              arcrest.web.editbatch.EditReport of the edits sent
+        """
+        oid_field = self.objectIdField
+        rows = iter(source)
+        first = next(rows, None)
+        if first is None and deleteMissing and not allowEmpty:
+            raise ValueError("the source has no rows, syncing it would "
+                             "delete every feature of the layer; pass "
+                             "allowEmpty=True to do so")
+        first_attributes = _feature_parts(first)[0]
+        if fields is None:
+            fields = [f for f in first_attributes.keys()
+                      if f.lower() != oid_field.lower()]
+        index = SyncIndex(path=index_path, url=self._url, key_field=key_field)
+        try:
+            if len(index) == 0:
+                self._build_sync_index(index, key_field, fields)
+            pending = {"adds" : [], "updates" : [], "deletes" : []}
+            seen = set()
+            def edits():
+                if first is None:
+                    rows_to_sync = []
+                else:
+                    rows_to_sync = itertools.chain([first], rows)
+                for row in rows_to_sync:
+                    attributes, geometry = _feature_parts(row)
+                    key = _get_value(attributes, key_field)
+                    if key is None:
+                        continue
+                    key = key_value(key)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    digest = feature_hash(attributes, geometry, fields)
+                    entry = index.get(key)
+                    if entry is not None and entry[1] == digest:
+                        continue
+                    if entry is not None and \
+                       str(entry[1]).startswith(ATTRIBUTES_PREFIX) and \
+                       entry[1] == attribute_hash(attributes, fields):
+                        # built from the layer, only the attributes can
+                        # be compared, the full hash is kept from now on
+                        index.set(key, entry[0], digest)
+                        continue
+                    feature = {"attributes" : dict((k, v) for k, v in attributes.iteritems()
+                                                   if k.lower() != oid_field.lower())}
+                    if geometry is not None:
+                        feature['geometry'] = geometry
+                    if entry is None:
+                        pending['adds'].append((key, None, digest))
+                        yield "adds", feature
+                    else:
+                        feature['attributes'][oid_field] = entry[0]
+                        pending['updates'].append((key, entry[0], digest))
+                        yield "updates", feature
+                if deleteMissing:
+                    missing = [(key, oid) for key, oid, digest in index.items()
+                               if key not in seen]
+                    for key, oid in missing:
+                        pending['deletes'].append((key, oid, None))
+                        yield "deletes", oid
+            report = self.apply_edits_batched(edits=edits(),
+                                              gdbVersion=gdbVersion,
+                                              rollbackOnFailure=rollbackOnFailure,
+                                              max_workers=max_workers)
+            for (key, oid, digest), result in zip(pending['adds'], report.addResults):
+                if result.get('success', False):
+                    index.set(key, result.get('objectId'), digest)
+            for (key, oid, digest), result in zip(pending['updates'], report.updateResults):
+                if result.get('success', False):
+                    index.set(key, oid, digest)
+            for (key, oid, digest), result in zip(pending['deletes'], report.deleteResults):
+                if result.get('success', False):
+                    index.remove(key)
+            return report
+        finally:
+            index.close()
+    #----------------------------------------------------------------------
+    def _build_sync_index(self, index, key_field, fields):
+        """ fills a sync index from the attributes of the layer's
+            features, see attribute_hash """
+        oid_field = self.objectIdField
+        out_fields = [key_field, oid_field] + \
+            [f for f in fields if f.lower() not in (key_field.lower(), oid_field.lower())]
+        for feature in self.iter_query(out_fields=",".join(out_fields),
+                                       returnGeometry=False,
+                                       compact=True):
+            key = feature.get_value(key_field)
+            if key is None:
+                continue
+            index.set(key, feature.get_value(oid_field),
+                      attribute_hash(feature.attributes, fields))
+        index.commit()
+    #----------------------------------------------------------------------
     def addFeature(self, features,
                    gdbVersion=None,
                    rollbackOnFailure=True):
@@ -1009,11 +1587,11 @@ class FeatureLayer(BaseAGOLClass):
         if isinstance(rollbackOnFailure, bool):
             params['rollbackOnFailure'] = rollbackOnFailure
         if isinstance(features, list):
-            params['features'] = json.dumps([feature.asDictionary for feature in features],
-                                            default=common._date_handler)
+            params['features'] = codec.dumps([feature.asDictionary for feature in features],
+                                             default=common._date_handler)
         elif isinstance(features, common.Feature):
-            params['features'] = json.dumps([features.asDictionary],
-                                            default=common._date_handler)
+            params['features'] = codec.dumps([features.asDictionary],
+                                             default=common._date_handler)
         else:
             return None
         return self._do_post(url=url,
@@ -1038,33 +1616,14 @@ class FeatureLayer(BaseAGOLClass):
         """
         messages = []
         if attachmentTable is None:
-            count = 0
-            bins = 1
-            uURL = self._url + "/addFeatures"
-            max_chunk = 250
             js = self._unicode_convert(
                 common.featureclass_to_json(fc))
             js = js['features']
-            if len(js) <= max_chunk:
-                bins = 1
-            else:
-                bins = int(len(js)/max_chunk)
-                if len(js) % max_chunk > 0:
-                    bins += 1
-            chunks = self._chunks(l=js, n=bins)
-            for chunk in chunks:
-                params = {
-                    "f" : 'json',
-                    "features"  : json.dumps(chunk,
-                                             default=self._date_handler)
-                }
-                if not self._token is None:
-                    params['token'] = self._token
-                result = self._do_post(url=uURL, param_dict=params, proxy_port=self._proxy_port,
-                                       proxy_url=self._proxy_url)
-                messages.append(result)
-                del params
-                del result
+            # batches follow the payload size and the server's speed
+            # instead of a fixed number of records
+            report = self.apply_edits_batched(addFeatures=js,
+                                              rollbackOnFailure=False)
+            messages.append(report.asDictionary)
             return True, messages
         else:
             oid_field = common.get_OID_field(fc)
@@ -1073,6 +1632,7 @@ class FeatureLayer(BaseAGOLClass):
             val, msgs = self.addFeatures(fl)
             messages.append(msgs)
             del fl
+            uploads = []
             for oid in OIDs:
                 fl = common.create_feature_layer(fc, "%s = %s" % (oid_field, oid), name="layer%s" % oid)
                 val, msgs = self.addFeatures(fl)
@@ -1080,7 +1640,7 @@ class FeatureLayer(BaseAGOLClass):
                     oid_fs = result['objectId']
                     sends = common.get_attachment_data(attachmentTable, sql="%s = %s" % (rel_object_field, oid))
                     for s in sends:
-                        messages.append(self.addAttachment(oid_fs, s['blob']))
+                        uploads.append((oid_fs, s['blob']))
                         del s
                     del sends
                     del result
@@ -1088,9 +1648,49 @@ class FeatureLayer(BaseAGOLClass):
                 del fl
                 del oid
             del OIDs
+            messages.append(self.bulk_add_attachments(uploads))
             return True, messages
 
 
+#----------------------------------------------------------------------
+def _read_progress(path):
+    """ returns the (object id, file path) of the uploads in a progress file """
+    done = set()
+    if path is None or not os.path.isfile(path):
+        return done
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            try:
+                record = codec.loads(line)
+            except ValueError:
+                # a line cut short when the previous run was stopped
+                continue
+            done.add((str(record['oid']), record['path']))
+    return done
+#----------------------------------------------------------------------
+def _feature_parts(feature):
+    """ returns the (attributes, geometry) of a feature object or dictionary """
+    if feature is None:
+        return {}, None
+    if hasattr(feature, "asDictionary"):
+        feature = feature.asDictionary
+    geometry = feature.get('geometry')
+    if geometry == "" or geometry == {}:
+        geometry = None
+    return feature.get('attributes', {}), geometry
+#----------------------------------------------------------------------
+def _get_value(attributes, field_name):
+    """ returns an attribute value, matching the name case insensitively """
+    if field_name in attributes:
+        return attributes[field_name]
+    field_name = field_name.lower()
+    for k, v in attributes.iteritems():
+        if k.lower() == field_name:
+            return v
+    return None
 ########################################################################
 class TableLayer(FeatureLayer):
     """Table object is exactly like FeatureLayer object"""
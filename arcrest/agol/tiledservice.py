@@ -9,12 +9,17 @@
 
 """
 import json
+import types
 from base import BaseAGOLClass
 import urlparse
 import urllib
 import os
 import json
 import common
+from ..common.tilegrid import TileGrid
+from ..common.tilecache import TileCache
+from ..web.tiles import TileFetcher
+from ..web.workerpool import DEFAULT_MAX_WORKERS
 ########################################################################
 class TiledService(BaseAGOLClass):
     """
@@ -310,4 +315,76 @@ class TiledService(BaseAGOLClass):
         """ returns the tile services value """
         if self._tileServers is None:
             self.__init()
-        return self._tileServers
\ No newline at end of file
+        return self._tileServers
+    #----------------------------------------------------------------------
+    def tile_grid(self):
+        """ returns the TileGrid of the service's tiling scheme """
+        return TileGrid(self.tileInfo)
+    #----------------------------------------------------------------------
+    def tile_fetcher(self, cache_path=None, max_tiles=None, max_bytes=None,
+                     max_age=None, max_workers=DEFAULT_MAX_WORKERS):
+        """
+           returns a TileFetcher for the service.  Requests are spread
+           round robin over the tileServers.
+           Inputs:
+              cache_path - optional SQLite file used as a local tile cache
+                           (MBTiles layout), see
+                           arcrest.common.tilecache.TileCache
+              max_tiles - most tiles kept in the cache
+              max_bytes - most bytes kept in the cache
+              max_age - seconds a cached tile is used before it is
+                        revalidated with the server, None never
+                        revalidates
+              max_workers - tiles downloaded at the same time
+        """
+        urls = self.tileServers
+        if not urls:
+            urls = [self._url]
+        param_dict = None
+        if not self._token is None:
+            param_dict = {"token" : self._token}
+        cache = None
+        if not cache_path is None:
+            grid = self.tile_grid()
+            cache = TileCache(cache_path, max_tiles=max_tiles,
+                              max_bytes=max_bytes,
+                              metadata={"name" : self._url,
+                                        "format" : (grid.format or "").lower()})
+        return TileFetcher(urls=urls,
+                           cache=cache,
+                           max_age=max_age,
+                           param_dict=param_dict,
+                           max_workers=max_workers,
+                           transport=self._get_transport(),
+                           referer=self._referer_url,
+                           proxy_url=self._proxy_url,
+                           proxy_port=self._proxy_port)
+    #----------------------------------------------------------------------
+    def fetch_tiles(self, extent=None, levels=None, cache_path=None,
+                    max_tiles=None, max_bytes=None, max_age=None,
+                    max_workers=DEFAULT_MAX_WORKERS):
+        """
+           downloads the tiles covering an extent, several at a time
+           Inputs:
+              extent - dictionary with xmin, ymin, xmax and ymax in the
+                       spatial reference of the tiling scheme, the full
+                       extent by default
+              levels - list of levels, all the levels by default
+              For the other inputs, see tile_fetcher.
+           Output:
+              generator of (level, row, col, data, error), data is None
+              for tiles missing on the server or that failed
+        """
+        if extent is None:
+            extent = self.fullExtent
+        fetcher = self.tile_fetcher(cache_path=cache_path,
+                                    max_tiles=max_tiles,
+                                    max_bytes=max_bytes,
+                                    max_age=max_age,
+                                    max_workers=max_workers)
+        try:
+            for result in fetcher.fetch_many(self.tile_grid().tiles(extent, levels)):
+                yield result
+        finally:
+            if not fetcher.cache is None:
+                fetcher.cache.close()
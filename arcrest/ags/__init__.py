@@ -5,6 +5,8 @@ import mapservice
 import layer
 import imageservice
 import gpservice
+import gpscheduler
+import tileseeder
 import globeservice
 import geometryservice
 import geometry
@@ -14,5 +16,6 @@ import filters
 import featureservice
 import common
 import catalog
+import crawler
 import base
 import administration
\ No newline at end of file
@@ -5,6 +5,7 @@
 
 from base import BaseAGSServer
 from datetime import datetime
+from ..web.workerpool import imap, DEFAULT_MAX_WORKERS
 import csv
 ########################################################################
 class ArcGISServerSite(BaseAGSServer):
@@ -859,9 +860,11 @@ class Services(BaseAGSServer):
                 )
         return self._services
     #----------------------------------------------------------------------
-    def find_services(self, service_type="*"):
+    def find_services(self, service_type="*",
+                      max_workers=DEFAULT_MAX_WORKERS):
         """
-            returns a list of a particular service type on AGS
+            returns a list of a particular service type on AGS.  The
+            folders are listed concurrently.
             Input:
               service_type - Type of service to find.  The allowed types
                              are: ("GPSERVER", "GLOBESERVER", "MAPSERVER",
@@ -869,6 +872,7 @@ class Services(BaseAGSServer):
                              "SEARCHSERVER", "GEODATASERVER",
                              "GEOCODESERVER", "*").  The default is *
                              meaning find all service names.
+              max_workers - number of folders listed at the same time
             Output:
               returns a list of service names as <folder>/<name>.<type>
         """
@@ -885,28 +889,28 @@ class Services(BaseAGSServer):
             "token" : self._token
         }
         type_services = []
-        folders = self.folders
-        folders.append("")
         baseURL = self._url
-        for folder in folders:
-            if folder == "":
+        folders = []
+        for folder in self.folders:
+            if folder in ("", "/"):
                 url = baseURL
             else:
                 url = baseURL + "/%s" % folder
-            res = self._do_get(url, params)
+            if url not in folders:
+                folders.append(url)
+        def list_folder(url):
+            return url, self._do_get(url, params)
+        for url, res in imap(list_folder, folders,
+                             max_workers=max_workers):
             if res.has_key("services"):
                 for service in res['services']:
-                    #if service_type == "*":
-                        #service['URL'] = url + "/%s.%s" % (service['serviceName'],
-                                                           #service_type)
-                        #type_services.append(service)
-                    if service['type'].lower() in lower_types:
+                    if service_type == "*" or \
+                       service['type'].lower() in lower_types:
                         service['URL'] = url + "/%s.%s" % (service['serviceName'],
-                                                           service_type)
+                                                           service['type'])
                         type_services.append(service)
                     del service
             del res
-            del folder
         return type_services
     #----------------------------------------------------------------------
     def addFolderPermission(self, principal, isAllowed=True, folder=None):
@@ -1,9 +1,7 @@
 import httplib
-import urlparse
-import urllib
-import urllib2
-import json
-import os
+from ..web.transport import get_transport
+from ..common import codec
+from ..web.tokencache import get_token_cache
 ########################################################################
 class BaseFilter(object):
     """ base filter class """
@@ -30,6 +28,7 @@ class BaseAGSServer(object):
     _token_url = None
     _proxy_url = None
     _proxy_port = None
+    _transport = None
     #----------------------------------------------------------------------
     @property
     def proxy_port(self):
@@ -88,77 +87,61 @@ class BaseAGSServer(object):
         """ sets the username """
         self._username = value
     #----------------------------------------------------------------------
-    def _download_file(self, url, save_path, file_name, proxy_url=None, proxy_port=None):
+    def _get_transport(self):
+        """ returns the Transport object used for web requests """
+        if self._transport is None:
+            return get_transport()
+        return self._transport
+    #----------------------------------------------------------------------
+    def _download_file(self, url, save_path, file_name, proxy_url=None, proxy_port=None,
+                       param_dict=None):
         """ downloads a file """
-        try:
-            if proxy_url is not None:
-                if proxy_port is None:
-                    proxy_port = 80
-                proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                           "https":"https://%s:%s" % (proxy_url, proxy_port)}
-                proxy_support = urllib2.ProxyHandler(proxies)
-                opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-                urllib2.install_opener(opener)
-           
-            file_data = urllib2.urlopen(url)
-            total_size = int(file_data.info().getheader('Content-Length').strip())
-            downloaded = 0
-            CHUNK = 4096
-            
-            with open(save_path + os.sep + file_name, 'wb') as out_file:
-                while True:
-                    chunk = file_data.read(CHUNK)
-                    downloaded += len(chunk)
-                    if not chunk: break
-                    #print str(int(math.floor(float(downloaded) / float(total_size) * 100 ))) + "% download"
-                                                      
-                    out_file.write(chunk)       
-               
-            return save_path + os.sep + file_name
-        except urllib2.HTTPError, e:
-            print "HTTP Error:",e.code , url
-            return False
-        except urllib2.URLError, e:
-            print "URL Error:",e.reason , url
-            return False
+        if proxy_url is None:
+            proxy_url = self._proxy_url
+            proxy_port = self._proxy_port
+        return self._get_transport().download(url=url,
+                                              save_path=save_path,
+                                              file_name=file_name,
+                                              proxy_url=proxy_url,
+                                              proxy_port=proxy_port,
+                                              param_dict=param_dict)
     #----------------------------------------------------------------------
     def _do_post(self, url, param_dict):
         """ performs the POST operation and returns dictionary result """
-        proxy_url = self._proxy_url
-        proxy_port = self._proxy_port
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-            urllib2.install_opener(opener)
-        request = urllib2.Request(url, urllib.urlencode(param_dict))
-        result = urllib2.urlopen(request).read()
-        jres = json.loads(result)
-        return self._unicode_convert(jres)
+        result = self._get_transport().post(url=url,
+                                            param_dict=param_dict,
+                                            proxy_url=self._proxy_url,
+                                            proxy_port=self._proxy_port)
+        return result
     #----------------------------------------------------------------------
     def _do_get(self, url, param_dict, header={}):
         """ performs a get operation """
-        proxy_url = self._proxy_url
-        proxy_port = self._proxy_port
-        url = url + "?%s" % urllib.urlencode(param_dict)
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support)
-            urllib2.install_opener(opener)
-        request = urllib2.Request(url, headers=header)
-        result = urllib2.urlopen(request).read()
-        jres = json.loads(result)
-        return self._unicode_convert(jres)
+        result = self._get_transport().get(url=url,
+                                           param_dict=param_dict,
+                                           headers=header,
+                                           proxy_url=self._proxy_url,
+                                           proxy_port=self._proxy_port)
+        return result
+    #----------------------------------------------------------------------
+    def _do_get_bytes(self, url, param_dict, header={}):
+        """ performs a get operation and returns the raw response body """
+        return self._get_transport().get_bytes(url=url,
+                                               param_dict=param_dict,
+                                               headers=header,
+                                               proxy_url=self._proxy_url,
+                                               proxy_port=self._proxy_port)
+    #----------------------------------------------------------------------
+    def _do_get_stream(self, url, param_dict, header={}):
+        """ performs a get operation and returns the response body as a
+            stream, see Transport.get_stream """
+        return self._get_transport().get_stream(url=url,
+                                                param_dict=param_dict,
+                                                headers=header,
+                                                proxy_url=self._proxy_url,
+                                                proxy_port=self._proxy_port)
     #----------------------------------------------------------------------
     def _post_multipart(self, host, selector, fields, files,
-                        ssl=False,port=80):
+                        ssl=False,port=80, callback=None):
         """ performs a multi-post to AGOL or AGS
             Inputs:
                host - string - root url (no http:// or https://)
@@ -168,6 +151,8 @@ class BaseAGSServer(object):
                fields - dictionary - additional parameters like token and format information
                files - tuple array- tuple with the file name type, filename, full path
                ssl - option to use SSL
+               callback - optional function called as callback(bytes sent,
+                          total bytes) while the files are uploaded
             Output:
                JSON response as dictionary
             Useage:
@@ -181,129 +166,45 @@ class BaseAGSServer(object):
                                fields=params
                                )
         """
-        proxy_url = self._proxy_url
-        proxy_port = self._proxy_port
-        boundary, body = self._encode_multipart_formdata(fields, files)
-        headers = {
-        'User-Agent': "ArcREST",
-        'Content-Type': 'multipart/form-data; boundary=%s' % boundary
-        }
-        if proxy_url:
-            if ssl:
-                h = httplib.HTTPSConnection(proxy_url, proxy_port)
-                h.request('POST', 'https://' + host + selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(proxy_url, proxy_port)
-                h.request('POST', 'http://' + host + selector, body, headers)
-        else:
-            if ssl:
-                h = httplib.HTTPSConnection(host,port)
-                h.request('POST', selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(host,port)
-                h.request('POST', selector, body, headers)
-        return h.getresponse().read()
+        return self._get_transport().post_multipart(host=host,
+                                                    selector=selector,
+                                                    fields=fields,
+                                                    files=files,
+                                                    ssl=ssl,
+                                                    port=port,
+                                                    proxy_url=self._proxy_url,
+                                                    proxy_port=self._proxy_port,
+                                                    callback=callback)
     #----------------------------------------------------------------------
-    def _encode_multipart_formdata(self, fields, files):
-        boundary = mimetools.choose_boundary()
-        buf = StringIO()
-        for (key, value) in fields.iteritems():
-            buf.write('--%s\r\n' % boundary)
-            buf.write('Content-Disposition: form-data; name="%s"' % key)
-            buf.write('\r\n\r\n' + self._tostr(value) + '\r\n')
-        for (key, filepath, filename) in files:
-            buf.write('--%s\r\n' % boundary)
-            buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
-            buf.write('Content-Type: %s\r\n' % (self._get_content_type(filename)))
-            file = open(filepath, "rb")
-            try:
-                buf.write('\r\n' + file.read() + '\r\n')
-            finally:
-                file.close()
-        buf.write('--' + boundary + '--\r\n\r\n')
-        buf = buf.getvalue()
-        return boundary, buf
-    #----------------------------------------------------------------------
-    def _get_content_type(self, filename):
-        """ gets the content type of a file """
-        mntype = mimetypes.guess_type(filename)[0]
-        filename, fileExtension = os.path.splitext(filename)
-        if mntype is None and\
-            fileExtension.lower() == ".csv":
-            mntype = "text/csv"
-        elif mntype is None and \
-            fileExtension.lower() == ".sd":
-            mntype = "File/sd"
-        elif mntype is None:
-            #mntype = 'application/octet-stream'
-            mntype= "File/%s" % fileExtension.replace('.', '')
-        return mntype
-    #----------------------------------------------------------------------
-    def _tostr(self,obj):
-        """ converts a object to list, if object is a list, it creates a
-            comma seperated string.
-        """
-        if not obj:
-            return ''
-        if isinstance(obj, list):
-            return ', '.join(map(self._tostr, obj))
-        return str(obj)
-    #----------------------------------------------------------------------
-    def _unicode_convert(self, obj):
-        """ converts unicode to anscii """
-        if isinstance(obj, dict):
-            return {self._unicode_convert(key): self._unicode_convert(value) for key, value in obj.iteritems()}
-        elif isinstance(obj, list):
-            return [self._unicode_convert(element) for element in obj]
-        elif isinstance(obj, unicode):
-            return obj.encode('utf-8')
-        else:
-            return obj
-    #----------------------------------------------------------------------
-    def generate_token(self):
-        """ generates a token for AGS """
-        params = urllib.urlencode({'username': self._username,
-                                   'password': self._password,
-                                   'client': 'requestip',
-                                   'f': 'json'})
-        parsed_url = urlparse.urlparse(self._token_url)
-        headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
-
-        port = parsed_url.port
-        if port is None:
-            port = 80
-        ## Connect to URL and post parameters
-        if self.proxy_url is not None:
-            if parsed_url.scheme.lower() == "https":
-                httpConn = httplib.HTTPSConnection(parsed_url.hostname, port)
-            else:
-                httpConn = httplib.HTTPConnection(parsed_url.hostname, port)
-            httpConn.request('POST', '%s://%s%s'% (parsed_url.scheme, parsed_url.hostname, parsed_url.path), params, headers)
-        else:
-            if parsed_url.scheme.lower() == "https":
-                httpConn = httplib.HTTPSConnection(parsed_url.hostname, port)
+    def generate_token(self, tokenURL=None, proxy_url=None, proxy_port=None):
+        """ generates a token for AGS
 
-            else:
-                httpConn = httplib.HTTPConnection(parsed_url.hostname, port)
-            httpConn.request("POST", parsed_url.path, params, headers)
-        response = httpConn.getresponse()
-        data = self._unicode_convert(json.loads(response.read()))
-        httpConn.close()
-        del httpConn
-        del response
+            Tokens are shared through the process wide token cache, so
+            every service created from the same token url and username
+            reuses one token until it is about to expire.
+        """
+        if tokenURL is None:
+            tokenURL = self._token_url
+        params = {'username': self._username,
+                  'password': self._password,
+                  'client': 'requestip',
+                  'f': 'json'}
+        def generate():
+            return self._do_post(url=tokenURL, param_dict=params)
+        data = get_token_cache().get(token_url=tokenURL,
+                                     username=self._username,
+                                     referer='requestip',
+                                     generator=generate,
+                                     password=self._password)
+        if 'token' not in data:
+            self._token = None
+            return data
         self._token = data['token']
         return  data['token'], data['expires']
     #----------------------------------------------------------------------
     def _unicode_convert(self, obj):
         """ converts unicode to anscii """
-        if isinstance(obj, dict):
-            return {self._unicode_convert(key): self._unicode_convert(value) for key, value in obj.iteritems()}
-        elif isinstance(obj, list):
-            return [self._unicode_convert(element) for element in obj]
-        elif isinstance(obj, unicode):
-            return obj.encode('utf-8')
-        else:
-            return obj
+        return codec.convert(obj)
 # This function is a workaround to deal with what's typically described as a
 # problem with the web server closing a connection. This is problem
 # experienced with www.arcgis.com (first encountered 12/13/2012). The problem
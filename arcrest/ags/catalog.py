@@ -9,8 +9,24 @@ from naservice import NAService
 from geocodeservice import GeocodeService
 from globeservice import GlobeService
 from geodataservice import GeoDataService
+from crawler import CatalogCrawler
 import os
 import sys
+import threading
+from ..web.workerpool import imap, DEFAULT_MAX_WORKERS
+
+_SERVICE_TYPES = {
+    "FeatureServer" : (FeatureService, "_featureService"),
+    "GPServer" : (GPService, "_gpService"),
+    "MapServer" : (MapService, "_mapServices"),
+    "ImageServer" : (ImageService, "_imageService"),
+    "MobileServer" : (MobileService, "_mobileService"),
+    "GeometryServer" : (GeometryService, "_geometryService"),
+    "GlobeServer" : (GlobeService, "_globeService"),
+    "GeocodeServer" : (GeocodeService, "_geoCodeService"),
+    "NAServer" : (NAService, "_networkService"),
+    "GeoDataServer" : (GeoDataService, "_geoDataService"),
+}
 
 ########################################################################
 class Catalog(BaseAGSServer):
@@ -49,17 +65,23 @@ class Catalog(BaseAGSServer):
     _globeService = None
     _mobileService = None
     #----------------------------------------------------------------------
-    def __init__(self, url, token_url=None, username=None, password=None, proxy_url=None, proxy_port=None):
+    def __init__(self, url, token_url=None, username=None, password=None,
+                 proxy_url=None, proxy_port=None, prefetch=False):
         """Constructor
             Inputs:
                url - admin url
                token_url - url to generate token
                username - admin username
                password - admin password
+               prefetch - if True, the description of every service is
+                          loaded concurrently right away, else each
+                          service is loaded the first time it is used
         """
         self._url = url
         self._currentURL = url
-        if self.token_url is not None:
+        self._proxy_url = proxy_url
+        self._proxy_port = proxy_port
+        if token_url is not None:
             self._token_url = token_url
             self._username = username
             self._password = password
@@ -82,6 +104,8 @@ class Catalog(BaseAGSServer):
                     self._token = res[0]
         self.__init()
         self._populateServices()
+        if prefetch:
+            self.prefetch()
     #----------------------------------------------------------------------
     def __init(self):
         """ populates server admin information """
@@ -155,61 +179,63 @@ class Catalog(BaseAGSServer):
     def naServices(self):
         """ returns the NA services in the current folder """
         if self._networkService is None:
-            self._populateServices
+            self._populateServices()
         return self._networkService
     #----------------------------------------------------------------------
     @property
     def mapServices(self):
         """ returns the map services in the current folder """
         if self._mapServices is None:
-            self._populateServices
+            self._populateServices()
         return self._mapServices
     #----------------------------------------------------------------------
     @property
     def featureServices(self):
         """ returns the feature services in the current folder """
         if self._featureService is None:
-            self._populateServices
+            self._populateServices()
         return self._featureService
     #----------------------------------------------------------------------
     @property
     def geometryService(self):
         """ returns the geometry service in the current folder """
         if self._geometryService is None:
-            self._populateServices
+            self._populateServices()
         return self._geometryService
     #----------------------------------------------------------------------
     @property
     def imageServices(self):
         """ returns all the image services in the current folder """
         if self._imageService is None:
-            self._populateServices
+            self._populateServices()
         return self._imageService
     #----------------------------------------------------------------------
     @property
     def mobileServices(self):
         """ returns the mobile services in the current folder """
         if self._mobileService is None:
-            self._populateServices
+            self._populateServices()
         return self._mobileService
     #----------------------------------------------------------------------
     @property
     def globeServices(self):
         """ returns the globe services in the current folder """
         if self._globeService is None:
-            self._populateServices
+            self._populateServices()
         return self._globeService
     #----------------------------------------------------------------------
     @property
     def geodataServices(self):
         """ returns all geodata services in the current folder """
         if self._geoDataService is None:
-            self._populateServices
+            self._populateServices()
         return self._geoDataService
     #----------------------------------------------------------------------
     def _populateServices(self):
         """
-           Populates all the service type properties.
+           Populates all the service type properties with LazyService
+           objects.  No request is made to the services until they are
+           used, or until prefetch() is called.
         """
         self._mapServices = [] #
         self._geoCodeService = []
@@ -222,101 +248,142 @@ class Catalog(BaseAGSServer):
         self._globeService = []
         self._mobileService = [] #
         for service in self.services:
+            if service['type'] not in _SERVICE_TYPES:
+                continue
+            service_class, holder = _SERVICE_TYPES[service['type']]
             url = "%s/%s/%s" % (
                 self._currentURL,
                 service['name'].split("/")[len(service['name'].split("/"))-1],
                 service['type']
             )
-            if service['type'] == "FeatureServer":
-                self._featureService.append(
-                    FeatureService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "GPServer":
-                self._gpService.append(
-                    GPService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "MapServer":
-                self._mapServices.append(
-                    MapService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "ImageServer":
-                self._imageService.append(
-                    ImageService(url=url,
-                                    username=self._username,
-                                    password=self._password,
-                                    token_url=self._token_url
-                                    )
-                )
-            elif service['type'] == "MobileServer":
-                self._mobileService.append(
-                    MobileService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "GeometryServer":
-                self._geometryService.append(
-                    GeometryService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "GlobeServer":
-                self._globeService.append(
-                    GlobeService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "GeocodeServer":
-                self._geoCodeService.append(
-                    GeocodeService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "NAServer":
-                self._networkService.append(
-                    NAService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-            elif service['type'] == "GeoDataServer":
-                self._networkService.append(
-                    GeoDataService(
-                        url=url,
-                        username=self._username,
-                        password=self._password,
-                        token_url=self._token_url
-                    )
-                )
-
-
-
-
+            getattr(self, holder).append(
+                LazyService(service_class=service_class,
+                            url=url,
+                            name=service['name'],
+                            serviceType=service['type'],
+                            username=self._username,
+                            password=self._password,
+                            token_url=self._token_url,
+                            proxy_url=self._proxy_url,
+                            proxy_port=self._proxy_port)
+            )
+    #----------------------------------------------------------------------
+    def _lazyServices(self):
+        """ returns all the LazyService objects of the current folder """
+        if self._mapServices is None:
+            self._populateServices()
+        services = []
+        for holder in ("_featureService", "_gpService", "_mapServices",
+                       "_imageService", "_mobileService", "_geometryService",
+                       "_globeService", "_geoCodeService", "_networkService",
+                       "_geoDataService"):
+            services.extend(getattr(self, holder))
+        return services
+    #----------------------------------------------------------------------
+    def prefetch(self, max_workers=DEFAULT_MAX_WORKERS):
+        """
+           loads the description of every service in the current folder
+           concurrently.
+           Inputs:
+              max_workers - number of services loaded at the same time
+           Output:
+              list of (service name, error) tuples for the services that
+              could not be loaded, empty when all of them loaded
+        """
+        def load(service):
+            try:
+                service.load()
+                return None
+            except Exception, e:
+                return (service.name, e)
+        return [res for res in imap(load, self._lazyServices(),
+                                    max_workers=max_workers)
+                if res is not None]
+    #----------------------------------------------------------------------
+    def crawler(self, max_workers=DEFAULT_MAX_WORKERS, layers=True):
+        """
+           returns a CatalogCrawler for the whole site using the same
+           credentials as this catalog
+           Inputs:
+              max_workers - number of requests made at the same time
+              layers - if True, layers and tables are part of the snapshot
+        """
+        return CatalogCrawler(url=self._url,
+                              token_url=self._token_url,
+                              username=self._username,
+                              password=self._password,
+                              proxy_url=self._proxy_url,
+                              proxy_port=self._proxy_port,
+                              max_workers=max_workers,
+                              layers=layers)
+########################################################################
+class LazyService(object):
+    """
+       Stand-in for a service of a Catalog.  The name, url and type of the
+       service are known without contacting the server; the service object
+       is created, and its description loaded, the first time any other
+       attribute is used.
+    """
+    _service_class = None
+    _url = None
+    _name = None
+    _serviceType = None
+    _kwargs = None
+    _service = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, service_class, url, name, serviceType, **kwargs):
+        """Constructor
+            Inputs:
+               service_class - class used to create the service
+               url - url of the service
+               name - name of the service as listed by the catalog
+               serviceType - type of the service, ie: MapServer
+               kwargs - other arguments for the service constructor
+        """
+        self._service_class = service_class
+        self._url = url
+        self._name = name
+        self._serviceType = serviceType
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+    #----------------------------------------------------------------------
+    @property
+    def url(self):
+        """ returns the url of the service """
+        return self._url
+    #----------------------------------------------------------------------
+    @property
+    def name(self):
+        """ returns the name of the service """
+        return self._name
+    #----------------------------------------------------------------------
+    @property
+    def serviceType(self):
+        """ returns the type of the service """
+        return self._serviceType
+    #----------------------------------------------------------------------
+    @property
+    def loaded(self):
+        """ returns True once the service object has been created """
+        return self._service is not None
+    #----------------------------------------------------------------------
+    def load(self):
+        """ creates the service object and returns it """
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self._service_class(url=self._url,
+                                                        initialize=True,
+                                                        **self._kwargs)
+        return self._service
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        """ forwards everything else to the service object """
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+    #----------------------------------------------------------------------
+    def __repr__(self):
+        return "<LazyService %s (%s)%s>" % (self._name, self._serviceType,
+                                            "" if self.loaded else " not loaded")
@@ -4,6 +4,7 @@
    API.
 """
 import arcpy
+from ..common import codec
 from geometry import *
 import types
 import os
@@ -309,8 +310,7 @@ class Feature(object):
     def __init__(self, json_string):
         """Constructor"""
         if type(json_string) is dict:
-            self._json = json.dumps(json_string,
-                                    default=_date_handler)
+            # the JSON string is only built when asJSON is used
             self._dict = json_string
         elif type(json_string) is str:
             self._dict = json.loads(json_string)
@@ -322,7 +322,7 @@ class Feature(object):
         """ sets an attribute value for a given field name """
         if field_name in self.fields:
             self._dict['attributes'][field_name] = value
-            self._json = json.dumps(self._dict, default=_date_handler)
+            self._json = None
         elif field_name.upper() in ['SHAPE', 'SHAPE@', "GEOMETRY"]:
             if isinstance(value, Geometry):
                 if isinstance(value, Point):
@@ -344,7 +344,7 @@ class Feature(object):
                     }
                 else:
                     return False
-                self._json = json.dumps(self._dict, default=_date_handler)
+                self._json = None
         else:
             return False
         return True
@@ -373,6 +373,13 @@ class Feature(object):
         return self._dict
     #----------------------------------------------------------------------
     @property
+    def asJSON(self):
+        """ returns the feature as a JSON string """
+        if self._json is None:
+            self._json = codec.dumps(self._dict, default=_date_handler)
+        return self._json
+    #----------------------------------------------------------------------
+    @property
     def asRow(self):
         """ converts a feature to a list for insertion into an insert cursor
             Output:
@@ -451,13 +458,4 @@ class Feature(object):
 #----------------------------------------------------------------------
 def _unicode_convert(obj):
     """ converts unicode to anscii """
-    if isinstance(obj, dict):
-        return {_unicode_convert(key): \
-                _unicode_convert(value) \
-                for key, value in obj.iteritems()}
-    elif isinstance(obj, list):
-        return [_unicode_convert(element) for element in obj]
-    elif isinstance(obj, unicode):
-        return obj.encode('utf-8')
-    else:
-        return obj
\ No newline at end of file
+    return codec.convert(obj)
\ No newline at end of file
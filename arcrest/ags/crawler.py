@@ -0,0 +1,422 @@
+"""
+
+.. module:: crawler
+   :platform: Windows, Linux
+   :synopsis: Concurrent crawler that inventories an ArcGIS Server site
+              into a JSON lines or SQLite snapshot.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from base import BaseAGSServer
+from ..web.workerpool import imap, DEFAULT_MAX_WORKERS
+
+# service types whose layers and tables are part of the snapshot
+_LAYER_SERVICE_TYPES = ("MapServer", "FeatureServer")
+########################################################################
+class Snapshot(object):
+    """
+       Inventory of an ArcGIS Server site.  A snapshot holds, for every
+       folder, the hash of its service listing and one record per service
+       with its description and its layers.
+    """
+    _url = None
+    _created = None
+    _folders = None
+    #----------------------------------------------------------------------
+    def __init__(self, url=None, created=None):
+        """Constructor"""
+        self._url = url
+        if created is None:
+            created = int(time.time())
+        self._created = created
+        self._folders = {}
+    #----------------------------------------------------------------------
+    @property
+    def url(self):
+        """ returns the url of the crawled site """
+        return self._url
+    #----------------------------------------------------------------------
+    @property
+    def created(self):
+        """ returns when the snapshot was taken, in epoch seconds """
+        return self._created
+    #----------------------------------------------------------------------
+    @property
+    def folders(self):
+        """ returns the names of the folders in the snapshot """
+        return sorted(self._folders.keys())
+    #----------------------------------------------------------------------
+    def folderHash(self, folder):
+        """ returns the listing hash of a folder or None """
+        if folder in self._folders:
+            return self._folders[folder]['hash']
+        return None
+    #----------------------------------------------------------------------
+    def services(self, folder=None):
+        """
+           returns the service records of a folder, or of the whole site
+           when folder is None
+        """
+        if folder is not None:
+            if folder in self._folders:
+                return list(self._folders[folder]['services'])
+            return []
+        services = []
+        for name in self.folders:
+            services.extend(self._folders[name]['services'])
+        return services
+    #----------------------------------------------------------------------
+    def setFolder(self, folder, listing_hash, services):
+        """ stores the listing hash and service records of a folder """
+        self._folders[folder] = {"hash" : listing_hash,
+                                 "services" : list(services)}
+    #----------------------------------------------------------------------
+    def save(self, path, format=None):
+        """
+           writes the snapshot to disk
+           Inputs:
+              path - file to write
+              format - "jsonl" or "sqlite", by default it is picked from
+                       the file extension (.sqlite, .db are SQLite)
+        """
+        if _format(path, format) == "sqlite":
+            self._save_sqlite(path)
+        else:
+            self._save_jsonl(path)
+        return path
+    #----------------------------------------------------------------------
+    def _save_jsonl(self, path):
+        """ one JSON record per line, written to a temp file first """
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(_dumps({"kind" : "site",
+                            "url" : self._url,
+                            "created" : self._created}) + "\n")
+            for folder in self.folders:
+                f.write(_dumps({"kind" : "folder",
+                                "folder" : folder,
+                                "hash" : self._folders[folder]['hash']}) + "\n")
+                for service in self._folders[folder]['services']:
+                    record = {"kind" : "service"}
+                    record.update(service)
+                    f.write(_dumps(record) + "\n")
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(temp, path)
+    #----------------------------------------------------------------------
+    def _save_sqlite(self, path):
+        """ stores the snapshot in three tables of a SQLite database """
+        conn = sqlite3.connect(path)
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS site (url TEXT, created INTEGER);
+                CREATE TABLE IF NOT EXISTS folders (
+                    folder TEXT PRIMARY KEY, hash TEXT);
+                CREATE TABLE IF NOT EXISTS services (
+                    folder TEXT, name TEXT, type TEXT, url TEXT,
+                    record TEXT, PRIMARY KEY (folder, name, type));
+                DELETE FROM site;
+                DELETE FROM folders;
+                DELETE FROM services;
+            """)
+            conn.execute("INSERT INTO site VALUES (?, ?)",
+                         (self._url, self._created))
+            for folder in self.folders:
+                conn.execute("INSERT INTO folders VALUES (?, ?)",
+                             (folder, self._folders[folder]['hash']))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO services VALUES (?, ?, ?, ?, ?)",
+                    [(folder, s['name'], s['type'], s['url'], _dumps(s))
+                     for s in self._folders[folder]['services']])
+            conn.commit()
+        finally:
+            conn.close()
+    #----------------------------------------------------------------------
+    @classmethod
+    def load(cls, path, format=None):
+        """
+           reads a snapshot written by save()
+           Inputs:
+              path - file to read
+              format - "jsonl" or "sqlite", picked from the extension
+                       when not given
+        """
+        if _format(path, format) == "sqlite":
+            return cls._load_sqlite(path)
+        return cls._load_jsonl(path)
+    #----------------------------------------------------------------------
+    @classmethod
+    def _load_jsonl(cls, path):
+        """ reads a JSON lines snapshot """
+        snapshot = cls()
+        hashes = {}
+        services = {}
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line == "":
+                    continue
+                record = json.loads(line)
+                kind = record.pop("kind")
+                if kind == "site":
+                    snapshot._url = record['url']
+                    snapshot._created = record['created']
+                elif kind == "folder":
+                    hashes[record['folder']] = record['hash']
+                    services.setdefault(record['folder'], [])
+                elif kind == "service":
+                    services.setdefault(record['folder'], []).append(record)
+        for folder, listing_hash in hashes.iteritems():
+            snapshot.setFolder(folder, listing_hash, services[folder])
+        return snapshot
+    #----------------------------------------------------------------------
+    @classmethod
+    def _load_sqlite(cls, path):
+        """ reads a SQLite snapshot """
+        snapshot = cls()
+        conn = sqlite3.connect(path)
+        try:
+            for url, created in conn.execute("SELECT url, created FROM site"):
+                snapshot._url = url
+                snapshot._created = created
+            services = {}
+            for folder, record in conn.execute(
+                "SELECT folder, record FROM services ORDER BY folder, name"):
+                services.setdefault(folder, []).append(json.loads(record))
+            for folder, listing_hash in conn.execute(
+                "SELECT folder, hash FROM folders"):
+                snapshot.setFolder(folder, listing_hash,
+                                   services.get(folder, []))
+        finally:
+            conn.close()
+        return snapshot
+########################################################################
+class CatalogCrawler(BaseAGSServer):
+    """
+       Walks every folder, service and layer of an ArcGIS Server REST
+       services directory concurrently.  All requests share the keep-alive
+       connections of the process wide transport.
+       Inputs:
+          url - url of the services directory, ie:
+                http://<host>/arcgis/rest/services
+          token_url - url to generate token
+          username - username for secured sites
+          password - password for secured sites
+          max_workers - number of requests made at the same time
+          layers - if True, the layers and tables of map and feature
+                   services are part of the snapshot
+    """
+    _url = None
+    _token_url = None
+    _username = None
+    _password = None
+    _token = None
+    _proxy_url = None
+    _proxy_port = None
+    _max_workers = None
+    _layers = None
+    #----------------------------------------------------------------------
+    def __init__(self, url, token_url=None, username=None, password=None,
+                 proxy_url=None, proxy_port=None,
+                 max_workers=DEFAULT_MAX_WORKERS, layers=True):
+        """Constructor"""
+        self._url = url.rstrip("/")
+        self._token_url = token_url
+        self._proxy_url = proxy_url
+        self._proxy_port = proxy_port
+        self._max_workers = max_workers
+        self._layers = layers
+        if not username is None and \
+           not password is None and \
+           not username is "" and \
+           not password is "" and \
+           not token_url is None:
+            self._username = username
+            self._password = password
+            res = self.generate_token(tokenURL=token_url,
+                                      proxy_port=proxy_port,
+                                      proxy_url=proxy_url)
+            if res is None:
+                print "Token was not generated"
+            elif 'error' in res:
+                print res
+            else:
+                self._token = res[0]
+    #----------------------------------------------------------------------
+    @property
+    def max_workers(self):
+        """ gets/sets the number of requests made at the same time """
+        return self._max_workers
+    #----------------------------------------------------------------------
+    @max_workers.setter
+    def max_workers(self, value):
+        """ gets/sets the number of requests made at the same time """
+        self._max_workers = value
+    #----------------------------------------------------------------------
+    def _get_json(self, url):
+        """ returns the JSON description of a resource """
+        params = {"f" : "json"}
+        if self._token is not None:
+            params['token'] = self._token
+        return self._do_get(url=url, param_dict=params)
+    #----------------------------------------------------------------------
+    def _listFolder(self, folder):
+        """
+           returns a tuple of (folder, listing, subfolders) where listing
+           is the sorted service list of the folder
+        """
+        if folder == "/":
+            url = self._url
+        else:
+            url = self._url + "/%s" % folder
+        res = self._get_json(url)
+        if not isinstance(res, dict) or 'error' in res:
+            return folder, {"error" : res}, []
+        listing = sorted([{"name" : s['name'], "type" : s['type']}
+                          for s in res.get('services', [])],
+                         key=lambda s: (s['name'], s['type']))
+        return folder, listing, res.get('folders', [])
+    #----------------------------------------------------------------------
+    def _listAllFolders(self):
+        """
+           returns a dictionary of folder name to service listing for the
+           whole site.  Each level of folders is listed concurrently.
+        """
+        listings = {}
+        level = ["/"]
+        while len(level) > 0:
+            next_level = []
+            for folder, listing, subfolders in imap(self._listFolder, level,
+                                                    max_workers=self._max_workers):
+                listings[folder] = listing
+                next_level.extend([f for f in subfolders
+                                   if f not in listings])
+            level = next_level
+        return listings
+    #----------------------------------------------------------------------
+    def _crawlService(self, item):
+        """ returns the snapshot record of a single service """
+        folder, service = item
+        url = "%s/%s/%s" % (self._url, service['name'], service['type'])
+        record = {"folder" : folder,
+                  "name" : service['name'],
+                  "type" : service['type'],
+                  "url" : url}
+        try:
+            record['info'] = self._get_json(url)
+            if self._layers and \
+               service['type'] in _LAYER_SERVICE_TYPES and \
+               'error' not in record['info']:
+                res = self._get_json(url + "/layers")
+                record['layers'] = res.get('layers', []) + \
+                                 res.get('tables', [])
+        except Exception, e:
+            record['error'] = str(e)
+        return record
+    #----------------------------------------------------------------------
+    def crawl(self, previous=None):
+        """
+           walks the whole site and returns a Snapshot.
+           Inputs:
+              previous - optional Snapshot (or path of a saved one).  Only
+                         the folders whose service listing changed since
+                         that snapshot have their services fetched again;
+                         the other folders are copied from it.
+           Output:
+              Snapshot object
+        """
+        if isinstance(previous, basestring):
+            previous = Snapshot.load(previous)
+        snapshot = Snapshot(url=self._url)
+        listings = self._listAllFolders()
+        work = []
+        for folder in sorted(listings.keys()):
+            listing = listings[folder]
+            listing_hash = _hash(listing)
+            if previous is not None and \
+               previous.folderHash(folder) == listing_hash:
+                snapshot.setFolder(folder, listing_hash,
+                                   previous.services(folder))
+            else:
+                snapshot.setFolder(folder, listing_hash, [])
+                if isinstance(listing, list):
+                    work.extend([(folder, s) for s in listing])
+        fetched = {}
+        for record in imap(self._crawlService, work,
+                           max_workers=self._max_workers):
+            fetched.setdefault(record['folder'], []).append(record)
+        for folder, services in fetched.iteritems():
+            snapshot.setFolder(folder, snapshot.folderHash(folder), services)
+        return snapshot
+    #----------------------------------------------------------------------
+    def diff(self, previous, current=None):
+        """
+           compares two snapshots.  When current is not given the site is
+           crawled again, only re-fetching the folders that changed.
+           Inputs:
+              previous - Snapshot or path of a saved snapshot
+              current - optional Snapshot to compare with
+           Output:
+              tuple of (current snapshot, changes) where changes is a
+              dictionary with the added, removed and changed folders and
+              services (as <folder>/<name>.<type>)
+        """
+        if isinstance(previous, basestring):
+            previous = Snapshot.load(previous)
+        if current is None:
+            current = self.crawl(previous=previous)
+        return current, compare(previous, current)
+#----------------------------------------------------------------------
+def compare(previous, current):
+    """
+       returns the differences between two snapshots as a dictionary of
+       addedFolders, removedFolders, changedFolders, addedServices,
+       removedServices and changedServices
+    """
+    old_folders = set(previous.folders)
+    new_folders = set(current.folders)
+    changed = [f for f in sorted(old_folders & new_folders)
+               if previous.folderHash(f) != current.folderHash(f)]
+    old_services = dict((_serviceKey(s), s) for s in previous.services())
+    new_services = dict((_serviceKey(s), s) for s in current.services())
+    changed_services = [k for k in sorted(set(old_services) & set(new_services))
+                        if _hash(old_services[k].get('info')) != \
+                           _hash(new_services[k].get('info')) or \
+                           _hash(old_services[k].get('layers')) != \
+                           _hash(new_services[k].get('layers'))]
+    return {
+        "addedFolders" : sorted(new_folders - old_folders),
+        "removedFolders" : sorted(old_folders - new_folders),
+        "changedFolders" : changed,
+        "addedServices" : sorted(set(new_services) - set(old_services)),
+        "removedServices" : sorted(set(old_services) - set(new_services)),
+        "changedServices" : changed_services
+    }
+#----------------------------------------------------------------------
+def _serviceKey(record):
+    """ returns <name>.<type> for a service record """
+    # catalog service names already start with their folder
+    return "%s.%s" % (record['name'], record['type'])
+#----------------------------------------------------------------------
+def _dumps(value):
+    """ compact, stable JSON """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+#----------------------------------------------------------------------
+def _hash(value):
+    """ returns a hash of a JSON value """
+    return hashlib.sha1(_dumps(value)).hexdigest()
+#----------------------------------------------------------------------
+def _format(path, format):
+    """ returns the snapshot format for a path """
+    if format is not None:
+        return format.lower()
+    if os.path.splitext(path)[1].lower() in (".sqlite", ".db", ".sqlite3"):
+        return "sqlite"
+    return "jsonl"
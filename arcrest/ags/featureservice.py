@@ -1,6 +1,8 @@
 from base import BaseAGSServer
 import layer
 from filters import LayerDefinitionFilter, GeometryFilter, TimeFilter
+from ..common import codec
+from ..common import pbf
 ########################################################################
 class FeatureService(BaseAGSServer):
     """ contains information about a feature service """
@@ -273,10 +275,18 @@ class FeatureService(BaseAGSServer):
               returnCountOnly=False,
               returnZ=False,
               returnM=False,
-              outSR=None
+              outSR=None,
+              format="json"
               ):
         """
            The Query operation is performed on a feature service resource
+           Inputs:
+              format - "json" (default) or "pbf".  The service query
+                       operation only answers JSON, so for pbf each layer
+                       of the layer definitions (all the layers and tables
+                       when there are none) is queried with f=pbf and the
+                       decoded results are returned in the same layers
+                       list as the JSON response.
         """
         qurl = self._url + "/query"
         params = {"f": "json",
@@ -303,4 +313,34 @@ class FeatureService(BaseAGSServer):
         if not timeFilter is None and \
            isinstance(timeFilter, TimeFilter):
             params['time'] = timeFilter.filter
-        return self._do_get(url=qurl, param_dict=params)
\ No newline at end of file
+        if format == "pbf":
+            return self._query_pbf(params)
+        elif format != "json":
+            raise ValueError("format must be json or pbf")
+        return self._do_get(url=qurl, param_dict=params)
+    #----------------------------------------------------------------------
+    def _query_pbf(self, params):
+        """ queries each layer with f=pbf, returns the service result """
+        layerDefs = params.pop('layerDefs', None)
+        if not layerDefs:
+            param_dict = {"f" : "json"}
+            if self._token is not None:
+                param_dict["token"] = self._token
+            info = self._do_get(self._url, param_dict)
+            layerDefs = [{"layerId" : l['id']} for l in
+                         info.get('layers', []) + info.get('tables', [])]
+        params["f"] = "pbf"
+        results = []
+        for layerDef in layerDefs:
+            layer_params = dict(params)
+            layer_params["where"] = layerDef.get('where') or "1=1"
+            layer_params["outFields"] = layerDef.get('outFields') or "*"
+            data = self._do_get_bytes(url=self._url + "/%s/query" % layerDef['layerId'],
+                                      param_dict=layer_params)
+            if not pbf.is_pbf(data):
+                # errors are always returned as JSON
+                return codec.loads(data)
+            result = pbf.decode(data)
+            result['id'] = layerDef['layerId']
+            results.append(result)
+        return {"layers" : results}
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+
+.. module:: gpscheduler
+   :platform: Windows, Linux
+   :synopsis: Runs many geoprocessing jobs on a GPTask, a few at a time,
+              polled by a single thread.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import heapq
+import threading
+import collections
+from ..web.polling import Backoff
+
+DEFAULT_MAX_RUNNING = 4
+DEFAULT_RETRIES = 3
+########################################################################
+class GPJobScheduler(object):
+    """
+       Submits jobs to a GPTask from a queue of inputs, keeping at most
+       max_running jobs on the server.  One poller thread checks all the
+       running jobs, each on its own backoff schedule, and submits the
+       next input as soon as a job ends.
+       Inputs:
+          task - arcrest.ags.gpservice.GPTask the jobs are submitted to
+          max_running - most jobs running on the server at the same time
+          poll_strategy - arcrest.web.polling.Backoff giving the delays
+                          between the status checks of a job
+          fetch_results - if True, the values of the result parameters of
+                          succeeded jobs are read
+          retries - failed status checks of a job before it is given up
+          returnZ, returnM - passed to submitJob
+    """
+    _task = None
+    _max_running = None
+    _poll_strategy = None
+    _fetch_results = None
+    _retries = None
+    _returnZ = None
+    _returnM = None
+    _pending = None
+    _ids = None
+    _results = None
+    _lock = None
+    _thread = None
+    _stop = None
+    _running = None
+    #----------------------------------------------------------------------
+    def __init__(self, task, max_running=DEFAULT_MAX_RUNNING,
+                 poll_strategy=None, fetch_results=True,
+                 retries=DEFAULT_RETRIES, returnZ=False, returnM=False):
+        """Constructor"""
+        if poll_strategy is None:
+            poll_strategy = Backoff()
+        self._task = task
+        self._max_running = max(max_running, 1)
+        self._poll_strategy = poll_strategy
+        self._fetch_results = fetch_results
+        self._retries = retries
+        self._returnZ = returnZ
+        self._returnM = returnM
+        self._pending = collections.deque()
+        self._ids = set()
+        self._results = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+    #----------------------------------------------------------------------
+    def add(self, input_id, inputs):
+        """
+           queues a job
+           Inputs:
+              input_id - key of the job's result in results, must not be
+                         used by another job
+              inputs - dictionary of the job's input parameters
+           Raises ValueError when input_id is already queued, running or
+           in results.
+        """
+        with self._lock:
+            if input_id in self._ids:
+                raise ValueError("a job with the id %r was already added" %
+                                 (input_id,))
+            self._ids.add(input_id)
+            self._pending.append((input_id, inputs))
+    #----------------------------------------------------------------------
+    def add_all(self, inputs):
+        """ queues a dictionary, or an iterable of (input id, inputs) """
+        if isinstance(inputs, dict):
+            inputs = inputs.iteritems()
+        for input_id, values in inputs:
+            self.add(input_id, values)
+    #----------------------------------------------------------------------
+    @property
+    def results(self):
+        """
+           returns a dictionary of input id to the outcome of its job:
+           jobId, jobStatus, messages and results, or error when the job
+           could not be submitted or followed
+        """
+        with self._lock:
+            return dict(self._results)
+    #----------------------------------------------------------------------
+    @property
+    def pendingCount(self):
+        """ returns the number of jobs not submitted yet """
+        with self._lock:
+            return len(self._pending)
+    #----------------------------------------------------------------------
+    @property
+    def runningCount(self):
+        """ returns the number of jobs running on the server """
+        with self._lock:
+            return len(self._running)
+    #----------------------------------------------------------------------
+    def start(self):
+        """ starts the poller thread """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+    #----------------------------------------------------------------------
+    def join(self, timeout=None):
+        """
+           waits for every queued job to end
+           Inputs:
+              timeout - seconds to wait, None waits forever
+           Output:
+              True when all the jobs have ended
+        """
+        start = time.time()
+        while self._thread is not None and self._thread.is_alive():
+            # join without a timeout can not be interrupted by ctrl+c on
+            # python 2, so always wait in slices
+            wait = 0.5
+            if timeout is not None:
+                wait = min(wait, timeout - (time.time() - start))
+                if wait <= 0:
+                    return False
+            self._thread.join(wait)
+        return True
+    #----------------------------------------------------------------------
+    def run(self, inputs=None, timeout=None):
+        """
+           queues inputs, runs every queued job and waits for them
+           Inputs:
+              inputs - dictionary, or iterable of (input id, inputs)
+              timeout - seconds to wait, None waits forever
+           Output:
+              the results dictionary
+        """
+        if inputs is not None:
+            self.add_all(inputs)
+        self.start()
+        if not self.join(timeout):
+            raise RuntimeError("timed out after %s seconds" % timeout)
+        return self.results
+    #----------------------------------------------------------------------
+    def cancel(self):
+        """ stops submitting jobs and cancels the running ones """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            running = self._running.values()
+            self._running.clear()
+            # jobs never submitted can be added again
+            self._ids.difference_update(i for i, inputs in self._pending)
+            self._pending.clear()
+        for entry in running:
+            try:
+                entry['job'].cancelJob()
+            except Exception:
+                pass
+            self._finish(entry, {"jobId" : entry['jobId'],
+                                 "jobStatus" : "esriJobCancelled"})
+    #----------------------------------------------------------------------
+    def _finish(self, entry, result):
+        """ stores the outcome of a job """
+        with self._lock:
+            self._running.pop(entry['id'], None)
+            self._results[entry['id']] = result
+    #----------------------------------------------------------------------
+    def _submit(self, schedule):
+        """ submits queued inputs while fewer than max_running jobs run """
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._running) >= self._max_running or \
+                   len(self._pending) == 0:
+                    return
+                input_id, inputs = self._pending.popleft()
+            entry = {"id" : input_id, "job" : None, "errors" : 0}
+            try:
+                res = self._task.submitJob(inputs=inputs, method="AUTO",
+                                           returnZ=self._returnZ,
+                                           returnM=self._returnM)
+            except Exception, e:
+                res = {"error" : {"message" : str(e)}}
+            if not isinstance(res, dict) or not res.has_key("jobId"):
+                if not isinstance(res, dict) or not res.has_key("error"):
+                    res = {"error" : {"message" : "no jobId returned",
+                                      "response" : res}}
+                self._finish(entry, res)
+                continue
+            # the id is kept, reading it from the job could need a request
+            entry['jobId'] = res['jobId']
+            try:
+                entry['job'] = self._task.getJob(res['jobId'])
+            except Exception, e:
+                self._finish(entry, {"jobId" : res['jobId'],
+                                     "error" : {"message" : str(e)}})
+                continue
+            entry['delays'] = self._poll_strategy.delays()
+            with self._lock:
+                self._running[input_id] = entry
+            heapq.heappush(schedule,
+                           (time.time() + entry['delays'].next(), input_id))
+    #----------------------------------------------------------------------
+    def _check(self, entry):
+        """ checks a job, returns True once it has ended """
+        job = entry['job']
+        try:
+            status = job.refresh()
+        except Exception, e:
+            status = {"error" : {"message" : str(e)}}
+        if not isinstance(status, dict) or status.has_key("error"):
+            entry['errors'] += 1
+            if entry['errors'] > self._retries:
+                self._finish(entry, {"jobId" : entry['jobId'], "error" : status})
+                return True
+            return False
+        entry['errors'] = 0
+        if not job.isDone:
+            return False
+        result = {"jobId" : entry['jobId'],
+                  "jobStatus" : job.jobStatus,
+                  "messages" : job.messages,
+                  "results" : job.results}
+        if self._fetch_results and job.jobStatus == "esriJobSucceeded" and \
+           isinstance(job.results, dict):
+            values = {}
+            for name in job.results.keys():
+                try:
+                    values[name] = job.getResultValue(name)
+                except Exception, e:
+                    values[name] = {"error" : {"message" : str(e)}}
+            result['results'] = values
+        self._finish(entry, result)
+        return True
+    #----------------------------------------------------------------------
+    def _run(self):
+        """ the poller thread """
+        # (time of the next check, input id) of the running jobs
+        schedule = []
+        while not self._stop.is_set():
+            self._submit(schedule)
+            if len(schedule) == 0:
+                with self._lock:
+                    if len(self._pending) == 0 and len(self._running) == 0:
+                        return
+                continue
+            due, input_id = schedule[0]
+            wait = due - time.time()
+            if wait > 0:
+                # wakes up early when cancel() is called
+                self._stop.wait(wait)
+                continue
+            heapq.heappop(schedule)
+            with self._lock:
+                entry = self._running.get(input_id)
+            if entry is None:
+                continue
+            try:
+                ended = self._check(entry)
+            except Exception, e:
+                # one job failing does not stop the others
+                self._finish(entry, {"jobId" : entry['jobId'],
+                                     "error" : {"message" : str(e)}})
+                ended = True
+            if not ended:
+                heapq.heappush(schedule,
+                               (time.time() + entry['delays'].next(),
+                                input_id))
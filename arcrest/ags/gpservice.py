@@ -1,8 +1,21 @@
+import os
 import urllib
+import urlparse
 import json
 import time
 import datetime
+import common
 from base import BaseAGSServer
+from ..web.polling import poll
+from ..common.jsonstream import JSONArrayReader, DEFAULT_BUFFER_SIZE
+from ..common.features import FeatureSchema, compact_features
+
+# job statuses after which a GP job no longer changes
+TERMINAL_JOB_STATUSES = ("esriJobSucceeded", "esriJobFailed",
+                         "esriJobCancelled", "esriJobTimedOut")
+DEFAULT_JOB_TTL = 5
+# longest GET request url, larger submitJob requests are sent as POST
+MAX_GET_LENGTH = 2000
 
 ########################################################################
 class GPService(BaseAGSServer):
@@ -249,10 +262,13 @@ class GPTask(BaseAGSServer):
     def getJob(self, jobID):
         """ returns the results or status of a job """
         url = self._url + "/jobs/%s" % (jobID)
-        return GPJob(url=url,
-                     username=self._username,
-                     password=self._password,
-                     token_url=self._token_url)
+        job = GPJob(url=url,
+                    username=self._username,
+                    password=self._password,
+                    token_url=self._token_url)
+        if job._token is None:
+            job._token = self._token
+        return job
     #----------------------------------------------------------------------
     def submitJob(self, inputs, method="GET",
                   returnZ=False, returnM=False):
@@ -261,8 +277,9 @@ class GPTask(BaseAGSServer):
            Inputs:
               inputs - dictionary - value should be a Key/Value list of GP
                        objects that line up with the input names.
-              method - string - either GET or POST.  The way the service is
-                       submitted.
+              method - string - either GET, POST or AUTO.  The way the
+                       service is submitted, AUTO uses POST when the GET
+                       url would be longer than MAX_GET_LENGTH.
            Ouput:
               JOB ID as a string
         """
@@ -274,6 +291,10 @@ class GPTask(BaseAGSServer):
             params['token'] = self._token
         for k in inputs:
             params[k] = inputs[k]
+        if method.lower() == "auto":
+            method = "GET"
+            if len(url) + 1 + len(urllib.urlencode(params)) > MAX_GET_LENGTH:
+                method = "POST"
         if method.lower() == "get":
             return self._do_get(url=url, param_dict=params)
         elif method.lower() == "post":
@@ -286,17 +307,28 @@ class GPTask(BaseAGSServer):
 class GPJob(BaseAGSServer):
     """
        Represents an ArcGIS GeoProcessing Job
+
+       The status, messages, results and inputs are read from one snapshot
+       of the job, fetched again only once it is older than ttl seconds or
+       when refresh() is called.  The snapshot of a job that has ended
+       never expires.
     """
     _jobId = None
     _messages = None
     _results = None
     _jobStatus = None
     _inputs = None
+    _ttl = None
+    _snapshot_time = None
+    # keys of the job resource stored as properties
+    _JOB_KEYS = ("jobId", "jobStatus", "messages", "results", "inputs")
     #----------------------------------------------------------------------
     def __init__(self, url, username=None, password=None, token_url=None,
-                 initialize=False, proxy_url=None, proxy_port=None):
+                 initialize=False, proxy_url=None, proxy_port=None,
+                 ttl=DEFAULT_JOB_TTL):
         """Constructor"""
         self._url = url
+        self._ttl = ttl
         if username is not None and \
            password is not None and \
            token_url is not None:
@@ -324,21 +356,75 @@ class GPJob(BaseAGSServer):
             self.__init()
     #----------------------------------------------------------------------
     def __init(self):
-        """ initializes all the properties """
+        """ loads a snapshot of the job """
         params = {
             "f" : "json"
         }
         if self._token is not None:
             params['token'] = self._token
         json_dict = self._do_get(url=self._url, param_dict=params)
-        attributes = [attr for attr in dir(self)
-                    if not attr.startswith('__') and \
-                    not attr.startswith('_')]
         for k,v in json_dict.iteritems():
-            if k in attributes:
-                setattr(self, "_"+ k, json_dict[k])
+            if k in self._JOB_KEYS:
+                setattr(self, "_"+ k, v)
             else:
                 print k, " - attribute not implmented for GPJob."
+        self._snapshot_time = time.time()
+        return json_dict
+    #----------------------------------------------------------------------
+    def _snapshot(self):
+        """ loads a snapshot if there is none or it has expired """
+        if self._snapshot_time is None:
+            self.__init()
+        elif not self.isDone and \
+             time.time() - self._snapshot_time >= self._ttl:
+            self.__init()
+    #----------------------------------------------------------------------
+    def refresh(self):
+        """ fetches the job again, returns the job resource dictionary """
+        return self.__init()
+    #----------------------------------------------------------------------
+    @property
+    def ttl(self):
+        """ gets the seconds a snapshot of the job is used for """
+        return self._ttl
+    #----------------------------------------------------------------------
+    @ttl.setter
+    def ttl(self, value):
+        """ sets the seconds a snapshot of the job is used for """
+        self._ttl = value
+    #----------------------------------------------------------------------
+    @property
+    def isDone(self):
+        """ returns True once the job has succeeded, failed, was
+            cancelled or timed out, as of the current snapshot """
+        return self._jobStatus in TERMINAL_JOB_STATUSES
+    #----------------------------------------------------------------------
+    def wait(self, timeout=None, poll_strategy=None):
+        """
+           waits for the job to end
+           Inputs:
+              timeout - seconds to wait, a RuntimeError is raised when the
+                        job is still running after them.  None waits
+                        forever.
+              poll_strategy - arcrest.web.polling.Backoff giving the
+                              delays between status checks, exponential
+                              backoff with jitter by default
+           Output:
+              the final job status.  A RuntimeError is raised when a
+              status check returns an error, since the job's state is
+              then unknown.
+        """
+        self._snapshot()
+        if self.isDone:
+            return self._jobStatus
+        status = poll(self.refresh,
+                      lambda status: not isinstance(status, dict) or
+                      'error' in status or self.isDone,
+                      strategy=poll_strategy, timeout=timeout)
+        if not isinstance(status, dict) or 'error' in status:
+            raise RuntimeError("could not read the status of job %s: %s" %
+                               (self._url, status))
+        return self._jobStatus
     #----------------------------------------------------------------------
     def cancelJob(self):
         """ cancels the job """
@@ -347,43 +433,57 @@ class GPJob(BaseAGSServer):
         }
         if self._token is not None:
             params['token'] = self._token
-        return self._do_get(url=self._url + "/cancel", param_dict=params)
+        res = self._do_get(url=self._url + "/cancel", param_dict=params)
+        # the cached status is no longer current
+        self._snapshot_time = None
+        return res
     #----------------------------------------------------------------------
     @property
     def messages(self):
         """ returns the messages """
-        self.__init()
+        self._snapshot()
         return self._messages
     #----------------------------------------------------------------------
     @property
     def results(self):
         """ returns the results """
-        self.__init()
+        self._snapshot()
         return self._results
     #----------------------------------------------------------------------
     @property
     def jobStatus(self):
         """ returns the job status """
-        self.__init()
+        self._snapshot()
         return self._jobStatus
     #----------------------------------------------------------------------
     @property
     def jobId(self):
         """ returns the job ID """
         if self._jobId is None:
-            self.__init()
+            self._snapshot()
         return self._jobId
     #----------------------------------------------------------------------
     @property
     def inputs(self):
         """ returns the inputs of a service """
-        self.__init()
+        self._snapshot()
         return self._inputs
     #----------------------------------------------------------------------
+    def getResultValue(self, parameterName):
+        """ gets the value of a result parameter """
+        parameter = self.results[parameterName]['paramUrl']
+        paramURL = self._url + "/%s" % (parameter)
+        params = {
+            "f" : "json"
+        }
+        if self._token is not None:
+            params['token'] = self._token
+
+        return self._do_get(url=paramURL,
+                            param_dict=params)
+    #----------------------------------------------------------------------
     def getParameterValue(self, parameterName):
         """ gets a parameter value """
-        if self._inputs is None:
-            self.__init()
         parameter = self.inputs[parameterName]['paramUrl']
         paramURL = self._url + "/%s" % (parameter)
         params = {
@@ -394,9 +494,153 @@ class GPJob(BaseAGSServer):
 
         return self._do_get(url=paramURL,
                             param_dict=params)
-
-
-
+    #----------------------------------------------------------------------
+    def read_result(self, parameterName, compact=False,
+                    buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+           streams a GPRecordSet or GPFeatureRecordSetLayer result, the
+           rows are decoded one at a time while the response is read
+           instead of being loaded all at once by getResultValue.
+           Inputs:
+              parameterName - name of the result parameter
+              compact - if True, CompactFeature objects sharing one field
+                        schema are returned instead of Feature objects
+              buffer_size - bytes read from the response at a time
+           Output:
+              GPResultReader, iterate over it for the rows
+        """
+        parameter = self.results[parameterName]['paramUrl']
+        paramURL = self._url + "/%s" % (parameter)
+        params = {
+            "f" : "json"
+        }
+        if self._token is not None:
+            params['token'] = self._token
+        stream = self._do_get_stream(url=paramURL, param_dict=params)
+        return GPResultReader(stream, compact=compact, buffer_size=buffer_size)
+    #----------------------------------------------------------------------
+    def download_result(self, parameterName, out_folder, file_name=None):
+        """
+           downloads the file of a GPDataFile result straight to disk
+           Inputs:
+              parameterName - name of the result parameter
+              out_folder - folder the file is saved in
+              file_name - name of the saved file, by default the name of
+                          the file on the server
+           Output:
+              path of the saved file, False if the download failed or the
+              response of the service on errors
+        """
+        value = self.getResultValue(parameterName)
+        if not isinstance(value, dict) or 'error' in value:
+            return value
+        data_file = value.get('value')
+        if not isinstance(data_file, dict) or not 'url' in data_file:
+            raise ValueError("%s is not a GPDataFile result" % parameterName)
+        url = urlparse.urljoin(self._url, data_file['url'])
+        if file_name is None:
+            file_name = os.path.basename(urlparse.urlparse(url).path)
+        if os.path.isdir(out_folder) == False:
+            os.makedirs(out_folder)
+        params = None
+        if self._token is not None:
+            params = {"token" : self._token}
+        return self._download_file(url=url,
+                                   save_path=out_folder,
+                                   file_name=file_name,
+                                   param_dict=params)
+########################################################################
+class GPResultReader(object):
+    """
+       Iterates over the rows of a GPRecordSet or GPFeatureRecordSetLayer
+       parameter while its JSON streams in, so results of any size can be
+       read.  The members next to the rows (fields, geometryType...) are
+       read before the first row.  The response is closed once all the
+       rows have been read, or by close().
+       Inputs:
+          stream - file like object with the parameter's JSON, ie: from
+                   Transport.get_stream
+          compact - if True, CompactFeature objects sharing one field
+                    schema are returned instead of Feature objects
+          buffer_size - bytes read from the stream at a time
+    """
+    _stream = None
+    _reader = None
+    _compact = None
+    #----------------------------------------------------------------------
+    def __init__(self, stream, compact=False, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Constructor"""
+        self._stream = stream
+        self._reader = JSONArrayReader(stream, ("value", "features"),
+                                       buffer_size=buffer_size)
+        self._compact = compact
+    #----------------------------------------------------------------------
+    @property
+    def header(self):
+        """ returns the parameter's JSON without the rows """
+        return self._reader.read_header()
+    #----------------------------------------------------------------------
+    @property
+    def paramName(self):
+        """ returns the name of the parameter """
+        return self.header.get('paramName')
+    #----------------------------------------------------------------------
+    @property
+    def dataType(self):
+        """ returns the data type of the parameter """
+        return self.header.get('dataType')
+    #----------------------------------------------------------------------
+    @property
+    def error(self):
+        """ returns the error returned by the service, or None """
+        return self.header.get('error')
+    #----------------------------------------------------------------------
+    @property
+    def value(self):
+        """ returns the record set without its rows: fields,
+            geometryType, spatialReference... """
+        value = self.header.get('value')
+        if not isinstance(value, dict):
+            return {}
+        return value
+    #----------------------------------------------------------------------
+    @property
+    def fields(self):
+        """ returns the fields of the record set """
+        return self.value.get('fields')
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        """ yields Feature or CompactFeature objects """
+        value = self.value
+        schema = None
+        if self._compact and value.get('fields'):
+            schema = FeatureSchema(fields=[f['name'] for f in value['fields']],
+                                   geometryType=value.get('geometryType'),
+                                   spatialReference=value.get('spatialReference'))
+        try:
+            for feature in self._reader:
+                if self._compact:
+                    feature = compact_features([feature], schema=schema,
+                                               geometryType=value.get('geometryType'),
+                                               spatialReference=value.get('spatialReference'))[0]
+                    schema = feature.schema
+                    yield feature
+                else:
+                    yield common.Feature(feature)
+        finally:
+            self.close()
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the response """
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 ########################################################################
 class GPString(object):
     """string object"""
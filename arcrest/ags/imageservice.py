@@ -1,4 +1,7 @@
 from base import BaseAGSServer
+from tileseeder import TileSeeder, DEFAULT_CHECKPOINT_EVERY, \
+     DEFAULT_REPORT_EVERY
+from ..web.workerpool import DEFAULT_MAX_WORKERS
 
 ########################################################################
 class ImageService(BaseAGSServer):
@@ -383,4 +386,43 @@ class ImageService(BaseAGSServer):
     def supportsAdvancedQueries(self):
         if self._supportsAdvancedQueries is None:
             self.__init()
-        return self._supportsAdvancedQueries
\ No newline at end of file
+        return self._supportsAdvancedQueries
+    #----------------------------------------------------------------------
+    def tile_seeder(self, cache_path, aoi=None, min_level=None,
+                    max_level=None, source=None, tile_info=None,
+                    export_params=None, max_workers=DEFAULT_MAX_WORKERS,
+                    checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                    report_every=DEFAULT_REPORT_EVERY, callback=None):
+        """
+           returns a TileSeeder filling a local tile cache with the tiles
+           of the service over an area of interest.  Call run() on it to
+           seed, and run() again to resume after an interruption.  When
+           the service is not cached, each tile is drawn with exportImage.
+           Inputs:
+              cache_path - SQLite file the tiles are saved to
+              aoi - Polygon, Envelope or dictionary in the spatial
+                    reference of the tiling scheme, the full extent by
+                    default
+              min_level, max_level - levels seeded, all by default
+              source - "tiles" or "export", chosen from
+                       singleFusedMapCache by default
+              tile_info - tiling scheme of exported tiles, the web
+                          mercator scheme when the service has none
+              export_params - extra parameters of exportImage
+              max_workers - tiles downloaded at the same time
+              checkpoint_every - tiles between two checkpoints
+              report_every - seconds between two calls to callback
+              callback - optional function called with the progress
+                         (tiles, bytes, tilesPerSecond, bytesPerSecond...)
+        """
+        return TileSeeder(self, cache_path, aoi=aoi,
+                          min_level=min_level,
+                          max_level=max_level,
+                          source=source,
+                          tile_info=tile_info,
+                          export_operation="exportImage",
+                          export_params=export_params,
+                          max_workers=max_workers,
+                          checkpoint_every=checkpoint_every,
+                          report_every=report_every,
+                          callback=callback)
@@ -1,4 +1,7 @@
 from base import BaseAGSServer
+from ..web.paging import OIDPager
+from ..web.workerpool import DEFAULT_MAX_WORKERS
+from ..common.columnar import to_columns
 import json
 import base
 ########################################################################
@@ -311,6 +314,72 @@ class FeatureLayer(BaseAGSServer):
         if self._useStandardizedQueries is None:
             self.__init()
         return self._useStandardizedQueries
+    #----------------------------------------------------------------------
+    def query_columns(self,
+                      where="1=1",
+                      out_fields="*",
+                      returnGeometry=True,
+                      page_size=None,
+                      max_workers=DEFAULT_MAX_WORKERS,
+                      use_numpy=True):
+        """
+           queries the layer and returns the records as columns
+           Inputs:
+              where - the selection sql statement
+              out_fields - the attribute fields to return
+              returnGeometry - true means a geometry will be returned,
+                               else just the attributes
+              page_size - records in each page, defaults to the layer's
+                          maxRecordCount
+              max_workers - number of pages queried at the same time
+              use_numpy - if True and NumPy is installed, the columns are
+                          NumPy arrays typed from the layer's fields
+                          (dates as datetime64[ms]), else lists
+           Output:
+              dictionary of field name to column.  Point geometries are
+              returned as x and y float64 columns.
+        """
+        qURL = self._url + "/query"
+        params = {
+            "f" : "json",
+            "where" : where,
+            "returnIdsOnly" : True
+        }
+        if self._token is not None:
+            params['token'] = self._token
+        res = self._do_get(qURL, params)
+        if 'error' in res:
+            raise ValueError(res)
+        if page_size is None:
+            page_size = self.maxRecordCount
+        def fetch(sql):
+            params = {
+                "f" : "json",
+                "where" : sql,
+                "outFields" : out_fields,
+                "returnGeometry" : returnGeometry
+            }
+            if self._token is not None:
+                params['token'] = self._token
+            page = self._do_get(qURL, params)
+            if 'error' in page:
+                raise ValueError(page)
+            return page
+        pages = OIDPager(url=self._url,
+                         fetch=fetch,
+                         oid_field=res['objectIdFieldName'],
+                         oids=res['objectIds'],
+                         where=where,
+                         page_size=page_size,
+                         max_workers=max_workers)
+        geometryType = None
+        if returnGeometry:
+            geometryType = self.geometryType
+        return to_columns(pages=pages,
+                          fields=self.fields,
+                          out_fields=out_fields,
+                          geometryType=geometryType,
+                          use_numpy=use_numpy)
 ########################################################################
 class GroupLayer(FeatureLayer):
     """ represents a group layer  """
@@ -0,0 +1,359 @@
+"""
+
+.. module:: tileseeder
+   :platform: Windows, Linux
+   :synopsis: Fills a local tile cache with the tiles of a map or image
+              service over an area of interest, and can resume where an
+              interrupted run stopped.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import time
+import urllib
+import hashlib
+import itertools
+import threading
+from ..common.tilegrid import TileGrid, web_mercator_tile_info
+from ..common.tilecache import TileCache
+from ..web.tiles import TileFetcher, DEFAULT_RETRIES
+from ..web.workerpool import DEFAULT_MAX_WORKERS
+
+# tiles processed between two checkpoints
+DEFAULT_CHECKPOINT_EVERY = 1000
+# seconds between two calls to the progress callback
+DEFAULT_REPORT_EVERY = 10
+# failed tiles in a row after which the run is given up
+DEFAULT_MAX_FAILURES = 100
+_CHECKPOINT_KEY = "seed_checkpoint"
+# tileInfo format to export format
+_EXPORT_FORMATS = {"jpeg" : "jpg", "mixed" : "png", "lerc" : "png"}
+########################################################################
+class ExportTileFetcher(TileFetcher):
+    """
+       TileFetcher drawing each tile with the export (map service) or
+       exportImage (image service) operation, for services without a
+       cache.  The tile's envelope is requested at the tile size of the
+       scheme.
+       Inputs:
+          grid - arcrest.common.tilegrid.TileGrid of the tiles
+          operation - "export" or "exportImage"
+          export_params - optional extra parameters of the operation,
+                          ie: layers, transparent
+          For the other inputs, see TileFetcher.  param_dict is added to
+          the export parameters.
+    """
+    _grid = None
+    _operation = None
+    _export_params = None
+    #----------------------------------------------------------------------
+    def __init__(self, urls, grid, operation="export", export_params=None,
+                 param_dict=None, **kwargs):
+        """Constructor"""
+        TileFetcher.__init__(self, urls, **kwargs)
+        self._grid = grid
+        self._operation = operation
+        sr = json.dumps(grid.spatialReference or {"wkid" : 102100})
+        image_format = (grid.format or "png").lower()
+        params = {"f" : "image",
+                  "size" : "%s,%s" % grid.tileSize,
+                  "bboxSR" : sr,
+                  "imageSR" : sr,
+                  "format" : _EXPORT_FORMATS.get(image_format, image_format)}
+        if operation == "export":
+            params['dpi'] = grid.dpi
+        if param_dict:
+            params.update(param_dict)
+        if export_params:
+            params.update(export_params)
+        self._export_params = params
+    #----------------------------------------------------------------------
+    def tile_url(self, level, row, col):
+        """ returns the export url of a tile on the next server """
+        url = self._urls[self._counter.next() % len(self._urls)]
+        params = dict(self._export_params)
+        params['bbox'] = "%r,%r,%r,%r" % self._grid.tile_extent(level, row, col)
+        return "%s/%s?%s" % (url, self._operation, urllib.urlencode(params))
+########################################################################
+class TileSeeder(object):
+    """
+       Downloads every tile of a level range touching an area of interest
+       into a TileCache, several at a time.  Cached services are read
+       through their tile endpoint, other services are drawn tile by tile
+       with export/exportImage.
+       Every checkpoint_every tiles the position reached is saved in the
+       cache's metadata table, in the same transaction as the tiles, so a
+       run stopped by a crash or stop() continues from there when run
+       again with resume=True.  Tiles that failed are retried first.
+       Inputs:
+          service - arcrest.ags.mapservice.MapService or
+                    arcrest.ags.imageservice.ImageService
+          cache_path - SQLite file the tiles are saved to (MBTiles layout)
+          aoi - area of interest in the spatial reference of the tiling
+                scheme: a Polygon or Envelope, or its dictionary, the full
+                extent of the service by default
+          min_level, max_level - levels seeded, bounds included, all the
+                                 levels by default
+          source - "tiles" or "export", by default tiles when the service
+                   has a single fused map cache
+          tile_info - tiling scheme used to export tiles, the service's
+                      tileInfo or else the web mercator scheme by default
+          export_operation - "export" or "exportImage"
+          export_params - extra parameters of the export operation
+          max_workers - tiles downloaded at the same time
+          retries - attempts made again after a network error or a 5xx
+          checkpoint_every - tiles between two checkpoints
+          report_every - seconds between two calls to callback
+          callback - optional function called with progress
+          max_failures - failed tiles in a row after which run stops
+    """
+    _service = None
+    _cache_path = None
+    _grid = None
+    _tile_info = None
+    _rings = None
+    _levels = None
+    _source = None
+    _export_operation = None
+    _export_params = None
+    _max_workers = None
+    _retries = None
+    _checkpoint_every = None
+    _report_every = None
+    _callback = None
+    _max_failures = None
+    _stop = None
+    _progress = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, service, cache_path, aoi=None, min_level=None,
+                 max_level=None, source=None, tile_info=None,
+                 export_operation="export", export_params=None,
+                 max_workers=DEFAULT_MAX_WORKERS, retries=DEFAULT_RETRIES,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                 report_every=DEFAULT_REPORT_EVERY, callback=None,
+                 max_failures=DEFAULT_MAX_FAILURES):
+        """Constructor"""
+        if source is None:
+            if service.singleFusedMapCache and service.tileInfo:
+                source = "tiles"
+            else:
+                source = "export"
+        if source not in ("tiles", "export"):
+            raise ValueError("source must be tiles or export")
+        if tile_info is None:
+            tile_info = service.tileInfo
+            if tile_info is None:
+                if source == "tiles":
+                    raise ValueError("the service has no tileInfo")
+                tile_info = web_mercator_tile_info()
+        if aoi is None:
+            aoi = service.fullExtent
+        self._service = service
+        self._cache_path = cache_path
+        self._grid = TileGrid(tile_info)
+        self._tile_info = tile_info
+        self._rings = _aoi_rings(aoi)
+        self._levels = [level for level in self._grid.levels
+                        if (min_level is None or level >= min_level) and
+                        (max_level is None or level <= max_level)]
+        self._source = source
+        self._export_operation = export_operation
+        self._export_params = export_params
+        self._max_workers = max_workers
+        self._retries = retries
+        self._checkpoint_every = max(checkpoint_every, 1)
+        self._report_every = report_every
+        self._callback = callback
+        self._max_failures = max_failures
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = {}
+    #----------------------------------------------------------------------
+    @property
+    def source(self):
+        """ returns where the tiles come from, tiles or export """
+        return self._source
+    #----------------------------------------------------------------------
+    @property
+    def tileGrid(self):
+        """ returns the TileGrid of the seeded tiles """
+        return self._grid
+    #----------------------------------------------------------------------
+    @property
+    def levels(self):
+        """ returns the levels seeded """
+        return list(self._levels)
+    #----------------------------------------------------------------------
+    def count(self):
+        """ returns the number of tiles touching the area of interest """
+        return sum(1 for tile in self._grid.polygon_tiles(self._rings,
+                                                          self._levels))
+    #----------------------------------------------------------------------
+    @property
+    def progress(self):
+        """
+           returns the progress of the current or last run: tiles handled,
+           downloaded (new or changed), cached (already in the cache),
+           missing (not on the server), failed, bytes downloaded,
+           seconds elapsed, tilesPerSecond, bytesPerSecond and the
+           position (level, row, col) reached
+        """
+        with self._lock:
+            return dict(self._progress)
+    #----------------------------------------------------------------------
+    def stop(self):
+        """ asks a run to stop at the next tile, after a checkpoint """
+        self._stop.set()
+    #----------------------------------------------------------------------
+    def _fingerprint(self):
+        """ identifies the job, a checkpoint of another job is ignored """
+        job = {"url" : self._service.url,
+               "source" : self._source,
+               "levels" : self._levels,
+               "rings" : self._rings,
+               "tileInfo" : self._tile_info,
+               "exportParams" : self._export_params}
+        return hashlib.md5(json.dumps(job, sort_keys=True,
+                                      default=str)).hexdigest()
+    #----------------------------------------------------------------------
+    def _fetcher(self, cache):
+        """ returns the TileFetcher of the service """
+        service = self._service
+        param_dict = None
+        if service._token is not None:
+            param_dict = {"token" : service._token}
+        options = {"cache" : cache,
+                   "param_dict" : param_dict,
+                   "max_workers" : self._max_workers,
+                   "retries" : self._retries,
+                   "transport" : service._get_transport(),
+                   "proxy_url" : service.proxy_url,
+                   "proxy_port" : service.proxy_port}
+        if self._source == "tiles":
+            return TileFetcher([service.url], **options)
+        return ExportTileFetcher([service.url], self._grid,
+                                 operation=self._export_operation,
+                                 export_params=self._export_params,
+                                 **options)
+    #----------------------------------------------------------------------
+    def run(self, resume=True):
+        """
+           seeds the cache, returns progress once every tile was handled
+           or stop() was called
+           Inputs:
+              resume - if True, continues from the checkpoint of an
+                       earlier run of the same job, otherwise starts over
+        """
+        self._stop.clear()
+        fingerprint = self._fingerprint()
+        metadata = {"name" : self._service.url,
+                    "format" : (self._grid.format or "png").lower()}
+        if len(self._levels) > 0:
+            metadata['minzoom'] = self._levels[0]
+            metadata['maxzoom'] = self._levels[-1]
+        cache = TileCache(self._cache_path, metadata=metadata)
+        results = None
+        try:
+            start = None
+            retry = []
+            checkpoint = None
+            if resume:
+                checkpoint = cache.metadata.get(_CHECKPOINT_KEY)
+            if checkpoint is not None:
+                checkpoint = json.loads(checkpoint)
+                if checkpoint.get('fingerprint') == fingerprint:
+                    if checkpoint.get('position') is not None:
+                        start = tuple(checkpoint['position'])
+                    retry = [tuple(tile) for tile in checkpoint.get('failed', [])]
+            fetcher = self._fetcher(cache)
+            tiles = itertools.chain(
+                retry, self._grid.polygon_tiles(self._rings, self._levels,
+                                                start=start))
+            failed = []
+            position = start
+            started = time.time()
+            reported = started
+            handled = 0
+            in_a_row = 0
+            counts = {"downloaded" : 0, "cached" : 0, "missing" : 0}
+            self._report(fetcher, started, handled, counts, failed, position)
+            results = fetcher.fetch_many(tiles)
+            for level, row, col, data, error in results:
+                tile = (level, row, col)
+                handled += 1
+                if position is None or tile > position:
+                    position = tile
+                if error is not None:
+                    failed.append(tile)
+                    in_a_row += 1
+                else:
+                    in_a_row = 0
+                    if data is None:
+                        counts['missing'] += 1
+                stats = fetcher.stats
+                counts['downloaded'] = stats['downloaded']
+                counts['cached'] = stats['hits'] + stats['revalidated']
+                self._report(fetcher, started, handled, counts, failed,
+                             position)
+                if in_a_row > self._max_failures:
+                    self._checkpoint(cache, fingerprint, position, failed)
+                    raise error
+                if handled % self._checkpoint_every == 0:
+                    self._checkpoint(cache, fingerprint, position, failed)
+                now = time.time()
+                if self._callback is not None and \
+                   now - reported >= self._report_every:
+                    reported = now
+                    self._callback(self.progress)
+                if self._stop.is_set():
+                    break
+            self._checkpoint(cache, fingerprint, position, failed)
+            if self._callback is not None:
+                self._callback(self.progress)
+            return self.progress
+        finally:
+            if results is not None:
+                # waits for the fetches in flight, they write to the cache
+                results.close()
+            cache.close()
+    #----------------------------------------------------------------------
+    def _checkpoint(self, cache, fingerprint, position, failed):
+        """ saves the position reached with the tiles written so far """
+        cache.set_metadata({_CHECKPOINT_KEY : json.dumps(
+            {"fingerprint" : fingerprint,
+             "position" : position,
+             "failed" : failed})})
+    #----------------------------------------------------------------------
+    def _report(self, fetcher, started, handled, counts, failed, position):
+        """ updates progress """
+        elapsed = time.time() - started
+        size = fetcher.stats['bytes']
+        progress = {"tiles" : handled,
+                    "failed" : len(failed),
+                    "bytes" : size,
+                    "elapsed" : elapsed,
+                    "tilesPerSecond" : handled / elapsed if elapsed > 0 else 0.0,
+                    "bytesPerSecond" : size / elapsed if elapsed > 0 else 0.0,
+                    "position" : position}
+        progress.update(counts)
+        with self._lock:
+            self._progress = progress
+#----------------------------------------------------------------------
+def _aoi_rings(aoi):
+    """ returns the rings of an area of interest """
+    if hasattr(aoi, "asDictionary"):
+        aoi = aoi.asDictionary
+    if isinstance(aoi, basestring):
+        aoi = json.loads(aoi)
+    if isinstance(aoi, dict) and aoi.has_key("rings"):
+        return [[[float(v) for v in point[:2]] for point in ring]
+                for ring in aoi['rings']]
+    if isinstance(aoi, dict) and aoi.has_key("xmin"):
+        xmin, ymin = float(aoi['xmin']), float(aoi['ymin'])
+        xmax, ymax = float(aoi['xmax']), float(aoi['ymax'])
+        return [[[xmin, ymin], [xmin, ymax], [xmax, ymax],
+                 [xmax, ymin], [xmin, ymin]]]
+    raise ValueError("aoi must be a polygon or an envelope")
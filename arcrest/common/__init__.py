@@ -0,0 +1,13 @@
+""" package contructor
+.. moduleauthor:: Esri
+
+"""
+import codec
+import columnar
+import features
+import pbf
+import syncindex
+import replicastore
+import jsonstream
+import tilegrid
+import tilecache
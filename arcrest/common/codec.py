@@ -0,0 +1,212 @@
+"""
+
+.. module:: codec
+   :platform: Windows, Linux
+   :synopsis: JSON encoding and decoding.  Uses simplejson (or ujson when
+              selected) when installed, else the standard library json
+              module, and converts unicode strings to utf-8 while the
+              response is parsed.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import itertools
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# backend name -> module.  ujson is never picked automatically because it
+# can not report hooks and older releases round floats when encoding
+_BACKENDS = {"json" : json}
+if simplejson is not None:
+    _BACKENDS["simplejson"] = simplejson
+if ujson is not None:
+    _BACKENDS["ujson"] = ujson
+if simplejson is not None:
+    _backend = "simplejson"
+else:
+    _backend = "json"
+# largest number of distinct keys kept in the key cache
+_MAX_KEYS = 20000
+_keys = {}
+# types of the values of lists that never need a conversion
+_NUMBERS = frozenset([int, long, float, bool, type(None)])
+_LISTS = frozenset([list])
+# deepest nesting checked by _numbers_only, coordinates of a polygon
+# are three lists deep
+_MAX_DEPTH = 6
+#----------------------------------------------------------------------
+def backends():
+    """ returns the names of the installed JSON libraries """
+    return sorted(_BACKENDS.keys())
+#----------------------------------------------------------------------
+def get_backend():
+    """ returns the name of the JSON library in use """
+    return _backend
+#----------------------------------------------------------------------
+def set_backend(name):
+    """
+       selects the JSON library used to encode and decode
+       Inputs:
+          name - "json", "simplejson" or "ujson"
+    """
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError("JSON library %s is not installed" % name)
+    _backend = name
+#----------------------------------------------------------------------
+def intern_key(key):
+    """
+       returns the shared copy of a field name, so the records of a
+       result set all reference one string per field
+    """
+    if isinstance(key, str):
+        if len(key) < 64:
+            return intern(key)
+        return key
+    return _key(key)
+#----------------------------------------------------------------------
+def _key(key):
+    """ returns the utf-8 str of a key, reusing one object per key """
+    try:
+        return _keys[key]
+    except KeyError:
+        value = key.encode('utf-8')
+        if isinstance(value, str) and len(value) < 64:
+            value = intern(value)
+        if len(_keys) < _MAX_KEYS:
+            _keys[key] = value
+        return value
+#----------------------------------------------------------------------
+def _numbers_only(value):
+    """
+       returns True when a list and the lists nested in it hold only
+       numbers, booleans and nulls, ie: coordinates.  The types are
+       gathered one nesting level at a time by map and chain, without a
+       python loop over the items.
+    """
+    items = value
+    for depth in xrange(_MAX_DEPTH):
+        kinds = set(map(type, items))
+        if kinds <= _NUMBERS:
+            return True
+        if kinds != _LISTS:
+            return False
+        items = list(itertools.chain.from_iterable(items))
+    return False
+#----------------------------------------------------------------------
+def _convert_list(value):
+    """
+       converts the strings of a list and of the lists nested in it.  The
+       dictionaries it holds were already converted by _pairs_hook.
+    """
+    if _numbers_only(value):
+        return value
+    for i, item in enumerate(value):
+        if isinstance(item, unicode):
+            value[i] = item.encode('utf-8')
+        elif isinstance(item, list):
+            _convert_list(item)
+    return value
+#----------------------------------------------------------------------
+def _pairs_hook(pairs):
+    """ object_pairs_hook that converts the keys and string values """
+    result = {}
+    for key, value in pairs:
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif isinstance(value, list):
+            value = _convert_list(value)
+        result[intern_key(key)] = value
+    return result
+#----------------------------------------------------------------------
+def loads(data, convert_unicode=True):
+    """
+       parses a JSON string
+       Inputs:
+          data - JSON string
+          convert_unicode - if True, all the keys and string values are
+                            returned as utf-8 encoded str objects, the
+                            conversion is done while the string is parsed.
+                            If False, strings are returned as unicode.
+    """
+    backend = _BACKENDS[_backend]
+    if not convert_unicode:
+        return backend.loads(data)
+    if backend is ujson:
+        # ujson has no hooks, the result is converted once it is decoded
+        result = convert(backend.loads(data))
+    else:
+        result = backend.loads(data, object_pairs_hook=_pairs_hook)
+    if isinstance(result, unicode):
+        return result.encode('utf-8')
+    elif isinstance(result, list):
+        return _convert_list(result)
+    return result
+#----------------------------------------------------------------------
+def raw_decoder(convert_unicode=True):
+    """
+       returns a function decode(data, index) parsing the JSON value that
+       starts at data[index], which returns the value and the index after
+       it.  Used to read values one at a time from a larger document.
+       Inputs:
+          convert_unicode - see loads
+    """
+    backend = _BACKENDS[_backend]
+    if backend is ujson:
+        # ujson can not parse part of a string
+        backend = simplejson or json
+    if not convert_unicode:
+        return backend.JSONDecoder().raw_decode
+    raw_decode = backend.JSONDecoder(object_pairs_hook=_pairs_hook).raw_decode
+    def decode(data, index=0):
+        value, end = raw_decode(data, index)
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif isinstance(value, list):
+            value = _convert_list(value)
+        return value, end
+    return decode
+#----------------------------------------------------------------------
+def dumps(obj, default=None, compact=False):
+    """
+       converts an object to a JSON string
+       Inputs:
+          obj - object to convert
+          default - function returning a serializable version of objects
+                    the library can not convert (ie: datetime)
+          compact - if True, no spaces are written after separators
+    """
+    backend = _BACKENDS[_backend]
+    if backend is ujson:
+        try:
+            return ujson.dumps(obj, double_precision=15)
+        except (TypeError, OverflowError):
+            # objects that need the default function
+            backend = simplejson or json
+    kwargs = {}
+    if default is not None:
+        kwargs['default'] = default
+    if compact:
+        kwargs['separators'] = (',', ':')
+    return backend.dumps(obj, **kwargs)
+#----------------------------------------------------------------------
+def convert(obj):
+    """ converts the unicode strings of decoded JSON to utf-8 str """
+    if isinstance(obj, dict):
+        return dict((intern_key(k) if isinstance(k, basestring) else k,
+                     convert(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return [convert(element) for element in obj]
+    elif isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    else:
+        return obj
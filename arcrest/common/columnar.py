@@ -0,0 +1,236 @@
+"""
+
+.. module:: columnar
+   :platform: Windows, Linux
+   :synopsis: Builds per-field columns (NumPy arrays when NumPy is
+              installed) from pages of query results.
+
+.. moduleauthor:: Esri
+
+
+"""
+import array
+import datetime
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# esri field type -> NumPy dtype of the column
+FIELD_DTYPES = {
+    "esriFieldTypeOID" : "int64",
+    "esriFieldTypeSmallInteger" : "int16",
+    "esriFieldTypeInteger" : "int32",
+    "esriFieldTypeSingle" : "float32",
+    "esriFieldTypeDouble" : "float64",
+    "esriFieldTypeDate" : "datetime64[ms]",
+}
+_EPOCH = datetime.datetime(1970, 1, 1)
+_NAN = float("nan")
+########################################################################
+class _Column(object):
+    """ values of a single field collected page by page """
+    name = None
+    dtype = None
+    values = None
+    hasNulls = False
+    #----------------------------------------------------------------------
+    def __init__(self, name, dtype):
+        """Constructor"""
+        self.name = name
+        self.dtype = dtype
+        self.hasNulls = False
+        if dtype is None:
+            self.values = []
+        else:
+            # numbers and dates (epoch milliseconds) are kept as doubles,
+            # which hold any integer up to 2**53 exactly
+            self.values = array.array('d')
+    #----------------------------------------------------------------------
+    def append(self, value):
+        """ adds a value to the column """
+        if self.dtype is None:
+            self.values.append(value)
+        elif value is None:
+            self.hasNulls = True
+            self.values.append(_NAN)
+        else:
+            self.values.append(value)
+    #----------------------------------------------------------------------
+    def asArray(self):
+        """ returns the column as a NumPy array """
+        if self.dtype is None:
+            values = numpy.empty(len(self.values), dtype=object)
+            values[:] = self.values
+            return values
+        values = numpy.frombuffer(self.values, dtype="float64")
+        if self.dtype == "datetime64[ms]":
+            nulls = numpy.isnan(values)
+            dates = numpy.where(nulls, 0, values).astype("int64")
+            dates = dates.astype("datetime64[ms]")
+            if self.hasNulls:
+                dates[nulls] = numpy.datetime64("NaT")
+            return dates
+        if self.hasNulls and self.dtype.startswith("int"):
+            # integers with nulls become floats holding NaN
+            return values.copy()
+        return values.astype(self.dtype)
+    #----------------------------------------------------------------------
+    def asList(self):
+        """ returns the column as a list """
+        if self.dtype is None:
+            return self.values
+        if self.dtype == "datetime64[ms]":
+            return [None if v != v else
+                    _EPOCH + datetime.timedelta(milliseconds=v)
+                    for v in self.values]
+        if self.dtype.startswith("int"):
+            return [None if v != v else int(v) for v in self.values]
+        return [None if v != v else v for v in self.values]
+########################################################################
+class ColumnBuilder(object):
+    """
+       Collects query results into one column per field.  Numeric and
+       date fields are stored in compact arrays while the pages are added,
+       so the features never have to be kept in memory.
+       Inputs:
+          fields - the layer's fields metadata (list of dictionaries with
+                   name and type)
+          out_fields - comma delimited field names or "*"
+          geometryType - the layer's geometry type.  Points are stored in
+                         x and y columns, other geometries are kept as
+                         dictionaries in a geometry column.
+          use_numpy - if True and NumPy is installed, finish() returns
+                      NumPy arrays, else lists
+    """
+    _columns = None
+    _lookup = None
+    _geometryType = None
+    _x = None
+    _y = None
+    _geometry = None
+    _xName = None
+    _yName = None
+    _use_numpy = None
+    _count = 0
+    #----------------------------------------------------------------------
+    def __init__(self, fields, out_fields="*", geometryType=None,
+                 use_numpy=True):
+        """Constructor"""
+        wanted = None
+        if out_fields is not None and out_fields.strip() != "*":
+            wanted = [f.strip().lower() for f in out_fields.split(",")]
+        self._columns = []
+        self._lookup = {}
+        for field in fields or []:
+            if field.get('type') == "esriFieldTypeGeometry":
+                continue
+            if wanted is not None and field['name'].lower() not in wanted:
+                continue
+            column = _Column(field['name'], FIELD_DTYPES.get(field.get('type')))
+            self._columns.append(column)
+            self._lookup[field['name'].lower()] = column
+        self._geometryType = geometryType
+        self._use_numpy = use_numpy and numpy is not None
+        self._count = 0
+        self._xName, self._yName = "x", "y"
+        if "x" in self._lookup or "y" in self._lookup:
+            self._xName, self._yName = "SHAPE@X", "SHAPE@Y"
+    #----------------------------------------------------------------------
+    @property
+    def count(self):
+        """ returns the number of records added """
+        return self._count
+    #----------------------------------------------------------------------
+    def addFeatures(self, features):
+        """ adds a list of features (JSON dictionaries) """
+        columns = self._columns
+        for feature in features:
+            attributes = feature.get('attributes', {})
+            if len(attributes) != len(columns) or \
+               any(c.name not in attributes for c in columns):
+                # field names in the response may differ in case
+                attributes = dict((k.lower(), v) for k, v in attributes.iteritems())
+                for column in columns:
+                    column.append(attributes.get(column.name.lower()))
+            else:
+                for column in columns:
+                    column.append(attributes[column.name])
+            if 'geometry' in feature:
+                self._addGeometry(feature['geometry'])
+            elif self._geometryType is not None or \
+                 self._x is not None or self._geometry is not None:
+                # keeps the geometry column in step with the attributes
+                self._addGeometry(None)
+            self._count += 1
+    #----------------------------------------------------------------------
+    def addPage(self, page):
+        """ adds the features of a query result """
+        self.addFeatures(page.get('features', []))
+    #----------------------------------------------------------------------
+    def _addGeometry(self, geometry):
+        """ stores the geometry of a feature """
+        if self._geometryType == "esriGeometryPoint":
+            if self._x is None:
+                self._x = array.array('d', [_NAN] * self._count)
+                self._y = array.array('d', [_NAN] * self._count)
+            if geometry is None or geometry.get('x') is None:
+                self._x.append(_NAN)
+                self._y.append(_NAN)
+            else:
+                self._x.append(geometry['x'])
+                self._y.append(geometry['y'])
+        else:
+            if self._geometry is None:
+                self._geometry = [None] * self._count
+            self._geometry.append(geometry)
+    #----------------------------------------------------------------------
+    def finish(self):
+        """
+           returns a dictionary of field name to column.  Point
+           geometries are returned as x and y float64 columns (SHAPE@X and
+           SHAPE@Y if the layer has fields named x or y), other geometries
+           as a geometry column.
+        """
+        result = {}
+        for column in self._columns:
+            if self._use_numpy:
+                result[column.name] = column.asArray()
+            else:
+                result[column.name] = column.asList()
+        if self._x is not None:
+            if self._use_numpy:
+                result[self._xName] = numpy.frombuffer(self._x, dtype="float64")
+                result[self._yName] = numpy.frombuffer(self._y, dtype="float64")
+            else:
+                result[self._xName] = list(self._x)
+                result[self._yName] = list(self._y)
+        elif self._geometry is not None:
+            if self._use_numpy:
+                geometry = numpy.empty(len(self._geometry), dtype=object)
+                geometry[:] = self._geometry
+                result['geometry'] = geometry
+            else:
+                result['geometry'] = self._geometry
+        return result
+#----------------------------------------------------------------------
+def to_columns(pages, fields, out_fields="*", geometryType=None,
+               use_numpy=True):
+    """
+       builds columns from an iterable of query results
+       Inputs:
+          pages - query results (dictionaries with a features list)
+          fields - the layer's fields metadata
+          out_fields - comma delimited field names or "*"
+          geometryType - the layer's geometry type
+          use_numpy - return NumPy arrays when NumPy is installed
+       Output:
+          dictionary of field name to column
+    """
+    builder = ColumnBuilder(fields=fields, out_fields=out_fields,
+                            geometryType=geometryType,
+                            use_numpy=use_numpy)
+    for page in pages:
+        builder.addPage(page)
+        del page
+    return builder.finish()
@@ -0,0 +1,227 @@
+"""
+
+.. module:: features
+   :platform: Windows, Linux
+   :synopsis: Compact feature objects that share one field schema across
+              a result set.
+
+.. moduleauthor:: Esri
+
+
+"""
+import codec
+
+_SHAPE_NAMES = ('SHAPE', 'SHAPE@', 'GEOMETRY')
+########################################################################
+class FeatureSchema(object):
+    """
+       Field names shared by all the CompactFeature objects of a result
+       set, so each feature only stores its values.
+       Inputs:
+          fields - list of field names, in the order of the values
+          geometryType - optional esri geometry type of the features
+          spatialReference - optional spatial reference dictionary
+    """
+    __slots__ = ('_fields', '_lookup', '_geometryType', '_spatialReference')
+    #----------------------------------------------------------------------
+    def __init__(self, fields, geometryType=None, spatialReference=None):
+        """Constructor"""
+        self._fields = tuple(codec.intern_key(f) for f in fields)
+        self._lookup = {}
+        for i, name in enumerate(self._fields):
+            self._lookup[name] = i
+            self._lookup.setdefault(name.lower(), i)
+        self._geometryType = geometryType
+        self._spatialReference = spatialReference
+    #----------------------------------------------------------------------
+    @property
+    def fields(self):
+        """ returns the field names """
+        return list(self._fields)
+    #----------------------------------------------------------------------
+    @property
+    def geometryType(self):
+        """ returns the geometry type of the features """
+        return self._geometryType
+    #----------------------------------------------------------------------
+    @property
+    def spatialReference(self):
+        """ returns the spatial reference of the features """
+        return self._spatialReference
+    #----------------------------------------------------------------------
+    def index(self, field_name):
+        """ returns the position of a field (case insensitive) or None """
+        if field_name in self._lookup:
+            return self._lookup[field_name]
+        return self._lookup.get(field_name.lower())
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._fields)
+########################################################################
+class CompactFeature(object):
+    """
+       Memory efficient feature.  The attribute values are kept in a tuple
+       matching the field names of a shared FeatureSchema.  Point
+       geometries are kept as an (x, y) tuple and other geometries as a
+       compact JSON string that is only parsed when the geometry is used.
+       Nothing is serialized until asJSON is called.
+    """
+    __slots__ = ('_schema', '_values', '_geometry')
+    #----------------------------------------------------------------------
+    def __init__(self, schema, values, geometry=None):
+        """Constructor
+            Inputs:
+               schema - FeatureSchema of the result set
+               values - attribute values in the order of schema.fields
+               geometry - esri JSON geometry as a dictionary, or None
+        """
+        self._schema = schema
+        self._values = tuple(values)
+        self._geometry = _pack_geometry(geometry)
+    #----------------------------------------------------------------------
+    @property
+    def schema(self):
+        """ returns the shared FeatureSchema """
+        return self._schema
+    #----------------------------------------------------------------------
+    @property
+    def fields(self):
+        """ returns a list of feature fields """
+        return self._schema.fields
+    #----------------------------------------------------------------------
+    @property
+    def values(self):
+        """ returns the attribute values as a tuple """
+        return self._values
+    #----------------------------------------------------------------------
+    @property
+    def attributes(self):
+        """ returns a new dictionary of the attributes """
+        return dict(zip(self._schema._fields, self._values))
+    #----------------------------------------------------------------------
+    @property
+    def geometry(self):
+        """ returns the geometry as an esri JSON dictionary, or None """
+        return _unpack_geometry(self._geometry)
+    #----------------------------------------------------------------------
+    @property
+    def geometryType(self):
+        """ returns the feature's geometry type """
+        if self._geometry is None:
+            return "Table"
+        return self._schema.geometryType
+    #----------------------------------------------------------------------
+    def get_value(self, field_name):
+        """ returns a value for a given field name """
+        i = self._schema.index(field_name)
+        if i is not None:
+            return self._values[i]
+        elif field_name.upper() in _SHAPE_NAMES:
+            return self.geometry
+        return None
+    #----------------------------------------------------------------------
+    def set_value(self, field_name, value):
+        """ sets an attribute value (or the geometry) for a given field """
+        i = self._schema.index(field_name)
+        if i is not None:
+            values = list(self._values)
+            values[i] = value
+            self._values = tuple(values)
+        elif field_name.upper() in _SHAPE_NAMES:
+            if hasattr(value, "asDictionary"):
+                value = value.asDictionary
+            self._geometry = _pack_geometry(value)
+        else:
+            return False
+        return True
+    #----------------------------------------------------------------------
+    def __getitem__(self, field_name):
+        """ returns a value for a given field name """
+        i = self._schema.index(field_name)
+        if i is None:
+            raise KeyError(field_name)
+        return self._values[i]
+    #----------------------------------------------------------------------
+    @property
+    def asDictionary(self):
+        """returns the feature as a dictionary"""
+        feat_dict = {"attributes" : self.attributes}
+        if self._geometry is not None:
+            feat_dict['geometry'] = self.geometry
+        return feat_dict
+    #----------------------------------------------------------------------
+    @property
+    def asJSON(self):
+        """ returns the feature as a JSON string """
+        return codec.dumps(self.asDictionary)
+    #----------------------------------------------------------------------
+    @property
+    def asRow(self):
+        """ converts a feature to a list for insertion into an insert cursor
+            Output:
+               [row items], [field names]
+               the geometry, if any, is the last item as SHAPE@JSON
+        """
+        row = list(self._values)
+        fields = self._schema.fields
+        if self._geometry is not None:
+            geometry = self._geometry
+            if isinstance(geometry, tuple):
+                geometry = codec.dumps(_unpack_geometry(geometry))
+            row.append(geometry)
+            fields.append("SHAPE@JSON")
+        return row, fields
+    #----------------------------------------------------------------------
+    def __repr__(self):
+        return "<CompactFeature %s>" % (self._values,)
+#----------------------------------------------------------------------
+def _pack_geometry(geometry):
+    """ stores a geometry as an (x, y) tuple or a compact JSON string """
+    if geometry is None:
+        return None
+    if isinstance(geometry, basestring):
+        return geometry
+    if len(geometry) == 2 and \
+       'y' in geometry and \
+       geometry.get('x') is not None:
+        return (geometry['x'], geometry['y'])
+    return codec.dumps(geometry, compact=True)
+#----------------------------------------------------------------------
+def _unpack_geometry(geometry):
+    """ returns a packed geometry as a dictionary """
+    if geometry is None:
+        return None
+    if isinstance(geometry, tuple):
+        return {"x" : geometry[0], "y" : geometry[1]}
+    return codec.loads(geometry)
+#----------------------------------------------------------------------
+def compact_features(features, schema=None, geometryType=None,
+                     spatialReference=None):
+    """
+       converts query result features (JSON dictionaries) to
+       CompactFeature objects sharing one FeatureSchema
+       Inputs:
+          features - list of feature dictionaries
+          schema - FeatureSchema to reuse, ie: from a previous page of the
+                   same query.  By default it is built from the first
+                   feature.
+          geometryType - geometry type stored in a new schema
+          spatialReference - spatial reference stored in a new schema
+       Output:
+          list of CompactFeature objects
+    """
+    results = []
+    fields = None
+    if schema is not None:
+        fields = schema._fields
+    for feature in features:
+        attributes = feature.get('attributes', {})
+        if schema is None:
+            schema = FeatureSchema(fields=attributes.keys(),
+                                   geometryType=geometryType,
+                                   spatialReference=spatialReference)
+            fields = schema._fields
+        values = [attributes.get(f) for f in fields]
+        results.append(CompactFeature(schema, values,
+                                      feature.get('geometry')))
+    return results
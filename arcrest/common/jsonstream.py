@@ -0,0 +1,205 @@
+"""
+
+.. module:: jsonstream
+   :platform: Windows, Linux
+   :synopsis: Reads the items of one array of a JSON document as the
+              document streams in, ie: the features of a large result.
+
+.. moduleauthor:: Esri
+
+
+"""
+import codec
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+_WHITESPACE = " \t\n\r"
+_SEPARATORS = _WHITESPACE + ",:]}"
+########################################################################
+class JSONArrayReader(object):
+    """
+       Iterates over the items of the array found at path in a JSON
+       document read from a stream.  Only one item at a time is decoded,
+       so the document never has to fit in memory.  Every other member of
+       the objects along the path is decoded and kept in header, ie: the
+       fields and geometryType next to the features of a record set.
+       Inputs:
+          stream - object with a read(size) method, ie: an HTTP response
+          path - keys leading to the array, ie: ("value", "features")
+          buffer_size - bytes read from the stream at a time
+          convert_unicode - see arcrest.common.codec.loads
+    """
+    _stream = None
+    _path = None
+    _buffer_size = None
+    _decode = None
+    _buf = None
+    _pos = None
+    _eof = None
+    _header = None
+    _found = None
+    _items = None
+    _first = None
+    #----------------------------------------------------------------------
+    def __init__(self, stream, path, buffer_size=DEFAULT_BUFFER_SIZE,
+                 convert_unicode=True):
+        """Constructor"""
+        if isinstance(path, basestring):
+            path = path.split(".")
+        self._stream = stream
+        self._path = tuple(path)
+        self._buffer_size = buffer_size
+        self._decode = codec.raw_decoder(convert_unicode)
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._header = {}
+        self._found = False
+    #----------------------------------------------------------------------
+    @property
+    def header(self):
+        """
+           returns the members read so far outside of the array, as nested
+           dictionaries.  Members written after the array are added once
+           the iteration is over.
+        """
+        return self._header
+    #----------------------------------------------------------------------
+    @property
+    def found(self):
+        """ returns True if the document had an array at path """
+        return self._found
+    #----------------------------------------------------------------------
+    def read_header(self):
+        """
+           reads the document up to the start of the array, returns the
+           header.  Iterating afterwards still returns every item.
+        """
+        if self._items is None:
+            self._items = self._parse()
+            try:
+                self._first = (self._items.next(),)
+            except StopIteration:
+                pass
+        return self._header
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        """ yields the items of the array """
+        if self._items is None:
+            self._items = self._parse()
+        if self._first is not None:
+            first, self._first = self._first[0], None
+            yield first
+        for item in self._items:
+            yield item
+    #----------------------------------------------------------------------
+    def _fill(self):
+        """ reads more of the stream, returns False at its end """
+        if self._eof:
+            return False
+        data = self._stream.read(self._buffer_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+    #----------------------------------------------------------------------
+    def _peek(self):
+        """ returns the next character that is not white space, or "" """
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+    #----------------------------------------------------------------------
+    def _expect(self, chars):
+        """ consumes the next character, which must be one of chars """
+        char = self._peek()
+        if char == "" or char not in chars:
+            raise ValueError("invalid JSON document, expected %s at %r" %
+                             (" or ".join(chars), self._buf[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+    #----------------------------------------------------------------------
+    def _value(self):
+        """ decodes the next complete value """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decode(self._buf, self._pos)
+                # a number cut by the end of the buffer decodes but
+                # continues in the next read, valid values are always
+                # followed by a separator
+                if self._eof or (end < len(self._buf) and
+                                 self._buf[end] in _SEPARATORS):
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+            if not self._fill() and not self._eof:
+                raise ValueError("invalid JSON document")
+    #----------------------------------------------------------------------
+    def _parse(self):
+        """ generator walking the document down the path to the array """
+        target = self._header
+        depth = 0
+        stack = []
+        while True:
+            if depth == len(self._path):
+                if self._peek() != "[":
+                    # not an array, kept as a header value
+                    stack[-1][1][stack[-1][2]] = self._value()
+                    break
+                self._found = True
+                # the array itself is not part of the header
+                del stack[-1][1][stack[-1][2]]
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(",]") == "]":
+                            break
+                break
+            if self._peek() != "{":
+                # not an object, the path does not exist in the document
+                if depth == 0:
+                    self._header = self._value()
+                else:
+                    stack[-1][1][stack[-1][2]] = self._value()
+                break
+            self._pos += 1
+            descended = False
+            while self._peek() != "}":
+                key = self._value()
+                self._expect(":")
+                if key == self._path[depth]:
+                    stack.append((depth, target, key))
+                    target[key] = target.get(key, {})
+                    target = target[key]
+                    depth += 1
+                    descended = True
+                    break
+                target[key] = self._value()
+                if self._expect(",}") == "}":
+                    self._pos -= 1
+            if descended:
+                continue
+            self._pos += 1
+            break
+        # reads the members after the array up to the end of the document
+        while len(stack) > 0:
+            depth, target, key = stack.pop()
+            while True:
+                char = self._expect(",}")
+                if char == "}":
+                    break
+                name = self._value()
+                self._expect(":")
+                target[name] = self._value()
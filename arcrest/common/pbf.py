@@ -0,0 +1,431 @@
+"""
+
+.. module:: pbf
+   :platform: Windows, Linux
+   :synopsis: Decoder for the esri FeatureCollection protocol buffer
+              (f=pbf) query responses.
+
+.. moduleauthor:: Esri
+
+
+"""
+import struct
+import codec
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FIELD_TYPES = ("esriFieldTypeSmallInteger", "esriFieldTypeInteger",
+               "esriFieldTypeSingle", "esriFieldTypeDouble",
+               "esriFieldTypeString", "esriFieldTypeDate",
+               "esriFieldTypeOID", "esriFieldTypeGeometry",
+               "esriFieldTypeBlob", "esriFieldTypeRaster",
+               "esriFieldTypeGUID", "esriFieldTypeGlobalID",
+               "esriFieldTypeXML")
+GEOMETRY_TYPES = {0 : "esriGeometryPoint",
+                  1 : "esriGeometryMultipoint",
+                  2 : "esriGeometryPolyline",
+                  3 : "esriGeometryPolygon",
+                  4 : "esriGeometryMultipatch",
+                  127 : None}
+# origin of quantized coordinates
+_UPPER_LEFT = 0
+# packed coordinates shorter than this are decoded in python even when
+# NumPy is installed, the array setup costs more than it saves
+_NUMPY_MIN_BYTES = 256
+# protocol buffer wire types
+_VARINT, _FIXED64, _BYTES, _FIXED32 = 0, 1, 2, 5
+#----------------------------------------------------------------------
+def _varint(buf, pos):
+    """ reads a varint, returns (value, new position) """
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+#----------------------------------------------------------------------
+def _zigzag(value):
+    """ decodes a zigzag encoded (sint32/sint64) value """
+    return (value >> 1) ^ -(value & 1)
+#----------------------------------------------------------------------
+def _int64(value):
+    """ converts an unsigned varint to a two's complement int64 """
+    if value >= 0x8000000000000000:
+        return value - 0x10000000000000000
+    return value
+#----------------------------------------------------------------------
+def _fields(buf, pos, end):
+    """
+       yields (field number, wire type, value) for a message between pos
+       and end.  The value is the integer for varints, the position for
+       fixed size values and a (start, end) tuple for length delimited
+       values.
+    """
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        field = key >> 3
+        wire = key & 0x07
+        if wire == _VARINT:
+            value, pos = _varint(buf, pos)
+        elif wire == _BYTES:
+            size, pos = _varint(buf, pos)
+            value = (pos, pos + size)
+            pos += size
+        elif wire == _FIXED64:
+            value = pos
+            pos += 8
+        elif wire == _FIXED32:
+            value = pos
+            pos += 4
+        else:
+            raise ValueError("Unsupported protocol buffer wire type %s" % wire)
+        yield field, wire, value
+#----------------------------------------------------------------------
+def _string(buf, span):
+    """ returns a length delimited value as a utf-8 str """
+    return str(buf[span[0]:span[1]])
+#----------------------------------------------------------------------
+def _double(buf, pos):
+    return struct.unpack_from("<d", buf, pos)[0]
+#----------------------------------------------------------------------
+def _float(buf, pos):
+    return struct.unpack_from("<f", buf, pos)[0]
+#----------------------------------------------------------------------
+def _packed_varints(buf, wire, value):
+    """ returns the values of a packed (or single) repeated varint """
+    if wire == _VARINT:
+        return [value]
+    pos, end = value
+    values = []
+    append = values.append
+    while pos < end:
+        v, pos = _varint(buf, pos)
+        append(v)
+    return values
+#----------------------------------------------------------------------
+def _numpy_varints(buf, start, end):
+    """ decodes packed varints with NumPy, returns a uint64 array """
+    data = numpy.frombuffer(buf, dtype=numpy.uint8, count=end - start,
+                            offset=start)
+    ends = numpy.flatnonzero(data < 0x80)
+    starts = numpy.empty(len(ends), dtype=numpy.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    shifts = numpy.arange(len(data), dtype=numpy.int64) - \
+             numpy.repeat(starts, lengths)
+    parts = (data & 0x7f).astype(numpy.uint64) << \
+            (shifts * 7).astype(numpy.uint64)
+    # the 7 bit groups never overlap, so adding them is an OR
+    return numpy.add.reduceat(parts, starts)
+########################################################################
+class _Transform(object):
+    """ converts quantized integer coordinates to map coordinates """
+    __slots__ = ('origin', 'xScale', 'yScale', 'zScale', 'mScale',
+                 'xTranslate', 'yTranslate', 'zTranslate', 'mTranslate')
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor, the identity transform"""
+        self.origin = 1
+        self.xScale = self.yScale = self.zScale = self.mScale = 1.0
+        self.xTranslate = self.yTranslate = 0.0
+        self.zTranslate = self.mTranslate = 0.0
+    #----------------------------------------------------------------------
+    def scales(self, dims):
+        """ returns the (scale, translate, sign) of each dimension """
+        result = [(self.xScale, self.xTranslate, 1),
+                  (self.yScale, self.yTranslate,
+                   -1 if self.origin == _UPPER_LEFT else 1)]
+        if 'z' in dims:
+            result.append((self.zScale, self.zTranslate, 1))
+        if 'm' in dims:
+            result.append((self.mScale, self.mTranslate, 1))
+        return result
+########################################################################
+class FeatureCollectionDecoder(object):
+    """
+       Decodes an esri FeatureCollectionPBuffer message into the same
+       dictionary a f=json query returns.
+       Inputs:
+          use_numpy - if True and NumPy is installed, long coordinate
+                      arrays are decoded with NumPy
+    """
+    _buf = None
+    _use_numpy = None
+    _dims = None
+    _scales = None
+    #----------------------------------------------------------------------
+    def __init__(self, use_numpy=True):
+        """Constructor"""
+        self._use_numpy = use_numpy and numpy is not None
+    #----------------------------------------------------------------------
+    def decode(self, data):
+        """
+           decodes a pbf response
+           Inputs:
+              data - the response body as a string
+           Output:
+              dictionary like the JSON response: a feature set, a count
+              ({"count" : n}) or object ids ({"objectIds" : [...]})
+        """
+        buf = bytearray(data)
+        self._buf = buf
+        result = {}
+        try:
+            for field, wire, value in _fields(buf, 0, len(buf)):
+                if field == 2 and wire == _BYTES:
+                    result = self._queryResult(value)
+        finally:
+            self._buf = None
+        return result
+    #----------------------------------------------------------------------
+    def _queryResult(self, span):
+        """ QueryResult message """
+        buf = self._buf
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                return self._featureResult(value)
+            elif field == 2:
+                count = 0
+                for f, w, v in _fields(buf, value[0], value[1]):
+                    if f == 1:
+                        count = v
+                return {"count" : count}
+            elif field == 3:
+                return self._idsResult(value)
+        return {}
+    #----------------------------------------------------------------------
+    def _idsResult(self, span):
+        """ ObjectIdsResult message """
+        buf = self._buf
+        result = {"objectIdFieldName" : None, "objectIds" : []}
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                result['objectIdFieldName'] = codec.intern_key(_string(buf, value))
+            elif field == 3:
+                result['objectIds'].extend(_packed_varints(buf, wire, value))
+        return result
+    #----------------------------------------------------------------------
+    def _featureResult(self, span):
+        """ FeatureResult message """
+        buf = self._buf
+        result = {"fields" : [],
+                  "features" : [],
+                  "hasZ" : False,
+                  "hasM" : False,
+                  "exceededTransferLimit" : False,
+                  "geometryType" : "esriGeometryPoint"}
+        transform = _Transform()
+        features = []
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                result['objectIdFieldName'] = _string(buf, value)
+            elif field == 2:
+                result['uniqueIdField'] = self._simple(value, {
+                    1 : ("name", _string), 2 : ("isSystemMaintained", bool)})
+            elif field == 3:
+                result['globalIdFieldName'] = _string(buf, value)
+            elif field == 4:
+                result['geohashFieldName'] = _string(buf, value)
+            elif field == 5:
+                result['geometryProperties'] = self._simple(value, {
+                    1 : ("shapeAreaFieldName", _string),
+                    2 : ("shapeLengthFieldName", _string),
+                    3 : ("units", _string)})
+            elif field == 6:
+                result['serverGens'] = self._simple(value, {
+                    1 : ("minServerGen", int), 2 : ("serverGen", int)})
+            elif field == 7:
+                result['geometryType'] = GEOMETRY_TYPES.get(value)
+            elif field == 8:
+                result['spatialReference'] = self._simple(value, {
+                    1 : ("wkid", int), 2 : ("latestWkid", int),
+                    3 : ("vcsWkid", int), 4 : ("latestVcsWkid", int),
+                    5 : ("wkt", _string)})
+            elif field == 9:
+                result['exceededTransferLimit'] = bool(value)
+            elif field == 10:
+                result['hasZ'] = bool(value)
+            elif field == 11:
+                result['hasM'] = bool(value)
+            elif field == 12:
+                transform = self._transform(value)
+            elif field == 13:
+                result['fields'].append(self._field(value))
+            elif field == 15:
+                # features are decoded once the fields and transform,
+                # which may come later in the message, are known
+                features.append(value)
+        dims = ['x', 'y']
+        if result['hasZ']:
+            dims.append('z')
+        if result['hasM']:
+            dims.append('m')
+        self._dims = dims
+        self._scales = transform.scales(dims)
+        names = [f['name'] for f in result['fields']]
+        geometryType = result['geometryType']
+        append = result['features'].append
+        for value in features:
+            append(self._feature(value, names, geometryType))
+        return result
+    #----------------------------------------------------------------------
+    def _simple(self, span, layout):
+        """ decodes a message of scalar values into a dictionary """
+        buf = self._buf
+        result = {}
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field in layout:
+                name, func = layout[field]
+                if func is _string:
+                    result[name] = _string(buf, value)
+                else:
+                    result[name] = func(value)
+        return result
+    #----------------------------------------------------------------------
+    def _transform(self, span):
+        """ Transform message """
+        buf = self._buf
+        transform = _Transform()
+        transform.origin = _UPPER_LEFT
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                transform.origin = value
+            elif field in (2, 3):
+                names = {2 : ("xScale", "yScale", "mScale", "zScale"),
+                         3 : ("xTranslate", "yTranslate",
+                              "mTranslate", "zTranslate")}[field]
+                for f, w, v in _fields(buf, value[0], value[1]):
+                    if 1 <= f <= 4 and w == _FIXED64:
+                        setattr(transform, names[f - 1], _double(buf, v))
+        return transform
+    #----------------------------------------------------------------------
+    def _field(self, span):
+        """ Field message """
+        buf = self._buf
+        result = {"name" : None, "type" : None, "alias" : None}
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                result['name'] = codec.intern_key(_string(buf, value))
+            elif field == 2:
+                if value < len(FIELD_TYPES):
+                    result['type'] = FIELD_TYPES[value]
+            elif field == 3:
+                result['alias'] = _string(buf, value)
+            elif field == 5:
+                result['domain'] = _string(buf, value)
+            elif field == 6:
+                result['defaultValue'] = _string(buf, value)
+        return result
+    #----------------------------------------------------------------------
+    def _value(self, span):
+        """ Value message """
+        buf = self._buf
+        result = None
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                result = _string(buf, value)
+            elif field == 2:
+                result = _float(buf, value)
+            elif field == 3:
+                result = _double(buf, value)
+            elif field in (4, 8):
+                result = _zigzag(value)
+            elif field in (5, 7):
+                result = value
+            elif field == 6:
+                result = _int64(value)
+            elif field == 9:
+                result = bool(value)
+        return result
+    #----------------------------------------------------------------------
+    def _feature(self, span, names, geometryType):
+        """ Feature message """
+        buf = self._buf
+        values = []
+        feature = {}
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 1:
+                values.append(self._value(value))
+            elif field == 2:
+                feature['geometry'] = self._geometry(value, geometryType)
+            elif field == 4:
+                feature['centroid'] = self._geometry(value, "esriGeometryPoint")
+        feature['attributes'] = dict(zip(names, values))
+        return feature
+    #----------------------------------------------------------------------
+    def _coordinates(self, wire, value):
+        """ returns the delta decoded, scaled coordinates as tuples """
+        buf = self._buf
+        dims = len(self._dims)
+        if self._use_numpy and wire == _BYTES and \
+           value[1] - value[0] >= _NUMPY_MIN_BYTES:
+            raw = _numpy_varints(buf, value[0], value[1])
+            signed = (raw >> numpy.uint64(1)).astype(numpy.int64) ^ \
+                     -(raw & numpy.uint64(1)).astype(numpy.int64)
+            coords = signed.reshape(-1, dims).cumsum(axis=0).astype(numpy.float64)
+            for i, (scale, translate, sign) in enumerate(self._scales):
+                coords[:, i] = translate + sign * coords[:, i] * scale
+            return coords.tolist()
+        raw = _packed_varints(buf, wire, value)
+        totals = [0] * dims
+        scales = self._scales
+        coords = []
+        point = []
+        for i, v in enumerate(raw):
+            d = i % dims
+            totals[d] += (v >> 1) ^ -(v & 1)
+            scale, translate, sign = scales[d]
+            point.append(translate + sign * totals[d] * scale)
+            if d == dims - 1:
+                coords.append(point)
+                point = []
+        return coords
+    #----------------------------------------------------------------------
+    def _geometry(self, span, geometryType):
+        """ Geometry message, returned as esri JSON """
+        buf = self._buf
+        lengths = []
+        coords = []
+        for field, wire, value in _fields(buf, span[0], span[1]):
+            if field == 2:
+                lengths.extend(_packed_varints(buf, wire, value))
+            elif field == 3:
+                coords.extend(self._coordinates(wire, value))
+        if len(coords) == 0:
+            return None
+        if geometryType == "esriGeometryPoint":
+            point = dict(zip(self._dims, coords[0]))
+            return point
+        if geometryType == "esriGeometryMultipoint":
+            return {"points" : coords}
+        parts = []
+        start = 0
+        for length in lengths or [len(coords)]:
+            parts.append(coords[start:start + length])
+            start += length
+        if geometryType == "esriGeometryPolyline":
+            return {"paths" : parts}
+        return {"rings" : parts}
+#----------------------------------------------------------------------
+def decode(data, use_numpy=True):
+    """
+       decodes a f=pbf query response
+       Inputs:
+          data - the response body
+          use_numpy - decode long coordinate arrays with NumPy when it is
+                      installed
+       Output:
+          dictionary like the f=json response
+    """
+    return FeatureCollectionDecoder(use_numpy=use_numpy).decode(data)
+#----------------------------------------------------------------------
+def is_pbf(data):
+    """ returns False when a f=pbf request was answered with JSON """
+    stripped = data.lstrip()[:1]
+    return stripped not in ("{", "[")
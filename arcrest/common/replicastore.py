@@ -0,0 +1,225 @@
+"""
+
+.. module:: replicastore
+   :platform: Windows, Linux
+   :synopsis: Local SQLite copy of a replica's features and of the server
+              generation it was last synchronized to.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import sqlite3
+import codec
+from syncindex import key_value
+
+########################################################################
+class ReplicaStore(object):
+    """
+       Features of the layers of a replica, keyed by the layer id and the
+       global id (or object id) of each feature, with the replica server
+       generation the copy is current to.  Changes and the new generation
+       are saved in one transaction, so an interrupted synchronization
+       never leaves a generation that does not match the data.
+       Inputs:
+          path - SQLite file, created if missing
+          url - url of the feature service, a store built for another
+                service is cleared
+          replica_id - id of the replica, a store built for another
+                       replica is cleared
+    """
+    _path = None
+    _conn = None
+    #----------------------------------------------------------------------
+    def __init__(self, path, url=None, replica_id=None):
+        """Constructor"""
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.text_factory = str
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS info (
+                url TEXT, replica_id TEXT, server_gen INTEGER, synced REAL);
+            CREATE TABLE IF NOT EXISTS layers (
+                layer_id INTEGER PRIMARY KEY, key_field TEXT,
+                server_gen INTEGER);
+            CREATE TABLE IF NOT EXISTS features (
+                layer_id INTEGER, key TEXT, attributes TEXT, geometry TEXT,
+                PRIMARY KEY (layer_id, key));
+        """)
+        row = self._conn.execute("SELECT url, replica_id FROM info").fetchone()
+        if row is None or row != (url, replica_id):
+            self._conn.execute("DELETE FROM features")
+            self._conn.execute("DELETE FROM layers")
+            self._conn.execute("DELETE FROM info")
+            self._conn.execute("INSERT INTO info VALUES (?, ?, NULL, NULL)",
+                               (url, replica_id))
+            self._conn.commit()
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the database """
+        return self._path
+    #----------------------------------------------------------------------
+    @property
+    def serverGen(self):
+        """ returns the replica server generation, None before the first
+            synchronization """
+        return self._conn.execute("SELECT server_gen FROM info").fetchone()[0]
+    #----------------------------------------------------------------------
+    @property
+    def lastSync(self):
+        """ returns the time of the last synchronization, in seconds """
+        return self._conn.execute("SELECT synced FROM info").fetchone()[0]
+    #----------------------------------------------------------------------
+    @property
+    def layerServerGens(self):
+        """ returns the list of {"id", "serverGen"} of every layer """
+        return [{"id" : layer_id, "serverGen" : gen} for layer_id, gen in
+                self._conn.execute(
+                    "SELECT layer_id, server_gen FROM layers ORDER BY layer_id")]
+    #----------------------------------------------------------------------
+    def key_field(self, layer_id):
+        """ returns the name of the key field of a layer, or None """
+        row = self._conn.execute(
+            "SELECT key_field FROM layers WHERE layer_id = ?",
+            (int(layer_id),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+    #----------------------------------------------------------------------
+    def set_key_field(self, layer_id, key_field):
+        """ sets the field identifying the features of a layer """
+        self._conn.execute(
+            "INSERT OR IGNORE INTO layers VALUES (?, ?, NULL)",
+            (int(layer_id), key_field))
+        self._conn.execute(
+            "UPDATE layers SET key_field = ? WHERE layer_id = ?",
+            (key_field, int(layer_id)))
+        self._conn.commit()
+    #----------------------------------------------------------------------
+    def _upsert(self, layer_id, feature):
+        """ adds or replaces a feature """
+        key_field = self.key_field(layer_id)
+        attributes = feature.get('attributes', {})
+        key = attributes.get(key_field)
+        if key is None:
+            lower = key_field.lower()
+            for k, v in attributes.iteritems():
+                if k.lower() == lower:
+                    key = v
+                    break
+        if key is None:
+            raise ValueError("feature without a %s value in layer %s" %
+                             (key_field, layer_id))
+        geometry = feature.get('geometry')
+        if geometry is not None:
+            geometry = codec.dumps(geometry, compact=True)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?)",
+            (int(layer_id), key_value(key),
+             codec.dumps(attributes, compact=True), geometry))
+    #----------------------------------------------------------------------
+    def load(self, layer_id, features):
+        """
+           replaces the features of a layer, used for the first copy.
+           The changes are saved by the next call to apply.
+           Inputs:
+              layer_id - id of the layer
+              features - iterable of esri JSON feature dictionaries
+           Output:
+              number of features loaded
+        """
+        self._conn.execute("DELETE FROM features WHERE layer_id = ?",
+                           (int(layer_id),))
+        count = 0
+        for feature in features:
+            if hasattr(feature, "asDictionary"):
+                feature = feature.asDictionary
+            self._upsert(layer_id, feature)
+            count += 1
+        return count
+    #----------------------------------------------------------------------
+    def apply(self, edits=None, serverGen=None, layerServerGens=None):
+        """
+           applies the changes returned by synchronizeReplica and saves
+           them with the new server generation
+           Inputs:
+              edits - list of {"id", "features" : {"adds", "updates",
+                      "deleteIds"}} dictionaries
+              serverGen - replica server generation the changes lead to
+              layerServerGens - list of {"id", "serverGen"} of the layers,
+                                for replicas synchronized per layer
+           Output:
+              dictionary with the number of adds, updates and deletes
+        """
+        counts = {"adds" : 0, "updates" : 0, "deletes" : 0}
+        try:
+            for layer in edits or []:
+                layer_id = layer['id']
+                if self.key_field(layer_id) is None:
+                    raise ValueError("no key field set for layer %s" % layer_id)
+                changes = layer.get('features') or {}
+                for feature in changes.get('adds') or []:
+                    self._upsert(layer_id, feature)
+                    counts['adds'] += 1
+                for feature in changes.get('updates') or []:
+                    self._upsert(layer_id, feature)
+                    counts['updates'] += 1
+                for key in changes.get('deleteIds') or []:
+                    self._conn.execute(
+                        "DELETE FROM features WHERE layer_id = ? AND key = ?",
+                        (int(layer_id), key_value(key)))
+                    counts['deletes'] += 1
+            for layer in layerServerGens or []:
+                self._conn.execute(
+                    "UPDATE layers SET server_gen = ? WHERE layer_id = ?",
+                    (layer['serverGen'], int(layer['id'])))
+            if serverGen is not None:
+                self._conn.execute("UPDATE info SET server_gen = ?",
+                                   (serverGen,))
+            self._conn.execute("UPDATE info SET synced = ?", (time.time(),))
+            self._conn.commit()
+        except:
+            self._conn.rollback()
+            raise
+        return counts
+    #----------------------------------------------------------------------
+    def features(self, layer_id):
+        """ yields the esri JSON feature dictionaries of a layer """
+        cursor = self._conn.execute(
+            "SELECT attributes, geometry FROM features WHERE layer_id = ?",
+            (int(layer_id),))
+        for attributes, geometry in cursor:
+            feature = {"attributes" : codec.loads(attributes)}
+            if geometry is not None:
+                feature['geometry'] = codec.loads(geometry)
+            yield feature
+    #----------------------------------------------------------------------
+    def count(self, layer_id=None):
+        """ returns the number of features, of one layer or of all """
+        if layer_id is None:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM features").fetchone()[0]
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM features WHERE layer_id = ?",
+            (int(layer_id),)).fetchone()[0]
+    #----------------------------------------------------------------------
+    def clear(self):
+        """ removes every feature and the server generations """
+        self._conn.execute("DELETE FROM features")
+        self._conn.execute("UPDATE layers SET server_gen = NULL")
+        self._conn.execute("UPDATE info SET server_gen = NULL, synced = NULL")
+        self._conn.commit()
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the database """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,161 @@
+"""
+
+.. module:: syncindex
+   :platform: Windows, Linux
+   :synopsis: Local SQLite index of the key, object id and content hash of
+              the features synchronized to a layer.
+
+.. moduleauthor:: Esri
+
+
+"""
+import hashlib
+import sqlite3
+import calendar
+import datetime
+import codec
+
+# start of the hashes that cover the attributes and not the geometry
+ATTRIBUTES_PREFIX = "a:"
+#----------------------------------------------------------------------
+def _date_handler(obj):
+    """ dates are hashed as the epoch milliseconds the service returns """
+    if isinstance(obj, datetime.datetime):
+        return calendar.timegm(obj.utctimetuple()) * 1000
+    return str(obj)
+#----------------------------------------------------------------------
+def _canonical(obj):
+    """ returns obj with the dictionaries replaced by sorted item lists """
+    if isinstance(obj, dict):
+        return [[k, _canonical(obj[k])] for k in sorted(obj.keys())]
+    elif isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    elif isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    return obj
+#----------------------------------------------------------------------
+def key_value(value):
+    """ returns a key field value as the str stored in the index """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, float) and value == int(value):
+        # numeric keys may come back from the service as floats
+        value = int(value)
+    return str(value)
+#----------------------------------------------------------------------
+def feature_hash(attributes, geometry=None, fields=None):
+    """
+       returns the sha1 of a feature's content
+       Inputs:
+          attributes - attribute dictionary
+          geometry - esri JSON geometry dictionary, or None
+          fields - names of the attributes to include, all by default
+    """
+    if fields is not None:
+        lookup = dict((k.lower(), v) for k, v in attributes.iteritems())
+        values = [[f, lookup.get(f.lower())] for f in fields]
+    else:
+        values = _canonical(attributes)
+    if geometry is not None:
+        geometry = _canonical(dict((k, v) for k, v in geometry.iteritems()
+                                   if k != "spatialReference"))
+    text = codec.dumps([_canonical(values), geometry],
+                       default=_date_handler, compact=True)
+    return hashlib.sha1(text).hexdigest()
+#----------------------------------------------------------------------
+def attribute_hash(attributes, fields=None):
+    """
+       returns the hash of a feature's attributes only, marked with
+       ATTRIBUTES_PREFIX.  Used for an index built from a layer, whose
+       geometries come back reprojected and rounded by the server and
+       would never match the hashes of the source.
+    """
+    return ATTRIBUTES_PREFIX + feature_hash(attributes, None, fields)
+########################################################################
+class SyncIndex(object):
+    """
+       Key field value -> (object id, content hash) of every feature a
+       sync has written to a layer, kept in a SQLite database so the next
+       sync only sends the differences.
+       Inputs:
+          path - SQLite file, created if missing
+          url - url of the layer, an index built for another layer is
+                cleared
+          key_field - name of the key field, an index built on another
+                      key is cleared
+    """
+    _path = None
+    _conn = None
+    #----------------------------------------------------------------------
+    def __init__(self, path, url=None, key_field=None):
+        """Constructor"""
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.text_factory = str
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS info (url TEXT, key_field TEXT);
+            CREATE TABLE IF NOT EXISTS features (
+                key TEXT PRIMARY KEY, oid INTEGER, hash TEXT);
+        """)
+        row = self._conn.execute("SELECT url, key_field FROM info").fetchone()
+        if row is None or row != (url, key_field):
+            self.clear()
+            self._conn.execute("DELETE FROM info")
+            self._conn.execute("INSERT INTO info VALUES (?, ?)",
+                               (url, key_field))
+            self._conn.commit()
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the database """
+        return self._path
+    #----------------------------------------------------------------------
+    def get(self, key):
+        """ returns the (object id, hash) of a key, or None """
+        return self._conn.execute(
+            "SELECT oid, hash FROM features WHERE key = ?",
+            (key_value(key),)).fetchone()
+    #----------------------------------------------------------------------
+    def set(self, key, oid, hash):
+        """ stores the object id and hash of a key """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO features VALUES (?, ?, ?)",
+            (key_value(key), oid, hash))
+    #----------------------------------------------------------------------
+    def remove(self, key):
+        """ removes a key """
+        self._conn.execute("DELETE FROM features WHERE key = ?",
+                           (key_value(key),))
+    #----------------------------------------------------------------------
+    def items(self):
+        """ yields (key, object id, hash) for every key """
+        for row in self._conn.execute("SELECT key, oid, hash FROM features"):
+            yield row
+    #----------------------------------------------------------------------
+    def clear(self):
+        """ removes every key """
+        self._conn.execute("DELETE FROM features")
+        self._conn.commit()
+    #----------------------------------------------------------------------
+    def commit(self):
+        """ saves the changes """
+        self._conn.commit()
+    #----------------------------------------------------------------------
+    def close(self):
+        """ saves the changes and closes the database """
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+    #----------------------------------------------------------------------
+    def __contains__(self, key):
+        return self.get(key) is not None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,236 @@
+"""
+
+.. module:: tilecache
+   :platform: Windows, Linux
+   :synopsis: Local SQLite tile cache using the MBTiles layout, with
+              least recently used eviction and the validators needed to
+              revalidate tiles with the server.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import sqlite3
+import threading
+
+# accesses and writes saved at once, and how often the size is checked
+_COMMIT_EVERY = 500
+########################################################################
+class TileCache(object):
+    """
+       Tiles stored in a SQLite file with the MBTiles tables (tiles and
+       metadata), readable by MBTiles tools.  Rows are stored as counted
+       by the service, from the top, which is recorded as scheme=xyz in
+       the metadata.  A tile_state table keeps the ETag, Last-Modified,
+       fetch time and last access of every tile.  When the cache holds
+       more than max_tiles tiles or max_bytes bytes, the least recently
+       used tiles are removed.
+       The cache may be shared by several threads.
+       Inputs:
+          path - SQLite file, created if missing
+          max_tiles - most tiles kept, None for no limit
+          max_bytes - most bytes of tile data kept, None for no limit
+          metadata - optional dictionary saved in the metadata table,
+                     ie: name, format, bounds
+    """
+    _path = None
+    _conn = None
+    _lock = None
+    _max_tiles = None
+    _max_bytes = None
+    _changes = None
+    #----------------------------------------------------------------------
+    def __init__(self, path, max_tiles=None, max_bytes=None, metadata=None):
+        """Constructor"""
+        self._path = path
+        self._max_tiles = max_tiles
+        self._max_bytes = max_bytes
+        self._changes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.text_factory = str
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                tile_data BLOB,
+                PRIMARY KEY (zoom_level, tile_column, tile_row));
+            CREATE TABLE IF NOT EXISTS tile_state (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                etag TEXT, last_modified TEXT, fetched REAL, accessed REAL,
+                size INTEGER,
+                PRIMARY KEY (zoom_level, tile_column, tile_row));
+            CREATE INDEX IF NOT EXISTS tile_state_accessed
+                ON tile_state (accessed);
+        """)
+        values = {"scheme" : "xyz"}
+        if metadata is not None:
+            values.update(metadata)
+        for name, value in values.iteritems():
+            self._conn.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                               (name, str(value)))
+        self._conn.commit()
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the database """
+        return self._path
+    #----------------------------------------------------------------------
+    @property
+    def metadata(self):
+        """ returns the metadata table as a dictionary """
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM metadata"))
+    #----------------------------------------------------------------------
+    def set_metadata(self, values):
+        """
+           saves values in the metadata table, with the tiles changed so
+           far, ie: a checkpoint written together with the tiles it covers
+        """
+        with self._lock:
+            for name, value in values.iteritems():
+                if value is None:
+                    self._conn.execute("DELETE FROM metadata WHERE name = ?",
+                                       (name,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                        (name, str(value)))
+            self._evict()
+            self._conn.commit()
+            self._changes = 0
+    #----------------------------------------------------------------------
+    def get(self, level, row, col):
+        """
+           returns (data, etag, last modified, fetch time) of a cached
+           tile, or None, and marks the tile as used
+        """
+        key = (int(level), int(col), int(row))
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT t.tile_data, s.etag, s.last_modified, s.fetched "
+                "FROM tiles t LEFT JOIN tile_state s USING "
+                "(zoom_level, tile_column, tile_row) "
+                "WHERE t.zoom_level = ? AND t.tile_column = ? AND t.tile_row = ?",
+                key).fetchone()
+            if found is None:
+                return None
+            self._conn.execute(
+                "UPDATE tile_state SET accessed = ? WHERE zoom_level = ? "
+                "AND tile_column = ? AND tile_row = ?", (time.time(),) + key)
+            self._changed()
+        return (str(found[0]),) + tuple(found[1:])
+    #----------------------------------------------------------------------
+    def put(self, level, row, col, data, etag=None, last_modified=None):
+        """ stores a tile with the validators the server returned """
+        key = (int(level), int(col), int(row))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                               key + (sqlite3.Binary(data),))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tile_state VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (etag, last_modified, now, now, len(data)))
+            self._changed()
+    #----------------------------------------------------------------------
+    def touch(self, level, row, col):
+        """ records that a cached tile was revalidated by the server """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tile_state SET fetched = ?, accessed = ? WHERE "
+                "zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (now, now, int(level), int(col), int(row)))
+            self._changed()
+    #----------------------------------------------------------------------
+    def remove(self, level, row, col):
+        """ removes a tile """
+        key = (int(level), int(col), int(row))
+        with self._lock:
+            for table in ("tiles", "tile_state"):
+                self._conn.execute(
+                    "DELETE FROM %s WHERE zoom_level = ? AND tile_column = ? "
+                    "AND tile_row = ?" % table, key)
+            self._changed()
+    #----------------------------------------------------------------------
+    def __contains__(self, tile):
+        """ tests a (level, row, col) tuple, without marking it as used """
+        level, row, col = tile
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? "
+                "AND tile_row = ?", (int(level), int(col), int(row))).fetchone() is not None
+    #----------------------------------------------------------------------
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+    #----------------------------------------------------------------------
+    @property
+    def size(self):
+        """ returns the bytes of tile data in the cache """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM tile_state").fetchone()[0]
+    #----------------------------------------------------------------------
+    def _changed(self):
+        """ commits and enforces the limits every _COMMIT_EVERY changes,
+            the lock must be held """
+        self._changes += 1
+        if self._changes >= _COMMIT_EVERY:
+            self._evict()
+            self._conn.commit()
+            self._changes = 0
+    #----------------------------------------------------------------------
+    def _evict(self):
+        """ removes the least recently used tiles over the limits, the lock
+            must be held """
+        excess = 0
+        if self._max_tiles is not None:
+            count = self._conn.execute("SELECT COUNT(*) FROM tile_state").fetchone()[0]
+            excess = max(excess, count - self._max_tiles)
+        if self._max_bytes is not None:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM tile_state").fetchone()[0]
+            if total > self._max_bytes:
+                # the oldest tiles holding the bytes over the limit
+                over = total - self._max_bytes
+                removed = 0
+                number = 0
+                for (size,) in self._conn.execute(
+                    "SELECT size FROM tile_state ORDER BY accessed"):
+                    if removed >= over:
+                        break
+                    removed += size or 0
+                    number += 1
+                excess = max(excess, number)
+        if excess <= 0:
+            return
+        oldest = self._conn.execute(
+            "SELECT zoom_level, tile_column, tile_row FROM tile_state "
+            "ORDER BY accessed LIMIT ?", (excess,)).fetchall()
+        for table in ("tiles", "tile_state"):
+            self._conn.executemany(
+                "DELETE FROM %s WHERE zoom_level = ? AND tile_column = ? "
+                "AND tile_row = ?" % table, oldest)
+    #----------------------------------------------------------------------
+    def commit(self):
+        """ saves the changes and enforces the limits """
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+            self._changes = 0
+    #----------------------------------------------------------------------
+    def close(self):
+        """ saves the changes and closes the database """
+        if self._conn is not None:
+            self.commit()
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
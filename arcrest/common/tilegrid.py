@@ -0,0 +1,256 @@
+"""
+
+.. module:: tilegrid
+   :platform: Windows, Linux
+   :synopsis: Tile scheme math for ArcGIS cached services: tiles covering
+              an extent and the extent of a tile, from a tileInfo.
+
+.. moduleauthor:: Esri
+
+
+"""
+import math
+
+# fraction of a tile ignored at the edges of an extent, so an extent
+# ending exactly on a tile boundary does not pull in the next tile
+_EPSILON = 1e-9
+# the scheme of ArcGIS Online and Bing Maps, in web mercator
+_WEB_MERCATOR_ORIGIN = 20037508.342787
+_WEB_MERCATOR_RESOLUTION = 156543.03392800014
+#----------------------------------------------------------------------
+def web_mercator_tile_info(max_level=19, tile_format="PNG"):
+    """
+       returns the tileInfo of the common web mercator tiling scheme, for
+       services that are not cached
+       Inputs:
+          max_level - last level of the scheme
+          tile_format - format value of the tileInfo
+    """
+    lods = []
+    for level in xrange(max_level + 1):
+        resolution = _WEB_MERCATOR_RESOLUTION / 2 ** level
+        lods.append({"level" : level,
+                     "resolution" : resolution,
+                     "scale" : resolution * 96 / 0.0254})
+    return {"rows" : 256, "cols" : 256, "dpi" : 96,
+            "format" : tile_format,
+            "origin" : {"x" : -_WEB_MERCATOR_ORIGIN,
+                        "y" : _WEB_MERCATOR_ORIGIN},
+            "spatialReference" : {"wkid" : 102100, "latestWkid" : 3857},
+            "lods" : lods}
+########################################################################
+class TileGrid(object):
+    """
+       The tiling scheme described by the tileInfo of a cached map, image
+       or tiled service.  Rows are counted down from the origin (top left)
+       and columns to the right, as in the tile/{level}/{row}/{col} urls.
+       Inputs:
+          tileInfo - tileInfo dictionary of the service
+    """
+    _origin = None
+    _rows = None
+    _cols = None
+    _resolutions = None
+    _spatialReference = None
+    _format = None
+    _dpi = None
+    #----------------------------------------------------------------------
+    def __init__(self, tileInfo):
+        """Constructor"""
+        self._origin = (float(tileInfo['origin']['x']),
+                        float(tileInfo['origin']['y']))
+        self._rows = int(tileInfo.get('rows', 256))
+        self._cols = int(tileInfo.get('cols', 256))
+        self._resolutions = dict((int(lod['level']), float(lod['resolution']))
+                                 for lod in tileInfo['lods'])
+        self._spatialReference = tileInfo.get('spatialReference')
+        self._format = tileInfo.get('format')
+        self._dpi = int(tileInfo.get('dpi', 96))
+    #----------------------------------------------------------------------
+    @property
+    def levels(self):
+        """ returns the levels of the scheme, in increasing order """
+        return sorted(self._resolutions.keys())
+    #----------------------------------------------------------------------
+    @property
+    def spatialReference(self):
+        """ returns the spatial reference of the scheme """
+        return self._spatialReference
+    #----------------------------------------------------------------------
+    @property
+    def format(self):
+        """ returns the image format of the tiles, ie: PNG, JPEG """
+        return self._format
+    #----------------------------------------------------------------------
+    @property
+    def dpi(self):
+        """ returns the dots per inch the tiles are drawn at """
+        return self._dpi
+    #----------------------------------------------------------------------
+    @property
+    def tileSize(self):
+        """ returns the (width, height) of a tile in pixels """
+        return (self._cols, self._rows)
+    #----------------------------------------------------------------------
+    def resolution(self, level):
+        """ returns the map units per pixel of a level """
+        return self._resolutions[int(level)]
+    #----------------------------------------------------------------------
+    def tile_range(self, extent, level):
+        """
+           returns the (min row, min col, max row, max col) of the tiles
+           covering an extent at a level, bounds included
+           Inputs:
+              extent - dictionary with xmin, ymin, xmax and ymax in the
+                       spatial reference of the scheme
+              level - level number
+        """
+        resolution = self.resolution(level)
+        width = self._cols * resolution
+        height = self._rows * resolution
+        x0, y0 = self._origin
+        min_col = int(math.floor((extent['xmin'] - x0) / width + _EPSILON))
+        max_col = int(math.floor((extent['xmax'] - x0) / width - _EPSILON))
+        min_row = int(math.floor((y0 - extent['ymax']) / height + _EPSILON))
+        max_row = int(math.floor((y0 - extent['ymin']) / height - _EPSILON))
+        return (max(min_row, 0), max(min_col, 0),
+                max(max_row, min_row, 0), max(max_col, min_col, 0))
+    #----------------------------------------------------------------------
+    def tile_extent(self, level, row, col):
+        """ returns the (xmin, ymin, xmax, ymax) of a tile """
+        resolution = self.resolution(level)
+        width = self._cols * resolution
+        height = self._rows * resolution
+        x0, y0 = self._origin
+        xmin = x0 + col * width
+        ymax = y0 - row * height
+        return (xmin, ymax - height, xmin + width, ymax)
+    #----------------------------------------------------------------------
+    def count(self, extent, levels=None):
+        """ returns the number of tiles covering an extent """
+        total = 0
+        for level in self._levels(levels):
+            min_row, min_col, max_row, max_col = self.tile_range(extent, level)
+            total += (max_row - min_row + 1) * (max_col - min_col + 1)
+        return total
+    #----------------------------------------------------------------------
+    def tiles(self, extent, levels=None):
+        """
+           yields the (level, row, col) of the tiles covering an extent,
+           level by level and row by row
+           Inputs:
+              extent - dictionary with xmin, ymin, xmax and ymax
+              levels - list of levels, all the levels by default
+        """
+        for level in self._levels(levels):
+            min_row, min_col, max_row, max_col = self.tile_range(extent, level)
+            for row in xrange(min_row, max_row + 1):
+                for col in xrange(min_col, max_col + 1):
+                    yield (level, row, col)
+    #----------------------------------------------------------------------
+    def polygon_tiles(self, rings, levels=None, start=None):
+        """
+           yields the (level, row, col) of the tiles touching a polygon,
+           in the same order as tiles.  Tiles of the polygon's extent that
+           are entirely outside of it, or inside one of its holes, are
+           skipped.
+           Inputs:
+              rings - list of rings, each a list of [x, y], in the spatial
+                      reference of the scheme, ie: the rings of an Esri
+                      JSON polygon
+              levels - list of levels, all the levels by default
+              start - optional (level, row, col), only the tiles after it
+                      are returned, ie: to resume an interrupted run
+        """
+        segments = []
+        for ring in rings:
+            for i in xrange(len(ring) - 1):
+                segments.append((float(ring[i][0]), float(ring[i][1]),
+                                 float(ring[i + 1][0]), float(ring[i + 1][1])))
+            if len(ring) > 1 and tuple(ring[0][:2]) != tuple(ring[-1][:2]):
+                segments.append((float(ring[-1][0]), float(ring[-1][1]),
+                                 float(ring[0][0]), float(ring[0][1])))
+        if len(segments) == 0:
+            return
+        xs = [v for s in segments for v in (s[0], s[2])]
+        ys = [v for s in segments for v in (s[1], s[3])]
+        extent = {"xmin" : min(xs), "ymin" : min(ys),
+                  "xmax" : max(xs), "ymax" : max(ys)}
+        if start is not None:
+            start = tuple(int(v) for v in start)
+        for level in self._levels(levels):
+            if start is not None and level < start[0]:
+                continue
+            min_row, min_col, max_row, max_col = self.tile_range(extent, level)
+            resolution = self.resolution(level)
+            width = self._cols * resolution
+            height = self._rows * resolution
+            x0, y0 = self._origin
+            for row in xrange(min_row, max_row + 1):
+                if start is not None and (level, row) < start[:2]:
+                    continue
+                first_col = min_col
+                if start is not None and (level, row) == start[:2]:
+                    first_col = max(min_col, start[2] + 1)
+                if first_col > max_col:
+                    continue
+                ymax = y0 - row * height
+                ymin = ymax - height
+                band = []
+                edges = []
+                for s in segments:
+                    # edges only touching the top or bottom of the row
+                    # do not pull in its tiles
+                    if max(s[1], s[3]) <= ymin + _EPSILON * height or \
+                       min(s[1], s[3]) >= ymax - _EPSILON * height:
+                        continue
+                    band.append(s)
+                    lo, hi = _clip_span(s, ymin, ymax)
+                    edges.append(
+                        (int(math.floor((lo - x0) / width + _EPSILON)),
+                         int(math.floor((hi - x0) / width - _EPSILON))))
+                # columns crossed by an edge touch the polygon, the runs of
+                # columns between them are all inside or all outside
+                edges.sort()
+                col = first_col
+                cy = ymax - height / 2.0
+                for lo, hi in edges + [(max_col + 1, max_col)]:
+                    if hi < col and lo <= col:
+                        continue
+                    lo = min(max(lo, col), max_col + 1)
+                    if lo > col:
+                        if _inside(band, x0 + (col + 0.5) * width, cy):
+                            for c in xrange(col, lo):
+                                yield (level, row, c)
+                        col = lo
+                    for c in xrange(col, min(hi, max_col) + 1):
+                        yield (level, row, c)
+                    col = max(col, hi + 1)
+                    if col > max_col:
+                        break
+    #----------------------------------------------------------------------
+    def _levels(self, levels):
+        """ returns the requested levels that exist in the scheme """
+        if levels is None:
+            return self.levels
+        return [int(l) for l in levels if int(l) in self._resolutions]
+########################################################################
+def _clip_span(segment, ymin, ymax):
+    """ returns the (min x, max x) of the part of a segment between ymin
+        and ymax """
+    x1, y1, x2, y2 = segment
+    if y1 == y2:
+        return (min(x1, x2), max(x1, x2))
+    xs = []
+    for y in (max(min(y1, y2), ymin), min(max(y1, y2), ymax)):
+        xs.append(x1 + (x2 - x1) * (y - y1) / (y2 - y1))
+    return (min(xs), max(xs))
+#----------------------------------------------------------------------
+def _inside(segments, x, y):
+    """ tests a point against the rings of a polygon, even-odd rule """
+    inside = False
+    for x1, y1, x2, y2 in segments:
+        if (y1 > y) != (y2 > y) and \
+           x < x1 + (x2 - x1) * (y - y1) / (y2 - y1):
+            inside = not inside
+    return inside
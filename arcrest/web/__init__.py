@@ -0,0 +1,15 @@
+""" package contructor
+.. moduleauthor:: Esri
+
+"""
+import connectionpool
+import transport
+import tokencache
+import workerpool
+import paging
+import editbatch
+import multipart
+import download
+import polling
+import streamzip
+import tiles
@@ -0,0 +1,365 @@
+"""
+
+.. module:: connectionpool
+   :platform: Windows, Linux
+   :synopsis: Keep-alive HTTP/HTTPS connection pool shared by all the
+              service classes.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import socket
+import httplib
+import urllib2
+import urlparse
+import threading
+from cStringIO import StringIO
+
+DEFAULT_MAXSIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_MAX_REDIRECTS = 5
+_REDIRECT_CODES = (301, 302, 303, 307)
+########################################################################
+class PooledResponse(object):
+    """
+       Wraps an httplib.HTTPResponse.  Once the body has been fully read
+       (or the response is closed) the underlying connection is handed
+       back to the pool it came from so it can be reused.
+    """
+    _pool = None
+    _key = None
+    _conn = None
+    _handle = None
+    _response = None
+    _url = None
+    _released = False
+    #----------------------------------------------------------------------
+    def __init__(self, pool, key, conn, handle, response, url):
+        """Constructor"""
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._handle = handle
+        self._response = response
+        self._url = url
+        self._released = False
+    #----------------------------------------------------------------------
+    def read(self, amt=None):
+        """ reads amt bytes (or the whole body) from the response """
+        if self._released:
+            return ""
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the response, an unread body forces a new connection """
+        self._release()
+    #----------------------------------------------------------------------
+    def _release(self):
+        """ returns the connection to the pool """
+        if self._released:
+            return
+        self._released = True
+        reusable = self._response.isclosed() and \
+                 not self._response.will_close
+        self._pool._release_connection(self._key, self._conn,
+                                       self._handle, reusable=reusable)
+    #----------------------------------------------------------------------
+    def info(self):
+        """ returns the response headers (same as urllib2) """
+        return self._response.msg
+    #----------------------------------------------------------------------
+    def getheader(self, name, default=None):
+        """ returns a single response header """
+        return self._response.getheader(name, default)
+    #----------------------------------------------------------------------
+    def geturl(self):
+        """ returns the url that served the response """
+        return self._url
+    #----------------------------------------------------------------------
+    @property
+    def code(self):
+        """ returns the HTTP status code """
+        return self._response.status
+    #----------------------------------------------------------------------
+    @property
+    def status(self):
+        """ returns the HTTP status code """
+        return self._response.status
+    #----------------------------------------------------------------------
+    @property
+    def reason(self):
+        """ returns the HTTP reason phrase """
+        return self._response.reason
+########################################################################
+class ConnectionPool(object):
+    """
+       Pool of persistent HTTP/HTTPS connections keyed by scheme, host,
+       port and proxy.
+       Inputs:
+          maxsize - number of connections kept open for each host
+          idle_timeout - seconds an unused connection is kept before it
+                         is closed
+          timeout - socket timeout in seconds for new connections
+          block - if True, no more than maxsize requests will run at the
+                  same time against a host; callers wait for a free
+                  connection.  If False, extra connections are opened
+                  when needed and closed once they are done.
+    """
+    _maxsize = None
+    _idle_timeout = None
+    _timeout = None
+    _block = None
+    _lock = None
+    _idle = None
+    _slots = None
+    #----------------------------------------------------------------------
+    def __init__(self, maxsize=DEFAULT_MAXSIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 timeout=None, block=False):
+        """Constructor"""
+        self._maxsize = maxsize
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._block = block
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+    #----------------------------------------------------------------------
+    @property
+    def maxsize(self):
+        """ gets/sets the number of connections kept for each host """
+        return self._maxsize
+    #----------------------------------------------------------------------
+    @maxsize.setter
+    def maxsize(self, value):
+        """ gets/sets the number of connections kept for each host """
+        with self._lock:
+            self._maxsize = value
+            self._slots = {}
+    #----------------------------------------------------------------------
+    @property
+    def idle_timeout(self):
+        """ gets/sets the seconds an idle connection is kept open """
+        return self._idle_timeout
+    #----------------------------------------------------------------------
+    @idle_timeout.setter
+    def idle_timeout(self, value):
+        """ gets/sets the seconds an idle connection is kept open """
+        self._idle_timeout = value
+    #----------------------------------------------------------------------
+    @property
+    def timeout(self):
+        """ gets/sets the socket timeout used for new connections """
+        return self._timeout
+    #----------------------------------------------------------------------
+    @timeout.setter
+    def timeout(self, value):
+        """ gets/sets the socket timeout used for new connections """
+        self._timeout = value
+    #----------------------------------------------------------------------
+    @property
+    def block(self):
+        """ gets/sets if maxsize is a hard limit on concurrent requests """
+        return self._block
+    #----------------------------------------------------------------------
+    @block.setter
+    def block(self, value):
+        """ gets/sets if maxsize is a hard limit on concurrent requests """
+        self._block = value
+    #----------------------------------------------------------------------
+    def _slot(self, key):
+        """ returns the semaphore that limits connections for a key """
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self._maxsize)
+            return self._slots[key]
+    #----------------------------------------------------------------------
+    def _new_connection(self, key, timeout=None):
+        """ opens a new connection for a pool key """
+        scheme, host, port, proxy_url, proxy_port = key
+        if timeout is None:
+            timeout = self._timeout
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        if scheme == "https":
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        if proxy_url is not None:
+            conn = conn_class(proxy_url, proxy_port, timeout=timeout)
+            if scheme == "https":
+                conn.set_tunnel(host, port)
+        else:
+            conn = conn_class(host, port, timeout=timeout)
+        return conn
+    #----------------------------------------------------------------------
+    def _get_connection(self, key, timeout=None):
+        """
+           returns a tuple of (connection, reused, pooled) for a key.
+           pooled is False when the connection is an overflow connection
+           that must be closed once the request is done.
+        """
+        slot = self._slot(key)
+        pooled = slot.acquire(self._block)
+        if pooled:
+            now = time.time()
+            with self._lock:
+                idle = self._idle.get(key, [])
+                while len(idle) > 0:
+                    conn, last_used = idle.pop()
+                    if self._idle_timeout is None or \
+                       now - last_used < self._idle_timeout:
+                        return conn, True, (slot, True)
+                    conn.close()
+        return self._new_connection(key, timeout), False, (slot, pooled)
+    #----------------------------------------------------------------------
+    def _release_connection(self, key, conn, handle, reusable=True):
+        """ puts a connection back into the pool or closes it """
+        slot, pooled = handle
+        if pooled and reusable:
+            with self._lock:
+                self._idle.setdefault(key, []).append((conn, time.time()))
+        else:
+            conn.close()
+        if pooled:
+            slot.release()
+    #----------------------------------------------------------------------
+    def clear(self):
+        """ closes all the idle connections """
+        with self._lock:
+            for key, idle in self._idle.iteritems():
+                for conn, last_used in idle:
+                    conn.close()
+            self._idle = {}
+    #----------------------------------------------------------------------
+    def urlopen(self, url, data=None, headers=None, method=None,
+                proxy_url=None, proxy_port=None, timeout=None,
+                redirects=DEFAULT_MAX_REDIRECTS):
+        """
+           performs an HTTP request over a pooled connection
+           Inputs:
+              url - full url of the resource, including any query string
+              data - request body as a string or a file like object
+                     (read in blocks while it is sent, the Content-Length
+                     header must be given), if given and method is None a
+                     POST is performed
+              headers - dictionary of request headers
+              method - HTTP method, GET or POST by default
+              proxy_url - string - url to proxy server
+              proxy_port - interger - port value if not on port 80
+              timeout - socket timeout for a new connection
+              redirects - number of redirects to follow
+           Output:
+              PooledResponse object
+           Raises urllib2.HTTPError on a 4xx/5xx response and
+           urllib2.URLError when the server can not be reached, just like
+           urllib2.urlopen.
+        """
+        if headers is None:
+            headers = {}
+        if method is None:
+            if data is None:
+                method = "GET"
+            else:
+                method = "POST"
+        parsed = urlparse.urlparse(url)
+        scheme = parsed.scheme.lower()
+        port = parsed.port
+        if port is None:
+            if scheme == "https":
+                port = 443
+            else:
+                port = 80
+        if proxy_url is not None and proxy_port is None:
+            proxy_port = 80
+        key = (scheme, parsed.hostname, port, proxy_url, proxy_port)
+        if proxy_url is not None and scheme == "http":
+            selector = url
+        else:
+            selector = parsed.path or "/"
+            if parsed.query:
+                selector += "?" + parsed.query
+        attempts = 2
+        while True:
+            attempts -= 1
+            conn, reused, handle = self._get_connection(key, timeout)
+            if hasattr(data, "seek"):
+                # a streamed body is read from the start on every attempt
+                data.seek(0)
+            try:
+                conn.request(method, selector, data, headers)
+                response = conn.getresponse()
+                break
+            except (socket.error, httplib.HTTPException), e:
+                self._release_connection(key, conn, handle,
+                                         reusable=False)
+                # a kept-alive connection may have been dropped by the
+                # server, try again once over a fresh connection
+                if reused and attempts > 0:
+                    continue
+                raise urllib2.URLError(e)
+        pooled = PooledResponse(pool=self, key=key, conn=conn,
+                                handle=handle, response=response, url=url)
+        location = response.getheader("location")
+        if response.status in _REDIRECT_CODES and \
+           location is not None and \
+           redirects > 0:
+            pooled.read()
+            pooled.close()
+            new_url = urlparse.urljoin(url, location)
+            if response.status == 303 or \
+               (response.status in (301, 302) and method == "POST"):
+                method = "GET"
+                data = None
+                headers = dict((k, v) for k, v in headers.iteritems()
+                               if k.lower() not in ("content-type",
+                                                    "content-length"))
+            return self.urlopen(url=new_url, data=data, headers=headers,
+                                method=method, proxy_url=proxy_url,
+                                proxy_port=proxy_port, timeout=timeout,
+                                redirects=redirects - 1)
+        if response.status >= 400:
+            body = pooled.read()
+            pooled.close()
+            raise urllib2.HTTPError(url, response.status, response.reason,
+                                    response.msg, StringIO(body))
+        return pooled
+#----------------------------------------------------------------------
+_default_pool = None
+_default_lock = threading.Lock()
+def get_pool():
+    """ returns the process wide connection pool """
+    global _default_pool
+    if _default_pool is None:
+        with _default_lock:
+            if _default_pool is None:
+                _default_pool = ConnectionPool()
+    return _default_pool
+#----------------------------------------------------------------------
+def configure(maxsize=None, idle_timeout=None, timeout=None, block=None):
+    """
+       changes the settings of the process wide connection pool
+       Inputs:
+          maxsize - connections kept open for each host
+          idle_timeout - seconds an unused connection is kept open
+          timeout - socket timeout in seconds for new connections
+          block - if True, maxsize limits the concurrent requests per host
+    """
+    pool = get_pool()
+    if maxsize is not None:
+        pool.maxsize = maxsize
+    if idle_timeout is not None:
+        pool.idle_timeout = idle_timeout
+    if timeout is not None:
+        pool.timeout = timeout
+    if block is not None:
+        pool.block = block
+    return pool
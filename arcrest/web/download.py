@@ -0,0 +1,299 @@
+"""
+
+.. module:: download
+   :platform: Windows, Linux
+   :synopsis: Resumable downloads split into parallel HTTP Range requests.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import time
+import json
+import socket
+import httplib
+import urllib
+import urllib2
+import threading
+from workerpool import WorkerPool
+from streamzip import unzip_stream
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_SPLIT_SIZE = 32 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRIES = 3
+# progress of a ranged download is saved after this many bytes
+_SAVE_EVERY = 16 * 1024 * 1024
+########################################################################
+class DownloadManager(object):
+    """
+       Downloads files to disk through large buffers.  When the server
+       answers Range requests, files larger than split_size are fetched
+       as max_workers concurrent ranges written into <file>.part, and the
+       progress is kept in <file>.part.json so a failed or interrupted
+       download resumes where it stopped, as long as the server returns
+       the same ETag or Last-Modified value.  Other downloads, including
+       those from servers without Range support, start over from the
+       first byte every time.  The final size is checked
+       against the size announced by the server before the .part file is
+       renamed.
+       Inputs:
+          transport - arcrest.web.transport.Transport used for the
+                      requests, the process wide one by default
+          buffer_size - bytes read from the socket at a time
+          split_size - smallest range a file is split into
+          max_workers - number of ranges downloaded at the same time
+          retries - attempts made again for a range after a network error
+                    or a 5xx response
+    """
+    _transport = None
+    _buffer_size = None
+    _split_size = None
+    _max_workers = None
+    _retries = None
+    #----------------------------------------------------------------------
+    def __init__(self, transport=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                 split_size=DEFAULT_SPLIT_SIZE,
+                 max_workers=DEFAULT_MAX_WORKERS, retries=DEFAULT_RETRIES):
+        """Constructor"""
+        if transport is None:
+            from transport import get_transport
+            transport = get_transport()
+        self._transport = transport
+        self._buffer_size = buffer_size
+        self._split_size = max(split_size, 1)
+        self._max_workers = max(max_workers, 1)
+        self._retries = retries
+    #----------------------------------------------------------------------
+    def _open(self, url, headers, proxy_url, proxy_port, first=None, last=None):
+        """ sends a GET, optionally for the bytes first to last """
+        hdrs = self._transport._headers(headers, compress=False)
+        if first is not None:
+            hdrs['Range'] = "bytes=%s-%s" % (first, last)
+        return self._transport.open(url, headers=hdrs,
+                                    proxy_url=proxy_url,
+                                    proxy_port=proxy_port)
+    #----------------------------------------------------------------------
+    def download(self, url, out_path, param_dict=None, headers=None,
+                 proxy_url=None, proxy_port=None, callback=None):
+        """
+           downloads a file
+           Inputs:
+              url - url of the file
+              out_path - path of the saved file
+              param_dict - optional query parameters, ie: the token
+              headers - optional request headers
+              proxy_url - string - url to proxy server
+              proxy_port - interger - port value if not on port 80
+              callback - optional function called as callback(bytes
+                         downloaded, total bytes or None)
+           Output:
+              out_path
+           Raises urllib2.URLError/HTTPError when the file can not be
+           fetched and IOError when it is incomplete.
+        """
+        url = self._transport._secure_url(url)
+        if param_dict:
+            url += "?%s" % urllib.urlencode(param_dict)
+        part = out_path + ".part"
+        try:
+            resp = self._open(url, headers, proxy_url, proxy_port, 0, 0)
+        except urllib2.HTTPError, e:
+            if e.code != 416:
+                raise
+            # empty files can not satisfy a range
+            resp = self._open(url, headers, proxy_url, proxy_port)
+        size = _total_size(resp)
+        if resp.status != 206 or size is None:
+            # no range support, the probe response is the whole file
+            self._stream(resp, part, callback)
+        else:
+            resp.read()
+            resp.close()
+            validator = resp.getheader("etag") or resp.getheader("last-modified")
+            self._ranged(url, part, size, validator, headers,
+                         proxy_url, proxy_port, callback)
+        if os.path.isfile(out_path):
+            os.remove(out_path)
+        os.rename(part, out_path)
+        return out_path
+    #----------------------------------------------------------------------
+    def extract(self, url, out_folder, param_dict=None, headers=None,
+                proxy_url=None, proxy_port=None, callback=None):
+        """
+           downloads a zip file and extracts it while it streams, the
+           archive itself is never written to disk
+           Inputs:
+              url - url of the zip file
+              out_folder - folder the files are extracted to
+              param_dict - optional query parameters, ie: the token
+              headers - optional request headers
+              proxy_url - string - url to proxy server
+              proxy_port - interger - port value if not on port 80
+              callback - optional function called as callback(bytes
+                         downloaded, total bytes or None)
+           Output:
+              list of the extracted file paths
+        """
+        url = self._transport._secure_url(url)
+        if param_dict:
+            url += "?%s" % urllib.urlencode(param_dict)
+        resp = self._open(url, headers, proxy_url, proxy_port)
+        total = resp.getheader("content-length")
+        total = total and int(total)
+        progress = None
+        if callback is not None:
+            progress = lambda count: callback(count, total)
+        try:
+            return unzip_stream(resp, out_folder,
+                                buffer_size=self._buffer_size,
+                                callback=progress)
+        finally:
+            resp.close()
+    #----------------------------------------------------------------------
+    def _stream(self, resp, part, callback):
+        """ writes a whole response to the .part file, from the start """
+        expected = resp.getheader("content-length")
+        done = 0
+        try:
+            with open(part, "wb") as f:
+                while True:
+                    data = resp.read(self._buffer_size)
+                    if not data:
+                        break
+                    f.write(data)
+                    done += len(data)
+                    if callback is not None:
+                        callback(done, expected and int(expected))
+        finally:
+            resp.close()
+        if expected is not None and \
+           resp.getheader("content-encoding") is None and \
+           done != int(expected):
+            raise IOError("incomplete download, %s of %s bytes" % (done, expected))
+    #----------------------------------------------------------------------
+    def _ranged(self, url, part, size, validator, headers,
+                proxy_url, proxy_port, callback):
+        """ downloads a file as concurrent ranges into the .part file """
+        state_path = part + ".json"
+        segments = _load_state(state_path, size, validator)
+        if segments is None:
+            # without a state saved for this version of the file, the
+            # bytes of a .part file can not be trusted, start over
+            for path in (state_path, part):
+                if os.path.isfile(path):
+                    os.remove(path)
+            count = min(self._max_workers,
+                        max(1, -(-size // self._split_size)))
+            step = -(-size // count) if size > 0 else 0
+            segments = [[i * step, min(size, (i + 1) * step), 0]
+                        for i in xrange(count) if i * step < size]
+            # saved before the .part file is extended to its full size
+            _save_state(state_path, size, validator, segments)
+        mode = "r+b" if os.path.isfile(part) else "wb"
+        with open(part, mode) as f:
+            f.truncate(size)
+        lock = threading.Lock()
+        progress = {"saved" : 0}
+        def save():
+            with lock:
+                _save_state(state_path, size, validator, segments)
+        def report(count):
+            with lock:
+                progress['saved'] += count
+                if progress['saved'] >= _SAVE_EVERY:
+                    progress['saved'] = 0
+                    _save_state(state_path, size, validator, segments)
+                if callback is not None:
+                    callback(sum(s[2] for s in segments), size)
+        def fetch(segment):
+            self._fetch_range(url, part, segment, headers, proxy_url,
+                              proxy_port, report, save)
+        todo = [s for s in segments if s[2] < s[1] - s[0]]
+        try:
+            if len(todo) == 1:
+                fetch(todo[0])
+            elif len(todo) > 1:
+                with WorkerPool(max_workers=min(len(todo), self._max_workers)) as pool:
+                    for result in [pool.submit(fetch, s) for s in todo]:
+                        result.get()
+        except:
+            save()
+            raise
+        if os.path.getsize(part) != size or \
+           any(s[2] != s[1] - s[0] for s in segments):
+            save()
+            raise IOError("incomplete download of %s" % part)
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+    #----------------------------------------------------------------------
+    def _fetch_range(self, url, part, segment, headers, proxy_url,
+                     proxy_port, report, save):
+        """ downloads the missing bytes of one segment, retrying errors """
+        attempts = 0
+        while segment[2] < segment[1] - segment[0]:
+            try:
+                resp = self._open(url, headers, proxy_url, proxy_port,
+                                  segment[0] + segment[2], segment[1] - 1)
+                try:
+                    if resp.status != 206:
+                        raise IOError("the server ignored the range request")
+                    # unbuffered, so the saved progress is never ahead
+                    # of the bytes handed to the operating system
+                    with open(part, "r+b", 0) as f:
+                        f.seek(segment[0] + segment[2])
+                        while segment[2] < segment[1] - segment[0]:
+                            data = resp.read(min(self._buffer_size,
+                                                 segment[1] - segment[0] - segment[2]))
+                            if not data:
+                                break
+                            f.write(data)
+                            segment[2] += len(data)
+                            report(len(data))
+                finally:
+                    resp.close()
+                if segment[2] < segment[1] - segment[0]:
+                    raise IOError("connection closed before the end of the range")
+            except (IOError, socket.error, httplib.HTTPException), e:
+                if isinstance(e, urllib2.HTTPError) and e.code < 500:
+                    raise
+                attempts += 1
+                save()
+                if attempts > self._retries:
+                    raise
+                time.sleep(min(2 ** attempts, 30))
+#----------------------------------------------------------------------
+def _total_size(resp):
+    """ returns the file size of a 206 response's Content-Range """
+    content_range = resp.getheader("content-range")
+    if content_range is None or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    if not total.isdigit():
+        return None
+    return int(total)
+#----------------------------------------------------------------------
+def _load_state(path, size, validator):
+    """ returns the saved segments of a download, if they still apply """
+    if not os.path.isfile(path) or not os.path.isfile(path[:-len(".json")]):
+        return None
+    try:
+        with open(path, "rb") as f:
+            state = json.load(f)
+    except ValueError:
+        return None
+    if validator is None or state.get('size') != size or \
+       state.get('validator') != validator:
+        return None
+    return state['segments']
+#----------------------------------------------------------------------
+def _save_state(path, size, validator, segments):
+    """ saves the progress of a ranged download """
+    with open(path + ".tmp", "wb") as f:
+        json.dump({"size" : size,
+                   "validator" : validator,
+                   "segments" : segments}, f)
+    if os.path.isfile(path):
+        os.remove(path)
+    os.rename(path + ".tmp", path)
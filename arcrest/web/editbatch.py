@@ -0,0 +1,351 @@
+"""
+
+.. module:: editbatch
+   :platform: Windows, Linux
+   :synopsis: Sends any number of applyEdits adds, updates and deletes in
+              batches sized by payload bytes and server latency.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import threading
+from workerpool import WorkerPool, host_slot
+from ..common import codec
+
+EDIT_KINDS = ("adds", "updates", "deletes")
+_RESULT_KEYS = {"adds" : "addResults",
+                "updates" : "updateResults",
+                "deletes" : "deleteResults"}
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+DEFAULT_MAX_RECORDS = 2000
+DEFAULT_TARGET_SECONDS = 10.0
+# error codes that fail every record the same way, so splitting the batch
+# does not help (invalid or expired token, no permission)
+_FATAL_CODES = (403, 498, 499)
+########################################################################
+class _BatchSize(object):
+    """
+       number of records in the next batch, moved towards the count the
+       server can apply in target_seconds
+    """
+    _records = None
+    _max_records = None
+    _target = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, records, max_records, target_seconds):
+        """Constructor"""
+        self._records = max(1, min(records, max_records))
+        self._max_records = max_records
+        self._target = target_seconds
+        self._lock = threading.Lock()
+    #----------------------------------------------------------------------
+    @property
+    def records(self):
+        """ returns the current batch size """
+        return self._records
+    #----------------------------------------------------------------------
+    def observe(self, count, seconds):
+        """ records the time a batch of count records took """
+        if count < 1:
+            return
+        with self._lock:
+            ideal = count * self._target / max(seconds, 0.001)
+            # move half way to the ideal size, at most doubling each time
+            size = int((self._records + min(ideal, self._records * 2)) / 2)
+            self._records = max(1, min(size, self._max_records))
+    #----------------------------------------------------------------------
+    def shrink(self):
+        """ halves the batch size after a failed request """
+        with self._lock:
+            self._records = max(1, self._records // 2)
+########################################################################
+class EditReport(object):
+    """
+       Combined per record results of a batched applyEdits.  The add,
+       update and delete results are in the order the edits were given,
+       records that were never applied have success False and an error.
+    """
+    _results = None
+    _requests = 0
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self._results = dict((kind, []) for kind in EDIT_KINDS)
+        self._requests = 0
+    #----------------------------------------------------------------------
+    def _add(self, kind, index, result):
+        """ stores the result of the index-th edit of a kind """
+        self._results[kind].append((index, result))
+    #----------------------------------------------------------------------
+    def _sorted(self, kind):
+        """ returns the results of a kind in input order """
+        self._results[kind].sort(key=lambda item: item[0])
+        return [result for index, result in self._results[kind]]
+    #----------------------------------------------------------------------
+    @property
+    def addResults(self):
+        """ returns the results of the adds """
+        return self._sorted("adds")
+    #----------------------------------------------------------------------
+    @property
+    def updateResults(self):
+        """ returns the results of the updates """
+        return self._sorted("updates")
+    #----------------------------------------------------------------------
+    @property
+    def deleteResults(self):
+        """ returns the results of the deletes """
+        return self._sorted("deletes")
+    #----------------------------------------------------------------------
+    @property
+    def requests(self):
+        """ returns the number of applyEdits requests sent """
+        return self._requests
+    #----------------------------------------------------------------------
+    @property
+    def successCount(self):
+        """ returns the number of records applied """
+        return sum(1 for kind in EDIT_KINDS
+                   for index, result in self._results[kind]
+                   if result.get('success', False))
+    #----------------------------------------------------------------------
+    @property
+    def failures(self):
+        """
+           returns the failed records as a list of (kind, index, result),
+           index being the position of the edit among the edits of its kind
+        """
+        failed = []
+        for kind in EDIT_KINDS:
+            for index, result in sorted(self._results[kind],
+                                        key=lambda item: item[0]):
+                if not result.get('success', False):
+                    failed.append((kind, index, result))
+        return failed
+    #----------------------------------------------------------------------
+    @property
+    def asDictionary(self):
+        """ returns the report like an applyEdits response """
+        return {"addResults" : self.addResults,
+                "updateResults" : self.updateResults,
+                "deleteResults" : self.deleteResults}
+    #----------------------------------------------------------------------
+    def __str__(self):
+        return codec.dumps(self.asDictionary)
+########################################################################
+class EditBatcher(object):
+    """
+       Splits a stream of edits into applyEdits requests.  A batch ends
+       when it reaches max_bytes of JSON or the current batch size, which
+       starts at initial_records and follows the server's latency so each
+       request takes about target_seconds.  Batches run concurrently on
+       max_workers threads (and within the host limit of
+       arcrest.web.workerpool.host_slot).  With rollbackOnFailure, when
+       the server answers a batch with an error or a record of the batch
+       fails, the batch is split in halves that are sent again until the
+       bad records are isolated.  A request that fails without a response
+       (ie: a timeout) is not sent again, since the server may have
+       applied it: its records fail with an "unknown outcome" error.
+       Inputs:
+          url - url of the layer, the per-host limit of
+                arcrest.web.workerpool.host_slot is taken from it
+          post - function posting a parameter dictionary and returning
+                 the parsed response
+          params - parameters sent with every batch (f, token,
+                   gdbVersion...)
+          rollbackOnFailure - the rollbackOnFailure parameter of the
+                              requests
+          encode - function converting an add or update to JSON, the
+                   default is arcrest.common.codec.dumps
+          max_bytes - largest payload of a request
+          initial_records - records in the first batch
+          max_records - largest number of records in a batch
+          target_seconds - time a request should take
+          max_workers - number of requests sent at the same time
+    """
+    _url = None
+    _post = None
+    _params = None
+    _rollbackOnFailure = None
+    _encode = None
+    _max_bytes = None
+    _size = None
+    _max_workers = None
+    #----------------------------------------------------------------------
+    def __init__(self, url, post, params=None, rollbackOnFailure=True,
+                 encode=None, max_bytes=DEFAULT_MAX_BYTES,
+                 initial_records=250, max_records=DEFAULT_MAX_RECORDS,
+                 target_seconds=DEFAULT_TARGET_SECONDS, max_workers=4):
+        """Constructor"""
+        self._url = url
+        self._post = post
+        self._params = dict(params or {})
+        self._rollbackOnFailure = rollbackOnFailure
+        self._encode = encode or codec.dumps
+        self._max_bytes = max_bytes
+        self._size = _BatchSize(initial_records, max_records, target_seconds)
+        self._max_workers = max(1, max_workers)
+    #----------------------------------------------------------------------
+    @property
+    def batchSize(self):
+        """ returns the number of records the next batch will hold """
+        return self._size.records
+    #----------------------------------------------------------------------
+    def _encoded(self, edits):
+        """ yields (kind, index, JSON text, size) for every edit """
+        counters = dict((kind, 0) for kind in EDIT_KINDS)
+        for kind, value in edits:
+            if kind not in counters:
+                raise ValueError("edit kind must be one of %s" % ", ".join(EDIT_KINDS))
+            if kind == "deletes":
+                text = str(value)
+            elif isinstance(value, basestring):
+                text = value
+            else:
+                if hasattr(value, "asDictionary"):
+                    value = value.asDictionary
+                text = self._encode(value)
+            yield kind, counters[kind], text, len(text) + 1
+            counters[kind] += 1
+    #----------------------------------------------------------------------
+    def _batches(self, edits):
+        """ groups the encoded edits, sizing each batch when it starts """
+        batch = []
+        size = 0
+        limit = self._size.records
+        for edit in self._encoded(edits):
+            if len(batch) > 0 and \
+               (len(batch) >= limit or size + edit[3] > self._max_bytes):
+                yield batch
+                batch = []
+                size = 0
+                limit = self._size.records
+            batch.append(edit)
+            size += edit[3]
+        if len(batch) > 0:
+            yield batch
+    #----------------------------------------------------------------------
+    def _payload(self, batch):
+        """ returns the request parameters of a batch """
+        params = dict(self._params)
+        params['rollbackOnFailure'] = self._rollbackOnFailure
+        features = dict((kind, []) for kind in EDIT_KINDS)
+        for kind, index, text, size in batch:
+            features[kind].append(text)
+        if len(features['adds']) > 0:
+            params['adds'] = "[%s]" % ",".join(features['adds'])
+        if len(features['updates']) > 0:
+            params['updates'] = "[%s]" % ",".join(features['updates'])
+        if len(features['deletes']) > 0:
+            params['deletes'] = ",".join(features['deletes'])
+        return params
+    #----------------------------------------------------------------------
+    def _send(self, batch):
+        """
+           sends a batch, splitting it on failures
+           Output:
+              list of (kind, index, result) and the number of requests
+        """
+        params = self._payload(batch)
+        try:
+            with host_slot(self._url):
+                start = time.time()
+                res = self._post(params)
+                elapsed = time.time() - start
+        except Exception, e:
+            res = None
+            reason = str(e)
+        else:
+            reason = "invalid response %s" % (res,)
+        if not isinstance(res, dict):
+            # the server may have applied the batch before the request
+            # failed, sending it again could add the features twice
+            self._size.shrink()
+            error = {"code" : None,
+                     "description" : "unknown outcome, %s" % reason}
+            return [(kind, index, {"success" : False, "error" : error})
+                    for kind, index, text, size in batch], 1
+        if 'error' in res:
+            self._size.shrink()
+            error = res['error']
+            code = error.get('code') if isinstance(error, dict) else None
+            # only a rolled back batch is known to be unapplied
+            if self._rollbackOnFailure and len(batch) > 1 and \
+               code not in _FATAL_CODES:
+                results, requests = self._bisect(batch)
+                return results, requests + 1
+            return [(kind, index, {"success" : False, "error" : error})
+                    for kind, index, text, size in batch], 1
+        self._size.observe(len(batch), elapsed)
+        results = self._results(batch, res)
+        if self._rollbackOnFailure and len(batch) > 1 and \
+           any(not result.get('success', False) for kind, index, result in results):
+            # nothing was applied, resend the halves to find the bad records
+            results, requests = self._bisect(batch)
+            return results, requests + 1
+        return results, 1
+    #----------------------------------------------------------------------
+    def _bisect(self, batch):
+        """ sends both halves of a batch """
+        half = len(batch) // 2
+        first, first_requests = self._send(batch[:half])
+        second, second_requests = self._send(batch[half:])
+        return first + second, first_requests + second_requests
+    #----------------------------------------------------------------------
+    def _results(self, batch, res):
+        """ matches the results of a response to the edits of a batch """
+        results = []
+        position = dict((kind, 0) for kind in EDIT_KINDS)
+        for kind, index, text, size in batch:
+            values = res.get(_RESULT_KEYS[kind]) or []
+            if position[kind] < len(values):
+                result = values[position[kind]]
+            else:
+                result = {"success" : False,
+                          "error" : {"code" : None,
+                                     "description" : "no result returned"}}
+            position[kind] += 1
+            results.append((kind, index, result))
+        return results
+    #----------------------------------------------------------------------
+    def run(self, edits):
+        """
+           applies the edits
+           Inputs:
+              edits - iterable of (kind, value) tuples, kind being "adds",
+                      "updates" or "deletes".  Adds and updates are feature
+                      dictionaries, objects with an asDictionary property
+                      or JSON strings, deletes are object ids.
+           Output:
+              EditReport
+        """
+        report = EditReport()
+        pool = WorkerPool(max_workers=self._max_workers)
+        try:
+            for results, requests in pool.imap(self._send,
+                                               self._batches(edits),
+                                               max_pending=self._max_workers):
+                report._requests += requests
+                for kind, index, result in results:
+                    report._add(kind, index, result)
+        finally:
+            pool.shutdown()
+        return report
+#----------------------------------------------------------------------
+def iter_edits(adds=None, updates=None, deletes=None):
+    """
+       returns an iterable of (kind, value) edits for EditBatcher.run from
+       separate iterables of adds, updates and deletes.  deletes may also be
+       a comma delimited string of object ids.
+    """
+    if isinstance(deletes, basestring):
+        deletes = [oid.strip() for oid in deletes.split(",") if oid.strip() != ""]
+    for kind, values in (("adds", adds), ("updates", updates),
+                         ("deletes", deletes)):
+        if values is None:
+            continue
+        for value in values:
+            yield kind, value
@@ -0,0 +1,161 @@
+"""
+
+.. module:: multipart
+   :platform: Windows, Linux
+   :synopsis: multipart/form-data request body streamed from disk.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import mimetypes
+import mimetools
+
+CHUNK_SIZE = 64 * 1024
+#----------------------------------------------------------------------
+def get_content_type(filename):
+    """ gets the content type of a file """
+    mntype = mimetypes.guess_type(filename)[0]
+    filename, fileExtension = os.path.splitext(filename)
+    if mntype is None and\
+        fileExtension.lower() == ".csv":
+        mntype = "text/csv"
+    elif mntype is None and \
+        fileExtension.lower() == ".sd":
+        mntype = "File/sd"
+    elif mntype is None:
+        #mntype = 'application/octet-stream'
+        mntype= "File/%s" % fileExtension.replace('.', '')
+    return mntype
+#----------------------------------------------------------------------
+def _tostr(obj):
+    """ converts a object to list, if object is a list, it creates a
+        comma seperated string.
+    """
+    if not obj:
+        return ''
+    if isinstance(obj, list):
+        return ', '.join(map(_tostr, obj))
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    return str(obj)
+########################################################################
+class MultipartBody(object):
+    """
+       A multipart/form-data body that is read like a file.  Field values
+       are kept in memory, files are read from disk in chunks while the
+       body is sent, so uploads of any size use constant memory.  The
+       length is known up front and sent as the Content-Length.
+       Inputs:
+          fields - dictionary of form fields
+          files - list of (field name, file path, file name) tuples,
+                  missing files are skipped
+          callback - optional function called as callback(bytes sent,
+                     total bytes) while the body is read
+          boundary - multipart boundary, a random one by default
+    """
+    _parts = None
+    _length = None
+    _boundary = None
+    _callback = None
+    _index = 0
+    _offset = 0
+    _position = 0
+    _file = None
+    #----------------------------------------------------------------------
+    def __init__(self, fields, files, callback=None, boundary=None):
+        """Constructor"""
+        if boundary is None:
+            boundary = mimetools.choose_boundary()
+        self._boundary = boundary
+        self._callback = callback
+        self._parts = []
+        for (key, value) in fields.iteritems():
+            self._parts.append('--%s\r\n' % boundary +
+                               'Content-Disposition: form-data; name="%s"' % key +
+                               '\r\n\r\n' + _tostr(value) + '\r\n')
+        for (key, filepath, filename) in files:
+            if os.path.isfile(filepath):
+                self._parts.append(
+                    '--%s\r\n' % boundary +
+                    'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename) +
+                    'Content-Type: %s\r\n' % get_content_type(filename) +
+                    '\r\n')
+                # files are stored as (path, size) and opened when reached
+                self._parts.append((filepath, os.path.getsize(filepath)))
+                self._parts.append('\r\n')
+        self._parts.append('--' + boundary + '--\r\n\r\n')
+        self._length = sum(part[1] if isinstance(part, tuple) else len(part)
+                           for part in self._parts)
+        self.seek(0)
+    #----------------------------------------------------------------------
+    @property
+    def boundary(self):
+        """ returns the multipart boundary """
+        return self._boundary
+    #----------------------------------------------------------------------
+    @property
+    def contentType(self):
+        """ returns the Content-Type header value """
+        return 'multipart/form-data; boundary=%s' % self._boundary
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """ returns the size of the body in bytes """
+        return self._length
+    #----------------------------------------------------------------------
+    def seek(self, offset, whence=0):
+        """ rewinds the body, only seeking to the start is supported """
+        if offset != 0 or whence != 0:
+            raise IOError("MultipartBody can only seek to the start")
+        self.close()
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+    #----------------------------------------------------------------------
+    def tell(self):
+        """ returns the number of bytes read """
+        return self._position
+    #----------------------------------------------------------------------
+    def read(self, size=-1):
+        """ returns up to size bytes of the body, all of it if size < 0 """
+        if size is None or size < 0:
+            size = self._length - self._position
+        chunks = []
+        wanted = size
+        while wanted > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, tuple):
+                if self._file is None:
+                    self._file = open(part[0], "rb")
+                data = self._file.read(min(wanted, CHUNK_SIZE,
+                                           part[1] - self._offset))
+                if len(data) == 0:
+                    if self._offset < part[1]:
+                        # the Content-Length has already been sent
+                        raise IOError("%s changed while it was uploaded" % part[0])
+                    self._file.close()
+                    self._file = None
+                    self._offset = 0
+                    self._index += 1
+                    continue
+                self._offset += len(data)
+            else:
+                data = part[self._offset:self._offset + wanted]
+                self._offset += len(data)
+                if self._offset >= len(part):
+                    self._offset = 0
+                    self._index += 1
+            chunks.append(data)
+            wanted -= len(data)
+        data = "".join(chunks)
+        self._position += len(data)
+        if self._callback is not None and len(data) > 0:
+            self._callback(self._position, self._length)
+        return data
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the file being read """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
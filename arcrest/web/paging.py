@@ -0,0 +1,110 @@
+"""
+
+.. module:: paging
+   :platform: Windows, Linux
+   :synopsis: Parallel object id range paging used by every "read
+              everything" query.
+
+.. moduleauthor:: Esri
+
+
+"""
+from workerpool import WorkerPool, host_slot, DEFAULT_MAX_WORKERS
+
+DEFAULT_PAGE_SIZE = 1000
+#----------------------------------------------------------------------
+def oid_ranges(oids, page_size=DEFAULT_PAGE_SIZE):
+    """
+       splits object ids into (first, last) ranges holding at most
+       page_size ids each
+       Inputs:
+          oids - list of object ids, in any order
+          page_size - ids in each range
+       Output:
+          list of (first oid, last oid) tuples in ascending order
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+    oids = sorted(oids)
+    ranges = []
+    for i in xrange(0, len(oids), page_size):
+        chunk = oids[i:i + page_size]
+        ranges.append((chunk[0], chunk[-1]))
+    return ranges
+#----------------------------------------------------------------------
+def range_where(oid_field, first, last, where=None):
+    """
+       returns the where clause selecting an object id range, combined
+       with an optional where clause
+    """
+    sql = "%s >= %s AND %s <= %s" % (oid_field, first, oid_field, last)
+    if where is None or where.strip() in ("", "1=1"):
+        return sql
+    return "(%s) AND %s" % (where, sql)
+########################################################################
+class OIDPager(object):
+    """
+       Runs one query per object id range through a bounded worker pool
+       and yields the pages in object id order.  Only a few pages are
+       fetched ahead of the caller, so memory stays bounded by the page
+       size, not by the size of the layer.
+       Inputs:
+          url - url of the layer, the per-host limit of
+                arcrest.web.workerpool.host_slot is taken from it
+          fetch - function taking a where clause and returning a page
+          oid_field - name of the object id field
+          oids - object ids selected by where
+          where - where clause the ranges are combined with
+          page_size - number of records in each page, usually the
+                      maxRecordCount of the layer
+          max_workers - number of pages fetched at the same time
+    """
+    _url = None
+    _fetch = None
+    _oid_field = None
+    _ranges = None
+    _where = None
+    _max_workers = None
+    #----------------------------------------------------------------------
+    def __init__(self, url, fetch, oid_field, oids, where=None,
+                 page_size=DEFAULT_PAGE_SIZE,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """Constructor"""
+        self._url = url
+        self._fetch = fetch
+        self._oid_field = oid_field
+        self._where = where
+        self._max_workers = max_workers
+        self._ranges = oid_ranges(oids or [], page_size)
+    #----------------------------------------------------------------------
+    @property
+    def ranges(self):
+        """ returns the (first, last) object id range of every page """
+        return list(self._ranges)
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """ returns the number of pages """
+        return len(self._ranges)
+    #----------------------------------------------------------------------
+    def _fetch_range(self, oid_range):
+        """ fetches a single page, holding a slot of the host """
+        sql = range_where(self._oid_field, oid_range[0], oid_range[1],
+                          self._where)
+        with host_slot(self._url):
+            return self._fetch(sql)
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        """ yields the pages in object id order """
+        if len(self._ranges) == 0:
+            return
+        if len(self._ranges) == 1 or self._max_workers <= 1:
+            for oid_range in self._ranges:
+                yield self._fetch_range(oid_range)
+            return
+        pool = WorkerPool(max_workers=min(self._max_workers,
+                                          len(self._ranges)))
+        try:
+            for page in pool.imap(self._fetch_range, self._ranges):
+                yield page
+        finally:
+            pool.shutdown()
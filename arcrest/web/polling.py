@@ -0,0 +1,85 @@
+"""
+
+.. module:: polling
+   :platform: Windows, Linux
+   :synopsis: Exponential backoff with jitter for polling asynchronous
+              job status (replicas, geoprocessing jobs...).
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import random
+
+########################################################################
+class Backoff(object):
+    """
+       Delays between status checks: the first check waits initial
+       seconds and each following one factor times longer, up to
+       max_delay.  Each delay is moved by up to +/- jitter (a fraction)
+       so many clients polling one server do not check in lock step.
+       Inputs:
+          initial - first delay in seconds
+          factor - growth of the delay after each check
+          max_delay - longest delay in seconds
+          jitter - random fraction added to or removed from each delay
+    """
+    _initial = None
+    _factor = None
+    _max_delay = None
+    _jitter = None
+    #----------------------------------------------------------------------
+    def __init__(self, initial=1.0, factor=1.5, max_delay=30.0, jitter=0.2):
+        """Constructor"""
+        self._initial = initial
+        self._factor = factor
+        self._max_delay = max_delay
+        self._jitter = jitter
+    #----------------------------------------------------------------------
+    def delays(self):
+        """ yields the delay before each check, forever """
+        delay = self._initial
+        while True:
+            spread = delay * self._jitter
+            yield max(0, delay + random.uniform(-spread, spread))
+            delay = min(delay * self._factor, self._max_delay)
+########################################################################
+class Fixed(Backoff):
+    """ checks every interval seconds """
+    #----------------------------------------------------------------------
+    def __init__(self, interval=1.0):
+        """Constructor"""
+        Backoff.__init__(self, initial=interval, factor=1.0,
+                         max_delay=interval, jitter=0)
+#----------------------------------------------------------------------
+def poll(check, done, strategy=None, timeout=None, first=False):
+    """
+       calls check() until done(result) is True
+       Inputs:
+          check - function returning the current status
+          done - function taking a status, True when polling can stop
+          strategy - Backoff object, Backoff() by default
+          timeout - seconds after which a RuntimeError is raised, None
+                    waits forever
+          first - if True, check() is called once before the first delay
+       Output:
+          the last status returned by check
+    """
+    if strategy is None:
+        strategy = Backoff()
+    start = time.time()
+    if first:
+        status = check()
+        if done(status):
+            return status
+    for delay in strategy.delays():
+        if timeout is not None:
+            remaining = timeout - (time.time() - start)
+            if remaining <= 0:
+                raise RuntimeError("timed out after %s seconds" % timeout)
+            delay = min(delay, remaining)
+        time.sleep(delay)
+        status = check()
+        if done(status):
+            return status
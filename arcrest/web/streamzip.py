@@ -0,0 +1,234 @@
+"""
+
+.. module:: streamzip
+   :platform: Windows, Linux
+   :synopsis: Extracts a zip archive while it is read from a stream, ie:
+              an HTTP response, without saving the archive first.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import zlib
+import struct
+
+_LOCAL_HEADER = "PK\x03\x04"
+_DESCRIPTOR = "PK\x07\x08"
+_CENTRAL_HEADERS = ("PK\x01\x02", "PK\x05\x06", "PK\x06\x06", "PK\x06\x07")
+_LOCAL_FORMAT = "<4sHHHHHIIIHH"
+_LOCAL_SIZE = struct.calcsize(_LOCAL_FORMAT)
+_STORED = 0
+_DEFLATED = 8
+_ZIP64_EXTRA = 0x0001
+_FLAG_ENCRYPTED = 0x1
+_FLAG_DESCRIPTOR = 0x8
+_FLAG_UTF8 = 0x800
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+########################################################################
+class _Reader(object):
+    """ reads a stream in large blocks, with a push back buffer """
+    _stream = None
+    _buffer = None
+    _buffer_size = None
+    _count = None
+    _callback = None
+    #----------------------------------------------------------------------
+    def __init__(self, stream, buffer_size, callback=None):
+        """Constructor"""
+        self._stream = stream
+        self._buffer = ""
+        self._buffer_size = buffer_size
+        self._count = 0
+        self._callback = callback
+    #----------------------------------------------------------------------
+    def read(self, size=None):
+        """ returns up to size bytes, "" at the end of the stream """
+        if size is None:
+            size = self._buffer_size
+        if not self._buffer:
+            self._buffer = self._stream.read(self._buffer_size)
+            self._count += len(self._buffer)
+            if self._callback is not None and self._buffer:
+                self._callback(self._count)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+    #----------------------------------------------------------------------
+    def read_full(self, size):
+        """ returns size bytes, fewer only at the end of the stream """
+        parts = []
+        while size > 0:
+            data = self.read(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return "".join(parts)
+    #----------------------------------------------------------------------
+    def read_exact(self, size):
+        """ returns exactly size bytes or raises an IOError """
+        data = self.read_full(size)
+        if len(data) < size:
+            raise IOError("the zip stream ended unexpectedly")
+        return data
+    #----------------------------------------------------------------------
+    def unread(self, data):
+        """ puts bytes back in front of the stream """
+        self._buffer = data + self._buffer
+########################################################################
+class _NullFile(object):
+    """ discards what is written to it """
+    def write(self, data):
+        pass
+#----------------------------------------------------------------------
+def _zip64_sizes(extra, compressed, size):
+    """ reads the sizes stored in the zip64 extra field of a local header """
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack("<HH", extra[pos:pos + 4])
+        if tag == _ZIP64_EXTRA:
+            values = extra[pos + 4:pos + 4 + length]
+            # the uncompressed size comes first, each only when the local
+            # header holds 0xFFFFFFFF
+            offset = 0
+            if size == 0xFFFFFFFF and offset + 8 <= len(values):
+                size = struct.unpack("<Q", values[offset:offset + 8])[0]
+                offset += 8
+            if compressed == 0xFFFFFFFF and offset + 8 <= len(values):
+                compressed = struct.unpack("<Q", values[offset:offset + 8])[0]
+            return compressed, size, True
+        pos += 4 + length
+    return compressed, size, False
+#----------------------------------------------------------------------
+def _target(out_folder, name):
+    """ returns the path of an entry, refusing paths outside out_folder """
+    name = name.replace("\\", "/")
+    parts = [p for p in name.split("/") if p not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        raise IOError("unsafe path in zip archive: %s" % name)
+    root = os.path.abspath(out_folder)
+    return os.path.join(root, *parts)
+#----------------------------------------------------------------------
+def _copy_stored(reader, out, compressed):
+    """ copies a stored entry of known size, returns its crc """
+    crc = 0
+    remaining = compressed
+    while remaining > 0:
+        data = reader.read(min(remaining, DEFAULT_BUFFER_SIZE))
+        if not data:
+            raise IOError("the zip stream ended unexpectedly")
+        crc = zlib.crc32(data, crc)
+        out.write(data)
+        remaining -= len(data)
+    return crc
+#----------------------------------------------------------------------
+def _copy_deflated(reader, out, compressed):
+    """
+       inflates an entry, returns its crc.  When compressed is None the
+       size is not known and the end of the deflate stream marks the end
+       of the entry, the bytes read past it are pushed back.
+    """
+    crc = 0
+    inflater = zlib.decompressobj(-15)
+    remaining = compressed
+    while remaining is None or remaining > 0:
+        if remaining is None:
+            data = reader.read()
+        else:
+            data = reader.read(min(remaining, DEFAULT_BUFFER_SIZE))
+            remaining -= len(data)
+        if not data:
+            raise IOError("the zip stream ended unexpectedly")
+        chunk = inflater.decompress(data)
+        if chunk:
+            crc = zlib.crc32(chunk, crc)
+            out.write(chunk)
+        if inflater.unused_data:
+            reader.unread(inflater.unused_data)
+            break
+    chunk = inflater.flush()
+    if chunk:
+        crc = zlib.crc32(chunk, crc)
+        out.write(chunk)
+    return crc
+#----------------------------------------------------------------------
+def _read_descriptor(reader, zip64):
+    """ reads the data descriptor written after an entry, returns its crc """
+    head = reader.read_exact(4)
+    if head == _DESCRIPTOR:
+        head = reader.read_exact(4)
+    crc = struct.unpack("<I", head)[0]
+    reader.read_exact(16 if zip64 else 8)
+    return crc
+#----------------------------------------------------------------------
+def unzip_stream(stream, out_folder, buffer_size=DEFAULT_BUFFER_SIZE,
+                 callback=None):
+    """
+       extracts a zip archive from a stream as it is read.  Only the local
+       headers are used, so the archive never has to be seekable or
+       saved to disk.  Stored and deflated entries are supported, the crc
+       of every file is checked.
+       Inputs:
+          stream - object with a read(size) method, ie: an HTTP response
+          out_folder - folder the files are extracted to
+          buffer_size - bytes read from the stream at a time
+          callback - optional function called as callback(bytes read)
+       Output:
+          list of the extracted file paths
+    """
+    reader = _Reader(stream, buffer_size, callback)
+    extracted = []
+    while True:
+        signature = reader.read_full(4)
+        if len(signature) < 4:
+            if signature:
+                raise IOError("the zip stream ended unexpectedly")
+            break
+        if signature in _CENTRAL_HEADERS:
+            # the central directory repeats what was already extracted
+            break
+        if signature != _LOCAL_HEADER:
+            raise IOError("not a zip archive, or a corrupt one")
+        header = struct.unpack(_LOCAL_FORMAT,
+                               signature + reader.read_exact(_LOCAL_SIZE - 4))
+        flags, method, crc = header[2], header[3], header[6]
+        compressed, size = header[7], header[8]
+        name = reader.read_exact(header[9])
+        extra = reader.read_exact(header[10])
+        if flags & _FLAG_UTF8:
+            name = name.decode("utf-8")
+        if flags & _FLAG_ENCRYPTED:
+            raise IOError("encrypted zip entries are not supported: %s" % name)
+        compressed, size, zip64 = _zip64_sizes(extra, compressed, size)
+        has_descriptor = bool(flags & _FLAG_DESCRIPTOR)
+        if has_descriptor and method == _STORED:
+            raise IOError("stored zip entries without sizes can not be "
+                          "streamed: %s" % name)
+        if method not in (_STORED, _DEFLATED):
+            raise IOError("unsupported compression method %s: %s" % (method, name))
+        path = _target(out_folder, name)
+        if name.endswith("/"):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            if has_descriptor:
+                _copy_deflated(reader, _NullFile(), None)
+                _read_descriptor(reader, zip64)
+            else:
+                _copy_stored(reader, _NullFile(), compressed)
+            continue
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(path, "wb") as out:
+            if method == _STORED:
+                actual = _copy_stored(reader, out, compressed)
+            elif has_descriptor:
+                actual = _copy_deflated(reader, out, None)
+            else:
+                actual = _copy_deflated(reader, out, compressed)
+        if has_descriptor:
+            crc = _read_descriptor(reader, zip64)
+        if actual & 0xFFFFFFFF != crc:
+            raise IOError("bad crc for %s" % name)
+        extracted.append(path)
+    return extracted
@@ -0,0 +1,213 @@
+"""
+
+.. module:: tiles
+   :platform: Windows, Linux
+   :synopsis: Fetches map tiles concurrently, spread over the tile
+              servers of a service, through an optional local tile cache.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import socket
+import urllib
+import urllib2
+import httplib
+import itertools
+import threading
+from workerpool import WorkerPool, host_slot, DEFAULT_MAX_WORKERS
+
+DEFAULT_RETRIES = 3
+########################################################################
+class TileFetcher(object):
+    """
+       Downloads tiles from <url>/tile/<level>/<row>/<col>.  Requests are
+       sent round robin to the urls given (the tileServers of a service),
+       each limited by the per host limit of workerpool.host_slot, and a
+       failed request is retried on the next url.
+       With a TileCache, cached tiles younger than max_age seconds are
+       returned without a request, older ones are revalidated with
+       If-None-Match/If-Modified-Since and only downloaded again when
+       they changed.
+       Inputs:
+          urls - list of service urls, or one url
+          cache - optional arcrest.common.tilecache.TileCache
+          max_age - seconds a cached tile is used without asking the
+                    server, None never revalidates cached tiles
+          param_dict - query parameters added to each request, ie: token
+          max_workers - tiles downloaded at the same time by fetch_many
+          retries - attempts made again after a network error or a 5xx
+          transport - arcrest.web.transport.Transport, the process wide
+                      one by default
+          referer - optional Referer header
+          proxy_url - string - url to proxy server
+          proxy_port - interger - port value if not on port 80
+    """
+    _urls = None
+    _cache = None
+    _max_age = None
+    _query = None
+    _max_workers = None
+    _retries = None
+    _transport = None
+    _referer = None
+    _proxy_url = None
+    _proxy_port = None
+    _counter = None
+    _stats = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, urls, cache=None, max_age=None, param_dict=None,
+                 max_workers=DEFAULT_MAX_WORKERS, retries=DEFAULT_RETRIES,
+                 transport=None, referer=None, proxy_url=None,
+                 proxy_port=None):
+        """Constructor"""
+        if isinstance(urls, basestring):
+            urls = [urls]
+        if len(urls) == 0:
+            raise ValueError("at least one tile server url is required")
+        if transport is None:
+            from transport import get_transport
+            transport = get_transport()
+        self._urls = [u.rstrip("/") for u in urls]
+        self._cache = cache
+        self._max_age = max_age
+        self._query = ""
+        if param_dict:
+            self._query = "?" + urllib.urlencode(param_dict)
+        self._max_workers = max(max_workers, 1)
+        self._retries = retries
+        self._transport = transport
+        self._referer = referer
+        self._proxy_url = proxy_url
+        self._proxy_port = proxy_port
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {"hits" : 0, "revalidated" : 0, "downloaded" : 0,
+                       "missing" : 0, "failed" : 0, "bytes" : 0}
+    #----------------------------------------------------------------------
+    @property
+    def stats(self):
+        """
+           returns the counts of tiles served from the cache (hits),
+           confirmed unchanged by the server (revalidated), downloaded,
+           missing on the server and failed, and the bytes downloaded
+        """
+        with self._lock:
+            return dict(self._stats)
+    #----------------------------------------------------------------------
+    def _count(self, name, value=1):
+        """ adds to a statistic """
+        with self._lock:
+            self._stats[name] += value
+    #----------------------------------------------------------------------
+    @property
+    def cache(self):
+        """ returns the TileCache, or None """
+        return self._cache
+    #----------------------------------------------------------------------
+    def tile_url(self, level, row, col):
+        """ returns the url of a tile on the next tile server """
+        url = self._urls[self._counter.next() % len(self._urls)]
+        return "%s/tile/%s/%s/%s%s" % (url, level, row, col, self._query)
+    #----------------------------------------------------------------------
+    def fetch(self, level, row, col):
+        """
+           returns the image of a tile, or None when the server has no
+           tile there.  Raises the last error once the retries are used.
+        """
+        cached = None
+        if self._cache is not None:
+            cached = self._cache.get(level, row, col)
+            if cached is not None and \
+               (self._max_age is None or
+                time.time() - (cached[3] or 0) < self._max_age):
+                self._count('hits')
+                return cached[0]
+        headers = {}
+        if cached is not None:
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+            if cached[2]:
+                headers['If-Modified-Since'] = cached[2]
+        attempts = 0
+        while True:
+            url = self.tile_url(level, row, col)
+            try:
+                with host_slot(url):
+                    resp = self._transport.open(
+                        url,
+                        headers=self._transport._headers(headers,
+                                                         self._referer,
+                                                         compress=False),
+                        proxy_url=self._proxy_url,
+                        proxy_port=self._proxy_port)
+                    try:
+                        data = resp.read()
+                    finally:
+                        resp.close()
+                break
+            except urllib2.HTTPError, e:
+                if e.code == 404:
+                    self._count('missing')
+                    if cached is not None:
+                        self._cache.remove(level, row, col)
+                    return None
+                if e.code < 500 or attempts >= self._retries:
+                    self._count('failed')
+                    raise
+            except (IOError, socket.error, httplib.HTTPException), e:
+                if attempts >= self._retries:
+                    self._count('failed')
+                    raise
+            attempts += 1
+            time.sleep(min(2 ** attempts * 0.25, 10))
+        if resp.status == 304 and cached is not None:
+            self._count('revalidated')
+            self._cache.touch(level, row, col)
+            return cached[0]
+        content_type = (resp.getheader("content-type") or "").lower()
+        if content_type.startswith("application/json") or \
+           content_type.startswith("text/"):
+            # the service answered with an error message instead of an image
+            self._count('failed')
+            raise IOError("no tile image returned for %s/%s/%s: %s" %
+                          (level, row, col, data[:200]))
+        self._count('downloaded')
+        self._count('bytes', len(data))
+        if self._cache is not None:
+            self._cache.put(level, row, col, data,
+                            etag=resp.getheader("etag"),
+                            last_modified=resp.getheader("last-modified"))
+        return data
+    #----------------------------------------------------------------------
+    def fetch_many(self, tiles, max_pending=None):
+        """
+           downloads tiles concurrently
+           Inputs:
+              tiles - iterable of (level, row, col), ie: from
+                      arcrest.common.tilegrid.TileGrid.tiles
+              max_pending - tiles requested ahead of the one being
+                            returned, 4 * max_workers by default
+           Output:
+              generator of (level, row, col, data, error) in the order of
+              tiles.  data is None for missing or failed tiles, error is
+              the exception of a failed tile.
+        """
+        if max_pending is None:
+            max_pending = 4 * self._max_workers
+        def fetch(tile):
+            level, row, col = tile
+            try:
+                return (level, row, col, self.fetch(level, row, col), None)
+            except Exception, e:
+                return (level, row, col, None, e)
+        with WorkerPool(max_workers=self._max_workers) as pool:
+            results = pool.imap(fetch, tiles, max_pending=max_pending)
+            try:
+                for result in results:
+                    yield result
+            finally:
+                # cancels the queued fetches when the caller stops early
+                results.close()
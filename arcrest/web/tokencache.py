@@ -0,0 +1,170 @@
+"""
+
+.. module:: tokencache
+   :platform: Windows, Linux
+   :synopsis: Process wide cache of security tokens shared by all service
+              instances.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+import hashlib
+import threading
+
+DEFAULT_REFRESH_MARGIN = 120
+DEFAULT_LIFETIME = 60 * 60
+########################################################################
+class _TokenEntry(object):
+    """ holds a cached token response and its expiration """
+    response = None
+    expires = None
+    digest = None
+    generator = None
+    refreshing = False
+    lock = None
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.lock = threading.Lock()
+        self.refreshing = False
+########################################################################
+class TokenCache(object):
+    """
+       Thread safe cache of generateToken responses keyed by
+       (token url, username, referer).  A cached token is reused until
+       refresh_margin seconds before it expires; inside that window the
+       current token is still returned while a new one is requested in a
+       background thread.  Callers asking for the same key at the same
+       time share one token request.
+       Inputs:
+          refresh_margin - seconds before expiration when a token is
+                           refreshed
+          default_lifetime - lifetime in seconds used when a token
+                             response does not say when it expires
+    """
+    _refresh_margin = None
+    _default_lifetime = None
+    _entries = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 default_lifetime=DEFAULT_LIFETIME):
+        """Constructor"""
+        self._refresh_margin = refresh_margin
+        self._default_lifetime = default_lifetime
+        self._entries = {}
+        self._lock = threading.Lock()
+    #----------------------------------------------------------------------
+    @property
+    def refresh_margin(self):
+        """ gets/sets the seconds before expiration a token is refreshed """
+        return self._refresh_margin
+    #----------------------------------------------------------------------
+    @refresh_margin.setter
+    def refresh_margin(self, value):
+        """ gets/sets the seconds before expiration a token is refreshed """
+        self._refresh_margin = value
+    #----------------------------------------------------------------------
+    def _entry(self, key):
+        """ returns the entry for a key, creating it if needed """
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = _TokenEntry()
+            return self._entries[key]
+    #----------------------------------------------------------------------
+    def _expiration(self, response):
+        """ returns the expiration of a token response in epoch seconds """
+        expires = None
+        if isinstance(response, dict):
+            expires = response.get('expires')
+        if expires is None:
+            return time.time() + self._default_lifetime
+        return float(expires) / 1000.0
+    #----------------------------------------------------------------------
+    def _store(self, entry, response, digest, generator):
+        """ saves a successful token response in an entry """
+        entry.response = response
+        entry.expires = self._expiration(response)
+        entry.digest = digest
+        entry.generator = generator
+    #----------------------------------------------------------------------
+    def _refresh(self, entry):
+        """ requests a new token for an entry in the background """
+        def run():
+            try:
+                response = entry.generator()
+                if isinstance(response, dict) and 'token' in response:
+                    with entry.lock:
+                        self._store(entry, response, entry.digest,
+                                    entry.generator)
+            except Exception:
+                # the current token is still valid, the next call after
+                # it expires will request a new one in the foreground
+                pass
+            finally:
+                entry.refreshing = False
+        entry.refreshing = True
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+    #----------------------------------------------------------------------
+    def get(self, token_url, username, referer, generator, password=None):
+        """
+           returns a token response for a key, generating it if needed
+           Inputs:
+              token_url - url of the generateToken endpoint
+              username - user the token is for
+              referer - referer (or client) the token is bound to
+              generator - function without arguments that performs the
+                          generateToken request and returns the response
+                          as a dictionary
+              password - optional, a cached token is only reused when it
+                         was generated with the same password
+           Output:
+              the token response dictionary.  Error responses are
+              returned but never cached.
+        """
+        key = (token_url, username, referer)
+        digest = None
+        if password is not None:
+            if isinstance(password, unicode):
+                password = password.encode('utf-8')
+            digest = hashlib.sha1(password).hexdigest()
+        entry = self._entry(key)
+        with entry.lock:
+            now = time.time()
+            if entry.response is not None and \
+               entry.digest == digest and \
+               now < entry.expires:
+                if now >= entry.expires - self._refresh_margin and \
+                   not entry.refreshing:
+                    entry.generator = generator
+                    self._refresh(entry)
+                return entry.response
+            response = generator()
+            if isinstance(response, dict) and 'token' in response:
+                self._store(entry, response, digest, generator)
+            return response
+    #----------------------------------------------------------------------
+    def invalidate(self, token_url, username, referer):
+        """ removes a cached token, the next call requests a new one """
+        with self._lock:
+            self._entries.pop((token_url, username, referer), None)
+    #----------------------------------------------------------------------
+    def clear(self):
+        """ removes all the cached tokens """
+        with self._lock:
+            self._entries = {}
+#----------------------------------------------------------------------
+_default_cache = None
+_default_lock = threading.Lock()
+def get_token_cache():
+    """ returns the process wide token cache """
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = TokenCache()
+    return _default_cache
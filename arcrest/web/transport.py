@@ -0,0 +1,524 @@
+"""
+
+.. module:: transport
+   :platform: Windows, Linux
+   :synopsis: Single HTTP transport used by the agol, ags and webmap base
+              classes.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import gzip
+import zlib
+import time
+import urllib
+import urllib2
+import urlparse
+import threading
+from cStringIO import StringIO
+import connectionpool
+from multipart import MultipartBody, get_content_type, _tostr
+from download import DownloadManager
+from ..common import codec
+
+REQUEST_HOOK = "request"
+RESPONSE_HOOK = "response"
+_SSL_MESSAGE = 'Request not made over ssl'
+########################################################################
+class Transport(object):
+    """
+       Performs all the web requests made by the service classes.
+       Connections come from a keep-alive ConnectionPool, responses are
+       transparently decompressed and JSON responses that say the request
+       must be made over SSL are re-sent over https.
+       Inputs:
+          pool - ConnectionPool object, defaults to the process wide pool
+          compress - if True, gzip/deflate encoded responses are requested
+          timeout - socket timeout in seconds for each request
+          useragent - value of the User-Agent header
+          convert_unicode - if True, strings in JSON responses are
+                            returned as utf-8 str objects (converted while
+                            the response is decoded), else as unicode
+       Hooks:
+          Functions can be registered with add_hook().
+          "request" hooks are called as func(method, url, headers) before
+          a request is sent and may change the headers dictionary.
+          "response" hooks are called as func(method, url, status,
+          elapsed) once the response headers have been received.
+       SSL:
+          Hosts that answered 'Request not made over ssl' are remembered
+          and later requests to them go straight to https.  Hosts can
+          also be registered up front with require_ssl().
+    """
+    _pool = None
+    _compress = None
+    _timeout = None
+    _useragent = None
+    _hooks = None
+    _hook_lock = None
+    _ssl_hosts = None
+    _ssl_lock = None
+    _convert_unicode = None
+    #----------------------------------------------------------------------
+    def __init__(self, pool=None, compress=True, timeout=None,
+                 useragent="ArcREST", convert_unicode=True):
+        """Constructor"""
+        self._pool = pool
+        self._compress = compress
+        self._timeout = timeout
+        self._useragent = useragent
+        self._convert_unicode = convert_unicode
+        self._hooks = {REQUEST_HOOK : [],
+                       RESPONSE_HOOK : []}
+        self._hook_lock = threading.Lock()
+        self._ssl_hosts = set()
+        self._ssl_lock = threading.Lock()
+    #----------------------------------------------------------------------
+    @property
+    def pool(self):
+        """ gets/sets the connection pool """
+        if self._pool is None:
+            return connectionpool.get_pool()
+        return self._pool
+    #----------------------------------------------------------------------
+    @pool.setter
+    def pool(self, value):
+        """ gets/sets the connection pool """
+        self._pool = value
+    #----------------------------------------------------------------------
+    @property
+    def compress(self):
+        """ gets/sets if compressed responses are requested """
+        return self._compress
+    #----------------------------------------------------------------------
+    @compress.setter
+    def compress(self, value):
+        """ gets/sets if compressed responses are requested """
+        self._compress = value
+    #----------------------------------------------------------------------
+    @property
+    def timeout(self):
+        """ gets/sets the socket timeout in seconds """
+        return self._timeout
+    #----------------------------------------------------------------------
+    @timeout.setter
+    def timeout(self, value):
+        """ gets/sets the socket timeout in seconds """
+        self._timeout = value
+    #----------------------------------------------------------------------
+    @property
+    def useragent(self):
+        """ gets/sets the User-Agent header value """
+        return self._useragent
+    #----------------------------------------------------------------------
+    @useragent.setter
+    def useragent(self, value):
+        """ gets/sets the User-Agent header value """
+        self._useragent = value
+    #----------------------------------------------------------------------
+    @property
+    def convert_unicode(self):
+        """ gets/sets if JSON strings are returned as utf-8 str objects """
+        return self._convert_unicode
+    #----------------------------------------------------------------------
+    @convert_unicode.setter
+    def convert_unicode(self, value):
+        """ gets/sets if JSON strings are returned as utf-8 str objects """
+        self._convert_unicode = value
+    #----------------------------------------------------------------------
+    def add_hook(self, event, func):
+        """ registers a function for the "request" or "response" event """
+        if event not in self._hooks:
+            raise ValueError("Invalid hook event: %s" % event)
+        with self._hook_lock:
+            self._hooks[event] = self._hooks[event] + [func]
+    #----------------------------------------------------------------------
+    def remove_hook(self, event, func):
+        """ unregisters a function added with add_hook """
+        with self._hook_lock:
+            self._hooks[event] = [f for f in self._hooks[event] \
+                                  if f is not func]
+    #----------------------------------------------------------------------
+    def require_ssl(self, url):
+        """
+           records that a host only accepts https requests
+           Inputs:
+              url - full url or host name of the server
+        """
+        host = _hostname(url)
+        if host is not None:
+            with self._ssl_lock:
+                self._ssl_hosts.add(host)
+    #----------------------------------------------------------------------
+    def requires_ssl(self, url):
+        """ returns True if the url's host is known to require https """
+        return _hostname(url) in self._ssl_hosts
+    #----------------------------------------------------------------------
+    def _secure_url(self, url):
+        """ switches the url to https if its host requires it """
+        if url.startswith('http://') and self.requires_ssl(url):
+            return url.replace('http://', 'https://', 1)
+        return url
+    #----------------------------------------------------------------------
+    def _headers(self, headers=None, referer=None, compress=None):
+        """ builds the request headers """
+        if compress is None:
+            compress = self._compress
+        hdrs = {'User-Agent' : self._useragent}
+        if referer is not None:
+            hdrs['Referer'] = referer
+        if compress:
+            hdrs['Accept-Encoding'] = 'gzip, deflate'
+        if headers is not None:
+            hdrs.update(headers)
+        return hdrs
+    #----------------------------------------------------------------------
+    def open(self, url, data=None, headers=None, method=None,
+             proxy_url=None, proxy_port=None):
+        """
+           sends a request and returns the response object
+           Inputs:
+              url - full url, including the query string
+              data - request body, if given a POST is performed
+              headers - dictionary of request headers
+              method - HTTP method (GET/POST)
+              proxy_url - string - url to proxy server
+              proxy_port - interger - port value if not on port 80
+           Output:
+              connectionpool.PooledResponse
+        """
+        if headers is None:
+            headers = {}
+        if method is None:
+            if data is None:
+                method = "GET"
+            else:
+                method = "POST"
+        for hook in self._hooks[REQUEST_HOOK]:
+            hook(method, url, headers)
+        start = time.time()
+        resp = self.pool.urlopen(url, data=data, headers=headers,
+                                 method=method,
+                                 proxy_url=proxy_url,
+                                 proxy_port=proxy_port,
+                                 timeout=self._timeout)
+        for hook in self._hooks[RESPONSE_HOOK]:
+            hook(method, url, resp.status, time.time() - start)
+        return resp
+    #----------------------------------------------------------------------
+    def _read(self, resp):
+        """ reads and decompresses a whole response body """
+        data = resp.read()
+        resp.close()
+        encoding = resp.info().get('Content-Encoding')
+        if encoding == 'gzip':
+            data = gzip.GzipFile(fileobj=StringIO(data)).read()
+        elif encoding == 'deflate':
+            data = zlib.decompress(data)
+        return data
+    #----------------------------------------------------------------------
+    def _loads(self, data, convert_unicode=None):
+        """ parses a JSON response body """
+        if data == "" or data is None or data == 'null':
+            return ""
+        if convert_unicode is None:
+            convert_unicode = self._convert_unicode
+        return codec.loads(data, convert_unicode=convert_unicode)
+    #----------------------------------------------------------------------
+    def _requires_ssl(self, result, url):
+        """ checks for the 'Request not made over ssl' error """
+        return isinstance(result, dict) and \
+               'error' in result and \
+               isinstance(result['error'], dict) and \
+               result['error'].get('message') == _SSL_MESSAGE and \
+               url.startswith('http://')
+    #----------------------------------------------------------------------
+    def get(self, url, param_dict, headers=None, referer=None,
+            proxy_url=None, proxy_port=None, compress=None,
+            convert_unicode=None):
+        """
+           performs a GET operation and returns the parsed JSON response
+           Inputs:
+              convert_unicode - overrides the convert_unicode property of
+                                the transport for this request
+        """
+        url = self._secure_url(url)
+        format_url = url + "?%s" % urllib.urlencode(param_dict)
+        resp = self.open(format_url,
+                         headers=self._headers(headers, referer, compress),
+                         proxy_url=proxy_url, proxy_port=proxy_port)
+        result = self._loads(self._read(resp), convert_unicode)
+        if self._requires_ssl(result, url):
+            self.require_ssl(url)
+            return self.get(url=url.replace('http://', 'https://', 1),
+                            param_dict=param_dict, headers=headers,
+                            referer=referer, proxy_url=proxy_url,
+                            proxy_port=proxy_port, compress=compress,
+                            convert_unicode=convert_unicode)
+        return result
+    #----------------------------------------------------------------------
+    def get_bytes(self, url, param_dict, headers=None, referer=None,
+                  proxy_url=None, proxy_port=None, compress=None):
+        """
+           performs a GET operation and returns the decompressed response
+           body without parsing it, ie: for f=pbf requests
+        """
+        url = self._secure_url(url)
+        format_url = url + "?%s" % urllib.urlencode(param_dict)
+        resp = self.open(format_url,
+                         headers=self._headers(headers, referer, compress),
+                         proxy_url=proxy_url, proxy_port=proxy_port)
+        data = self._read(resp)
+        if url.startswith('http://') and data.lstrip()[:1] == "{" and \
+           self._requires_ssl(self._loads(data), url):
+            self.require_ssl(url)
+            return self.get_bytes(url=url.replace('http://', 'https://', 1),
+                                  param_dict=param_dict, headers=headers,
+                                  referer=referer, proxy_url=proxy_url,
+                                  proxy_port=proxy_port, compress=compress)
+        return data
+    #----------------------------------------------------------------------
+    def get_stream(self, url, param_dict, headers=None, referer=None,
+                   proxy_url=None, proxy_port=None, compress=None):
+        """
+           performs a GET operation and returns a DecodedStream reading
+           the decompressed response body as it arrives, for responses
+           too large to be held in memory.  The caller closes the stream.
+        """
+        url = self._secure_url(url)
+        format_url = url + "?%s" % urllib.urlencode(param_dict)
+        resp = self.open(format_url,
+                         headers=self._headers(headers, referer, compress),
+                         proxy_url=proxy_url, proxy_port=proxy_port)
+        return DecodedStream(resp)
+    #----------------------------------------------------------------------
+    def post(self, url, param_dict, headers=None, referer=None,
+             proxy_url=None, proxy_port=None, compress=None,
+             convert_unicode=None):
+        """
+           performs a POST operation and returns the parsed JSON response
+           Inputs:
+              convert_unicode - overrides the convert_unicode property of
+                                the transport for this request
+        """
+        url = self._secure_url(url)
+        hdrs = self._headers(headers, referer, compress)
+        hdrs['Content-Type'] = 'application/x-www-form-urlencoded'
+        resp = self.open(url, data=urllib.urlencode(param_dict),
+                         headers=hdrs,
+                         proxy_url=proxy_url, proxy_port=proxy_port)
+        result = self._loads(self._read(resp), convert_unicode)
+        if self._requires_ssl(result, url):
+            self.require_ssl(url)
+            return self.post(url=url.replace('http://', 'https://', 1),
+                             param_dict=param_dict, headers=headers,
+                             referer=referer, proxy_url=proxy_url,
+                             proxy_port=proxy_port, compress=compress,
+                             convert_unicode=convert_unicode)
+        return result
+    #----------------------------------------------------------------------
+    def post_multipart(self, host, selector, fields, files, ssl=False,
+                       port=None, proxy_url=None, proxy_port=None,
+                       callback=None):
+        """
+           performs a multipart POST and returns the response text
+           Inputs:
+              host - string - root url (no http:// or https://)
+              selector - string - everything after the host
+              fields - dictionary - additional parameters
+              files - list of tuples - (field name, file path, file name)
+              ssl - option to use SSL
+              port - port of the host if not the default one
+              proxy_url - string - url to proxy server
+              proxy_port - interger - port value if not on port 80
+              callback - optional function called as callback(bytes sent,
+                         total bytes) while the body is uploaded
+        """
+        if not ssl and self.requires_ssl(host):
+            ssl = True
+        # the files are streamed from disk while the request is sent
+        body = MultipartBody(fields, files, callback=callback)
+        headers = self._headers(compress=False)
+        headers['Content-Type'] = body.contentType
+        headers['Content-Length'] = str(len(body))
+        if ssl:
+            scheme = "https"
+        else:
+            scheme = "http"
+        if port is None or port in (80, 443):
+            netloc = host
+        else:
+            netloc = "%s:%s" % (host, port)
+        url = "%s://%s%s" % (scheme, netloc, selector)
+        try:
+            resp = self.open(url, data=body, headers=headers,
+                             proxy_url=proxy_url, proxy_port=proxy_port)
+        finally:
+            body.close()
+        resp_data = self._read(resp)
+        if resp_data == "":
+            return ""
+        if not ssl and \
+           self._requires_ssl(self._loads(resp_data), url):
+            self.require_ssl(host)
+            return self.post_multipart(host=host, selector=selector,
+                                       fields=fields, files=files,
+                                       ssl=True, port=port,
+                                       proxy_url=proxy_url,
+                                       proxy_port=proxy_port,
+                                       callback=callback)
+        return resp_data
+    #----------------------------------------------------------------------
+    def encode_multipart_formdata(self, fields, files):
+        """ builds a multipart/form-data body, returns (boundary, body) """
+        body = MultipartBody(fields, files)
+        return body.boundary, body.read()
+    #----------------------------------------------------------------------
+    def download(self, url, save_path, file_name,
+                 proxy_url=None, proxy_port=None, param_dict=None,
+                 callback=None):
+        """
+           downloads a file with a download.DownloadManager: large files
+           are fetched as parallel ranges when the server supports them,
+           an interrupted ranged download resumes from its .part file
+           while the file is unchanged on the server, and the size is
+           verified before the file is renamed.
+           Inputs:
+              param_dict - optional query parameters, ie: the token
+              callback - optional function called as callback(bytes
+                         downloaded, total bytes or None)
+           Output:
+              path to the saved file or False if the download failed
+        """
+        try:
+            return DownloadManager(transport=self).download(
+                url=url,
+                out_path=save_path + os.sep + file_name,
+                param_dict=param_dict,
+                proxy_url=proxy_url,
+                proxy_port=proxy_port,
+                callback=callback)
+        except urllib2.HTTPError, e:
+            print "HTTP Error:",e.code , url
+            return False
+        except urllib2.URLError, e:
+            print "URL Error:",e.reason , url
+            return False
+        except IOError, e:
+            print "Download Error:", e, url
+            return False
+    #----------------------------------------------------------------------
+    def download_unzip(self, url, out_folder, proxy_url=None,
+                       proxy_port=None, param_dict=None, callback=None):
+        """
+           downloads a zip file and extracts it to out_folder as it
+           streams, without saving the archive first
+           Inputs:
+              param_dict - optional query parameters, ie: the token
+              callback - optional function called as callback(bytes
+                         downloaded, total bytes or None)
+           Output:
+              list of the extracted file paths or False if the download
+              failed
+        """
+        try:
+            return DownloadManager(transport=self).extract(
+                url=url,
+                out_folder=out_folder,
+                param_dict=param_dict,
+                proxy_url=proxy_url,
+                proxy_port=proxy_port,
+                callback=callback)
+        except urllib2.HTTPError, e:
+            print "HTTP Error:",e.code , url
+            return False
+        except urllib2.URLError, e:
+            print "URL Error:",e.reason , url
+            return False
+        except IOError, e:
+            print "Download Error:", e, url
+            return False
+########################################################################
+class DecodedStream(object):
+    """
+       File like object reading a response body, decompressed on the fly
+       when the server gzip or deflate encoded it.
+       Inputs:
+          resp - response object returned by Transport.open
+    """
+    _resp = None
+    _inflater = None
+    _buffer = None
+    _eof = None
+    #----------------------------------------------------------------------
+    def __init__(self, resp):
+        """Constructor"""
+        self._resp = resp
+        self._buffer = ""
+        self._eof = False
+        encoding = resp.info().get('Content-Encoding')
+        if encoding == 'gzip':
+            self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._inflater = zlib.decompressobj()
+    #----------------------------------------------------------------------
+    @property
+    def response(self):
+        """ returns the underlying response """
+        return self._resp
+    #----------------------------------------------------------------------
+    def read(self, size=-1):
+        """ returns up to size decompressed bytes, "" at the end """
+        if self._inflater is None:
+            return self._resp.read(size) if size >= 0 else self._resp.read()
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self._resp.read(size if size > 0 else 65536)
+            if not data:
+                self._buffer += self._inflater.flush()
+                self._eof = True
+            else:
+                self._buffer += self._inflater.decompress(data)
+                if len(self._buffer) > 0 and size > 0:
+                    break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the response """
+        self._resp.close()
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+#----------------------------------------------------------------------
+def _hostname(url):
+    """ returns the lower case host name of a url or host string """
+    if url is None:
+        return None
+    if "://" not in url:
+        url = "http://" + url
+    return urlparse.urlparse(url).hostname
+#----------------------------------------------------------------------
+_default_transport = None
+_default_lock = threading.Lock()
+def get_transport():
+    """ returns the process wide transport """
+    global _default_transport
+    if _default_transport is None:
+        with _default_lock:
+            if _default_transport is None:
+                _default_transport = Transport()
+    return _default_transport
+#----------------------------------------------------------------------
+def set_transport(transport):
+    """ replaces the process wide transport used by all service classes """
+    global _default_transport
+    if not isinstance(transport, Transport):
+        raise TypeError("transport must be a Transport object")
+    _default_transport = transport
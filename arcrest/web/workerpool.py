@@ -0,0 +1,261 @@
+"""
+
+.. module:: workerpool
+   :platform: Windows, Linux
+   :synopsis: Bounded thread pool used to run REST requests concurrently.
+
+.. moduleauthor:: Esri
+
+
+"""
+import sys
+import Queue
+import urlparse
+import threading
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_HOST_LIMIT = 6
+# guards the started and cancelled flags of every WorkResult
+_state_lock = threading.Lock()
+########################################################################
+class WorkResult(object):
+    """
+       Result of a function submitted to a WorkerPool.  get() waits for
+       the function to finish and returns its value, or raises the
+       exception it raised.
+    """
+    _event = None
+    _value = None
+    _exc_info = None
+    _started = False
+    _cancelled = False
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self._event = threading.Event()
+    #----------------------------------------------------------------------
+    def _set(self, value=None, exc_info=None):
+        """ stores the outcome of the function """
+        self._value = value
+        self._exc_info = exc_info
+        self._event.set()
+    #----------------------------------------------------------------------
+    def _begin(self):
+        """ marks the function as running, returns False if cancelled """
+        with _state_lock:
+            if self._cancelled:
+                return False
+            self._started = True
+            return True
+    #----------------------------------------------------------------------
+    def cancel(self):
+        """
+           keeps the function from running if no worker has started it,
+           returns True when it will not run
+        """
+        with _state_lock:
+            if not self._started:
+                self._cancelled = True
+            return self._cancelled
+    #----------------------------------------------------------------------
+    def ready(self):
+        """ returns True once the function has finished """
+        return self._event.is_set()
+    #----------------------------------------------------------------------
+    def get(self, timeout=None):
+        """
+           returns the value of the function
+           Inputs:
+              timeout - seconds to wait, None waits forever
+        """
+        # Event.wait without a timeout can not be interrupted by ctrl+c
+        # on python 2, so always wait in slices
+        while not self._event.is_set():
+            self._event.wait(timeout or 0.5)
+            if timeout is not None:
+                break
+        if not self._event.is_set():
+            raise RuntimeError("timed out waiting for the result")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+########################################################################
+class WorkerPool(object):
+    """
+       A fixed number of daemon threads running submitted functions.
+       Inputs:
+          max_workers - number of threads, which is also the largest
+                        number of functions running at the same time
+    """
+    _max_workers = None
+    _queue = None
+    _threads = None
+    _lock = None
+    _closed = False
+    #----------------------------------------------------------------------
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        """Constructor"""
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self._max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+    #----------------------------------------------------------------------
+    @property
+    def max_workers(self):
+        """ returns the number of worker threads """
+        return self._max_workers
+    #----------------------------------------------------------------------
+    def _start(self):
+        """ starts the worker threads the first time work is submitted """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("the worker pool has been shut down")
+            while len(self._threads) < self._max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+    #----------------------------------------------------------------------
+    def _work(self):
+        """ worker thread loop """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            result, func, args, kwargs = item
+            if not result._begin():
+                result._set(exc_info=(RuntimeError,
+                                      RuntimeError("the call was cancelled"),
+                                      None))
+                del item, result, func, args, kwargs
+                continue
+            try:
+                result._set(value=func(*args, **kwargs))
+            except:
+                result._set(exc_info=sys.exc_info())
+            del item, result, func, args, kwargs
+    #----------------------------------------------------------------------
+    def submit(self, func, *args, **kwargs):
+        """
+           queues a function call and returns a WorkResult
+        """
+        self._start()
+        result = WorkResult()
+        self._queue.put((result, func, args, kwargs))
+        return result
+    #----------------------------------------------------------------------
+    def imap(self, func, iterable, max_pending=None):
+        """
+           calls func on every item of iterable and yields the results in
+           the same order as the items.  Only max_pending calls are queued
+           ahead of the caller, so a long iterable is never loaded into
+           memory all at once.
+           Inputs:
+              func - function taking one item
+              iterable - items to process
+              max_pending - calls queued ahead, defaults to twice the
+                            number of workers
+           When the caller stops iterating early, the queued calls that
+           have not started are cancelled and the running ones are waited
+           for, so none of them runs once the caller has moved on.
+        """
+        if max_pending is None:
+            max_pending = self._max_workers * 2
+        pending = []
+        items = iter(iterable)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        item = items.next()
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append(self.submit(func, item))
+                if len(pending) == 0:
+                    break
+                yield pending.pop(0).get()
+        finally:
+            for result in pending:
+                result.cancel()
+            for result in pending:
+                while not result.ready():
+                    result._event.wait(0.5)
+    #----------------------------------------------------------------------
+    def map(self, func, iterable):
+        """ returns a list of func applied to every item, in order """
+        return list(self.imap(func, iterable))
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        """ stops the worker threads once the queued work is done """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for thread in self._threads:
+                self._queue.put(None)
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+#----------------------------------------------------------------------
+def imap(func, iterable, max_workers=DEFAULT_MAX_WORKERS):
+    """
+       ordered, bounded concurrent map using a temporary WorkerPool
+       Inputs:
+          func - function taking one item
+          iterable - items to process
+          max_workers - number of calls running at the same time
+       Output:
+          generator of the results in the same order as the items
+    """
+    pool = WorkerPool(max_workers=max_workers)
+    try:
+        for value in pool.imap(func, iterable):
+            yield value
+    finally:
+        pool.shutdown()
+#----------------------------------------------------------------------
+_host_limits = {}
+_host_slots = {}
+_host_lock = threading.Lock()
+def _host(url):
+    """ returns the lower case host name of a url (or host) """
+    if "://" not in url:
+        return url.lower()
+    return (urlparse.urlparse(url).hostname or "").lower()
+#----------------------------------------------------------------------
+def set_host_limit(host, limit):
+    """
+       sets the number of requests that concurrent operations (paging,
+       batched edits, downloads...) may run at the same time against a
+       host.
+       Inputs:
+          host - host name or any url on the host
+          limit - number of requests, None restores the default
+    """
+    host = _host(host)
+    with _host_lock:
+        if limit is None:
+            _host_limits.pop(host, None)
+        else:
+            _host_limits[host] = limit
+        _host_slots.pop(host, None)
+#----------------------------------------------------------------------
+def host_slot(url):
+    """
+       returns the semaphore limiting the concurrent requests to the host
+       of url, use it as a context manager around a request
+    """
+    host = _host(url)
+    with _host_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(
+                _host_limits.get(host, DEFAULT_HOST_LIMIT))
+        return _host_slots[host]
@@ -1,18 +1,8 @@
 """
    Contains base classes for webmap objects
 """
-import os
-import urllib
-import urllib2
-import json
-import httplib
-import zipfile
-import glob
-import calendar
-import datetime
-import mimetypes
-import mimetools
-from cStringIO import StringIO
+from ..web.transport import get_transport
+from ..common import codec
 ########################################################################
 class BaseDomain:
     """ all domain values inherit this class """
@@ -37,75 +27,42 @@ class Geometry(object):
 class BaseWebOperations(object):
     """ base class that holds operations for web requests """
     _token = None
+    _transport = None
+    #----------------------------------------------------------------------
+    def _get_transport(self):
+        """ returns the Transport object used for web requests """
+        if self._transport is None:
+            return get_transport()
+        return self._transport
     #----------------------------------------------------------------------
     def _download_file(self, url, save_path, file_name, proxy_url=None, proxy_port=None):
         """ downloads a file """
-        try:
-            if proxy_url is not None:
-                if proxy_port is None:
-                    proxy_port = 80
-                proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                           "https":"https://%s:%s" % (proxy_url, proxy_port)}
-                proxy_support = urllib2.ProxyHandler(proxies)
-                opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-                urllib2.install_opener(opener)
-           
-            file_data = urllib2.urlopen(url)
-            total_size = int(file_data.info().getheader('Content-Length').strip())
-            downloaded = 0
-            CHUNK = 4096
-            
-            with open(save_path + os.sep + file_name, 'wb') as out_file:
-                while True:
-                    chunk = file_data.read(CHUNK)
-                    downloaded += len(chunk)
-                    if not chunk: break
-                    #print str(int(math.floor(float(downloaded) / float(total_size) * 100 ))) + "% download"
-                                                      
-                    out_file.write(chunk)       
-               
-            return save_path + os.sep + file_name
-        except urllib2.HTTPError, e:
-            print "HTTP Error:",e.code , url
-            return False
-        except urllib2.URLError, e:
-            print "URL Error:",e.reason , url
-            return False
+        return self._get_transport().download(url=url,
+                                              save_path=save_path,
+                                              file_name=file_name,
+                                              proxy_url=proxy_url,
+                                              proxy_port=proxy_port)
     #----------------------------------------------------------------------
     def _do_post(self, url, param_dict, proxy_url=None, proxy_port=None):
         """ performs the POST operation and returns dictionary result """
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support, urllib2.HTTPHandler(debuglevel=1))
-            urllib2.install_opener(opener)
-        request = urllib2.Request(url, urllib.urlencode(param_dict))
-        result = urllib2.urlopen(request).read()
-        jres = json.loads(result)
-        return self._unicode_convert(jres)
+        result = self._get_transport().post(url=url,
+                                            param_dict=param_dict,
+                                            proxy_url=proxy_url,
+                                            proxy_port=proxy_port)
+        return result
     #----------------------------------------------------------------------
     def _do_get(self, url, param_dict, header={}, proxy_url=None, proxy_port=None):
         """ performs a get operation """
-        url = url + "?%s" % urllib.urlencode(param_dict)
-        if proxy_url is not None:
-            if proxy_port is None:
-                proxy_port = 80
-            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
-                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
-            proxy_support = urllib2.ProxyHandler(proxies)
-            opener = urllib2.build_opener(proxy_support)
-            urllib2.install_opener(opener)
-        request = urllib2.Request(url, headers=header)
-        result = urllib2.urlopen(request).read()
-        jres = json.loads(result)
-        return self._unicode_convert(jres)
+        result = self._get_transport().get(url=url,
+                                           param_dict=param_dict,
+                                           headers=header,
+                                           proxy_url=proxy_url,
+                                           proxy_port=proxy_port)
+        return result
     #----------------------------------------------------------------------
     def _post_multipart(self, host, selector, fields, files,
                         ssl=False,port=80,
-                        proxy_url=None, proxy_port=None):
+                        proxy_url=None, proxy_port=None, callback=None):
         """ performs a multi-post to AGOL or AGS
             Inputs:
                host - string - root url (no http:// or https://)
@@ -117,6 +74,8 @@ class BaseWebOperations(object):
                ssl - option to use SSL
                proxy_url - string - url to proxy server
                proxy_port - interger - port value if not on port 80
+               callback - optional function called as callback(bytes sent,
+                          total bytes) while the files are uploaded
 
             Output:
                JSON response as dictionary
@@ -131,82 +90,19 @@ class BaseWebOperations(object):
                                fields=params
                                )
         """
-        boundary, body = self._encode_multipart_formdata(fields, files)
-        headers = {
-        'User-Agent': "ArcREST",
-        'Content-Type': 'multipart/form-data; boundary=%s' % boundary
-        }
-        if proxy_url:
-            if ssl:
-                h = httplib.HTTPSConnection(proxy_url, proxy_port)
-                h.request('POST', 'https://' + host + selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(proxy_url, proxy_port)
-                h.request('POST', 'http://' + host + selector, body, headers)
-        else:
-            if ssl:
-                h = httplib.HTTPSConnection(host,port)
-                h.request('POST', selector, body, headers)
-            else:
-                h = httplib.HTTPConnection(host,port)
-                h.request('POST', selector, body, headers)
-        return h.getresponse().read()
-    #----------------------------------------------------------------------
-    def _encode_multipart_formdata(self, fields, files):
-        boundary = mimetools.choose_boundary()
-        buf = StringIO()
-        for (key, value) in fields.iteritems():
-            buf.write('--%s\r\n' % boundary)
-            buf.write('Content-Disposition: form-data; name="%s"' % key)
-            buf.write('\r\n\r\n' + self._tostr(value) + '\r\n')
-        for (key, filepath, filename) in files:
-            buf.write('--%s\r\n' % boundary)
-            buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
-            buf.write('Content-Type: %s\r\n' % (self._get_content_type(filename)))
-            file = open(filepath, "rb")
-            try:
-                buf.write('\r\n' + file.read() + '\r\n')
-            finally:
-                file.close()
-        buf.write('--' + boundary + '--\r\n\r\n')
-        buf = buf.getvalue()
-        return boundary, buf
-    #----------------------------------------------------------------------
-    def _get_content_type(self, filename):
-        """ gets the content type of a file """
-        mntype = mimetypes.guess_type(filename)[0]
-        filename, fileExtension = os.path.splitext(filename)
-        if mntype is None and\
-            fileExtension.lower() == ".csv":
-            mntype = "text/csv"
-        elif mntype is None and \
-            fileExtension.lower() == ".sd":
-            mntype = "File/sd"
-        elif mntype is None:
-            #mntype = 'application/octet-stream'
-            mntype= "File/%s" % fileExtension.replace('.', '')
-        return mntype
-    #----------------------------------------------------------------------
-    def _tostr(self,obj):
-        """ converts a object to list, if object is a list, it creates a
-            comma seperated string.
-        """
-        if not obj:
-            return ''
-        if isinstance(obj, list):
-            return ', '.join(map(self._tostr, obj))
-        return str(obj)
+        return self._get_transport().post_multipart(host=host,
+                                                    selector=selector,
+                                                    fields=fields,
+                                                    files=files,
+                                                    ssl=ssl,
+                                                    port=port,
+                                                    proxy_url=proxy_url,
+                                                    proxy_port=proxy_port,
+                                                    callback=callback)
     #----------------------------------------------------------------------
     def _unicode_convert(self, obj):
         """ converts unicode to anscii """
-        if isinstance(obj, dict):
-            return {self._unicode_convert(key): self._unicode_convert(value) for key, value in obj.iteritems()}
-        elif isinstance(obj, list):
-            return [self._unicode_convert(element) for element in obj]
-        elif isinstance(obj, unicode):
-            return obj.encode('utf-8')
-        else:
-            return obj
+        return codec.convert(obj)
 ########################################################################
 class BaseOperationalLayer(object):
     """ Base Class for all Operational Layers  """
@@ -1,5 +1,6 @@
 import json
 import arcpy
+from ..common import codec
 import time
 import copy
 import datetime
@@ -21,16 +22,7 @@ def tableToRecordSet(table_path):
 #----------------------------------------------------------------------
 def _unicode_convert(obj):
     """ converts unicode to anscii """
-    if isinstance(obj, dict):
-        return {_unicode_convert(key): \
-                _unicode_convert(value) \
-                for key, value in obj.iteritems()}
-    elif isinstance(obj, list):
-        return [_unicode_convert(element) for element in obj]
-    elif isinstance(obj, unicode):
-        return obj.encode('utf-8')
-    else:
-        return obj
+    return codec.convert(obj)
 #----------------------------------------------------------------------
 def _date_handler(obj):
     if isinstance(obj, datetime.datetime):
@@ -1,5 +1,6 @@
 import json
 import arcpy
+from ..common import codec
 from base import Geometry
 ########################################################################
 class SpatialReference(object):
@@ -52,7 +53,7 @@ class Point(Geometry):
             self._m = coord.centroid.M
             self._json = coord.JSON
             self._geom = coord.centroid
-            self._dict = _unicode_convert(json.loads(self._json))
+            self._dict = codec.loads(self._json)
         self._wkid = wkid
         if not z is None:
             self._z = float(z)
@@ -76,8 +77,7 @@ class Point(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -131,7 +131,7 @@ class MultiPoint(Geometry):
         elif isinstance(points, arcpy.Geometry):
             self._points = json.loads(points.JSON)['points']
             self._json = points.JSON
-            self._dict = _unicode_convert(json.loads(self._json))
+            self._dict = codec.loads(self._json)
         self._wkid = wkid
         self._hasZ = hasZ
         self._hasM = hasM
@@ -151,8 +151,7 @@ class MultiPoint(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -201,7 +200,7 @@ class Polyline(Geometry):
         elif isinstance(paths, arcpy.Geometry):
             self._paths = json.loads(paths.JSON)['paths']
             self._json = paths.JSON
-            self._dict = _unicode_convert(json.loads(self._json))
+            self._dict = codec.loads(self._json)
         self._wkid = wkid
         self._hasM = hasM
         self._hasZ = hasZ
@@ -221,8 +220,7 @@ class Polyline(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -268,7 +266,7 @@ class Polygon(Geometry):
         elif isinstance(rings, arcpy.Geometry):
             self._rings = json.loads(rings.JSON)['rings']
             self._json = rings.JSON
-            self._dict = _unicode_convert(json.loads(self._json))
+            self._dict = codec.loads(self._json)
         self._wkid = wkid
         self._hasM = hasM
         self._hasZ = hasZ
@@ -288,8 +286,7 @@ class Polygon(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
@@ -387,8 +384,7 @@ class Envelope(Geometry):
         """ returns a geometry as JSON """
         value = self._json
         if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=_date_handler)
+            value = codec.dumps(self.asDictionary)
             self._json = value
         return self._json
     #----------------------------------------------------------------------
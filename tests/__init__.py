@@ -0,0 +1,18 @@
+"""
+Unit tests of the arcrest.web and arcrest.common modules, which need
+neither arcpy nor a network connection.  From the repository root:
+
+    python -m unittest discover -s tests -t .
+
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'arcrest' not in sys.modules:
+    # arcrest/__init__ imports the ags and agol modules, which need arcpy,
+    # the sub packages tested here are loaded without running it
+    _package = types.ModuleType('arcrest')
+    _package.__path__ = [os.path.join(ROOT, 'arcrest')]
+    sys.modules['arcrest'] = _package
@@ -0,0 +1,171 @@
+"""
+Tests of arcrest.web.download.DownloadManager against a local HTTP server
+answering Range requests.
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import SocketServer
+import BaseHTTPServer
+from arcrest.web import connectionpool
+from arcrest.web.transport import Transport
+from arcrest.web.download import DownloadManager
+
+_CONTENT = "".join(chr((i * 31) % 251) for i in xrange(100000))
+########################################################################
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    #----------------------------------------------------------------------
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), _Handler)
+        self.content = _CONTENT
+        self.etag = '"v1"'
+        self.ranges = True
+        # a range response is cut after this many bytes, once
+        self.fail_after = None
+        self.requested = []
+        self.lock = threading.Lock()
+    #----------------------------------------------------------------------
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s/file.bin" % self.server_address[1]
+########################################################################
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #----------------------------------------------------------------------
+    def log_message(self, *args):
+        pass
+    #----------------------------------------------------------------------
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        header = self.headers.getheader("range")
+        with server.lock:
+            server.requested.append(header)
+        if header is None or not server.ranges:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        first, last = header.split("=", 1)[1].split("-")
+        first, last = int(first), min(int(last), len(content) - 1)
+        body = content[first:last + 1]
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Range",
+                         "bytes %s-%s/%s" % (first, last, len(content)))
+        self.send_header("ETag", server.etag)
+        self.end_headers()
+        cut = None
+        if len(body) > 1:
+            with server.lock:
+                cut, server.fail_after = server.fail_after, None
+        if cut is not None:
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.close_connection = 1
+            return
+        self.wfile.write(body)
+########################################################################
+class DownloadManagerTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def setUp(self):
+        self.server = _Server()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "file.bin")
+        self.transport = Transport(pool=connectionpool.ConnectionPool(),
+                                   compress=False)
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.transport.pool.clear()
+        shutil.rmtree(self.folder)
+    #----------------------------------------------------------------------
+    def _manager(self, **kwargs):
+        kwargs.setdefault("split_size", 30000)
+        kwargs.setdefault("buffer_size", 4096)
+        return DownloadManager(transport=self.transport, **kwargs)
+    #----------------------------------------------------------------------
+    def _read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+    #----------------------------------------------------------------------
+    def _write_part(self, data, validator, segments):
+        with open(self.path + ".part", "wb") as f:
+            f.write(data)
+        with open(self.path + ".part.json", "wb") as f:
+            json.dump({"size" : len(_CONTENT), "validator" : validator,
+                       "segments" : segments}, f)
+    #----------------------------------------------------------------------
+    def test_ranged(self):
+        progress = []
+        self._manager(max_workers=3).download(
+            self.server.url, self.path,
+            callback=lambda done, total: progress.append((done, total)))
+        self.assertEqual(self._read(), _CONTENT)
+        self.assertEqual(sorted(self.server.requested),
+                         ["bytes=0-0", "bytes=0-33333",
+                          "bytes=33334-66667", "bytes=66668-99999"])
+        self.assertEqual(progress[-1], (len(_CONTENT), len(_CONTENT)))
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        self.assertFalse(os.path.exists(self.path + ".part.json"))
+    #----------------------------------------------------------------------
+    def test_resume_after_failure(self):
+        self.server.fail_after = 10000
+        manager = self._manager(max_workers=1, split_size=len(_CONTENT),
+                                retries=0)
+        self.assertRaises(IOError, manager.download,
+                          self.server.url, self.path)
+        with open(self.path + ".part.json", "rb") as f:
+            state = json.load(f)
+        self.assertEqual(state['segments'], [[0, len(_CONTENT), 10000]])
+        del self.server.requested[:]
+        manager.download(self.server.url, self.path)
+        self.assertEqual(self._read(), _CONTENT)
+        # only the missing bytes are requested again
+        self.assertEqual(self.server.requested,
+                         ["bytes=0-0", "bytes=10000-99999"])
+    #----------------------------------------------------------------------
+    def test_resume_saved_state(self):
+        done = 50000
+        self._write_part(_CONTENT[:done], '"v1"',
+                         [[0, done, done], [done, len(_CONTENT), 0]])
+        self._manager().download(self.server.url, self.path)
+        self.assertEqual(self._read(), _CONTENT)
+        self.assertEqual(self.server.requested,
+                         ["bytes=0-0", "bytes=50000-99999"])
+    #----------------------------------------------------------------------
+    def test_stale_part_discarded(self):
+        # saved for another version of the file: its bytes are not reused
+        self._write_part("x" * 50000, '"v0"', [[0, len(_CONTENT), 50000]])
+        self._manager(max_workers=1,
+                      split_size=len(_CONTENT)).download(self.server.url,
+                                                         self.path)
+        self.assertEqual(self._read(), _CONTENT)
+        self.assertEqual(self.server.requested,
+                         ["bytes=0-0", "bytes=0-99999"])
+    #----------------------------------------------------------------------
+    def test_part_without_state_discarded(self):
+        with open(self.path + ".part", "wb") as f:
+            f.write("x" * 50000)
+        self._manager().download(self.server.url, self.path)
+        self.assertEqual(self._read(), _CONTENT)
+    #----------------------------------------------------------------------
+    def test_no_range_support(self):
+        self.server.ranges = False
+        self._write_part("x" * 200000, '"v1"', [[0, len(_CONTENT), 50000]])
+        self._manager().download(self.server.url, self.path)
+        self.assertEqual(self._read(), _CONTENT)
+        self.assertEqual(self.server.requested, ["bytes=0-0"])
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests of arcrest.web.editbatch with a fake applyEdits post function.
+"""
+import json
+import socket
+import threading
+import unittest
+from arcrest.web import editbatch
+
+_URL = "http://example.com/arcgis/rest/services/test/FeatureServer/0"
+########################################################################
+class _FakeLayer(object):
+    """
+       applyEdits of a layer refusing the features whose attribute bad is
+       set.  With rollbackOnFailure the whole request fails, as on
+       ArcGIS Server, else the other records are applied.
+    """
+    #----------------------------------------------------------------------
+    def __init__(self, error_code=400, exception=None):
+        self.requests = []
+        self.error_code = error_code
+        self.exception = exception
+        self._lock = threading.Lock()
+    #----------------------------------------------------------------------
+    def post(self, params):
+        with self._lock:
+            self.requests.append(params)
+        if self.exception is not None:
+            raise self.exception
+        adds = json.loads(params.get('adds', "[]"))
+        deletes = [int(oid) for oid in params['deletes'].split(",")] \
+                  if 'deletes' in params else []
+        results = [{"objectId" : add['attributes']['id'],
+                    "success" : not add['attributes'].get('bad', False)}
+                   for add in adds]
+        results.extend({"objectId" : oid, "success" : oid > 0}
+                       for oid in deletes)
+        failed = [r for r in results if not r['success']]
+        if failed and params['rollbackOnFailure']:
+            return {"error" : {"code" : self.error_code,
+                               "message" : "Unable to complete operation."}}
+        for result in failed:
+            result['error'] = {"code" : 1000, "description" : "refused"}
+        return {"addResults" : results[:len(adds)],
+                "updateResults" : [],
+                "deleteResults" : results[len(adds):]}
+#----------------------------------------------------------------------
+def _adds(count, bad=()):
+    return [{"attributes" : {"id" : i, "bad" : i in bad}}
+            for i in xrange(count)]
+########################################################################
+class EditBatcherTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def test_bisection_isolates_bad_record(self):
+        layer = _FakeLayer()
+        batcher = editbatch.EditBatcher(_URL, layer.post,
+                                        initial_records=8, max_workers=1)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(8, bad=(3,))))
+        results = report.addResults
+        self.assertEqual([r['success'] for r in results],
+                         [i != 3 for i in xrange(8)])
+        self.assertEqual([r.get('objectId') for r in results],
+                         [0, 1, 2, None, 4, 5, 6, 7])
+        self.assertEqual(results[3]['error']['code'], 400)
+        self.assertEqual([(kind, index) for kind, index, r in report.failures],
+                         [("adds", 3)])
+        self.assertEqual(report.successCount, 7)
+        # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1
+        self.assertEqual(report.requests, 7)
+        self.assertEqual(len(layer.requests), 7)
+    #----------------------------------------------------------------------
+    def test_results_in_input_order(self):
+        layer = _FakeLayer()
+        batcher = editbatch.EditBatcher(_URL, layer.post,
+                                        initial_records=3, max_workers=3)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(20, bad=(4, 17)),
+                                                  deletes="1, 2, -3"))
+        self.assertEqual([r.get('objectId') for r in report.addResults],
+                         [None if i in (4, 17) else i for i in xrange(20)])
+        self.assertEqual([r['success'] for r in report.deleteResults],
+                         [True, True, False])
+        self.assertEqual([(kind, index) for kind, index, r in report.failures],
+                         [("adds", 4), ("adds", 17), ("deletes", 2)])
+    #----------------------------------------------------------------------
+    def test_no_bisection_without_rollback(self):
+        layer = _FakeLayer()
+        batcher = editbatch.EditBatcher(_URL, layer.post,
+                                        rollbackOnFailure=False,
+                                        initial_records=8, max_workers=1)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(8, bad=(3,))))
+        self.assertEqual(len(layer.requests), 1)
+        self.assertEqual(report.successCount, 7)
+        self.assertEqual(report.addResults[3]['error']['code'], 1000)
+    #----------------------------------------------------------------------
+    def test_fatal_error_not_bisected(self):
+        layer = _FakeLayer(error_code=498)
+        batcher = editbatch.EditBatcher(_URL, layer.post,
+                                        initial_records=8, max_workers=1)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(8, bad=(0,))))
+        self.assertEqual(len(layer.requests), 1)
+        self.assertEqual(report.successCount, 0)
+        self.assertEqual(report.addResults[5]['error']['code'], 498)
+    #----------------------------------------------------------------------
+    def test_transport_error_not_resent(self):
+        layer = _FakeLayer(exception=socket.timeout("timed out"))
+        batcher = editbatch.EditBatcher(_URL, layer.post,
+                                        initial_records=8, max_workers=1)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(8)))
+        self.assertEqual(len(layer.requests), 1)
+        self.assertEqual(len(report.failures), 8)
+        self.assertTrue(report.addResults[0]['error']['description']
+                        .startswith("unknown outcome"))
+    #----------------------------------------------------------------------
+    def test_max_bytes(self):
+        layer = _FakeLayer()
+        batcher = editbatch.EditBatcher(_URL, layer.post, max_bytes=200,
+                                        initial_records=100, max_workers=2)
+        report = batcher.run(editbatch.iter_edits(adds=_adds(50)))
+        self.assertEqual(report.successCount, 50)
+        self.assertTrue(len(layer.requests) > 1)
+        for params in layer.requests:
+            self.assertTrue(len(params['adds']) <= 200 + 1)
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
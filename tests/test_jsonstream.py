@@ -0,0 +1,90 @@
+"""
+Tests of arcrest.common.jsonstream, every document is read with every
+buffer size so values are cut at every position.
+"""
+import json
+import unittest
+from cStringIO import StringIO
+from arcrest.common import codec
+from arcrest.common.jsonstream import JSONArrayReader
+
+_DOCUMENT = {
+    "layers" : [{"id" : 0}],
+    "value" : {
+        "objectIdFieldName" : "OBJECTID",
+        "fields" : [{"name" : "NAME", "alias" : "a \"quoted\" [name]"}],
+        "features" : [
+            {"attributes" : {"OBJECTID" : 1, "NAME" : "b}r,a]ce",
+                             "VALUE" : 12345.678}},
+            {"attributes" : {"OBJECTID" : 2, "NAME" : u"caf\xe9",
+                             "VALUE" : -1e-07},
+             "geometry" : {"x" : 1.5, "y" : -20037508.342789244}},
+            123456789,
+            None,
+            [],
+            {}],
+        "exceededTransferLimit" : True},
+    "count" : 6}
+#----------------------------------------------------------------------
+def _read(text, path, buffer_size):
+    reader = JSONArrayReader(StringIO(text), path, buffer_size=buffer_size)
+    items = list(reader)
+    return reader, items
+########################################################################
+class JSONArrayReaderTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def _check(self, document, path, indent=None):
+        text = json.dumps(document, indent=indent)
+        expected = codec.loads(text)
+        array = expected
+        for key in path[:-1]:
+            array = array[key]
+        items = array.pop(path[-1])
+        for buffer_size in xrange(1, len(text) + 2):
+            reader, found = _read(text, path, buffer_size)
+            self.assertTrue(reader.found)
+            self.assertEqual(found, items, "buffer size %s" % buffer_size)
+            self.assertEqual(reader.header, expected,
+                             "buffer size %s" % buffer_size)
+    #----------------------------------------------------------------------
+    def test_nested_array(self):
+        self._check(_DOCUMENT, ("value", "features"))
+    #----------------------------------------------------------------------
+    def test_white_space(self):
+        self._check(_DOCUMENT, ("value", "features"), indent=3)
+    #----------------------------------------------------------------------
+    def test_top_level_array(self):
+        self._check({"features" : [1, 2.5, "three"], "after" : 1},
+                    ("features",))
+    #----------------------------------------------------------------------
+    def test_empty_array(self):
+        self._check({"features" : [], "count" : 0}, ("features",))
+    #----------------------------------------------------------------------
+    def test_header_before_iteration(self):
+        text = '{"value" : {"objectIdFieldName" : "OBJECTID", ' \
+               '"features" : [1, 2, 3], "exceededTransferLimit" : true}, ' \
+               '"count" : 3}'
+        reader = JSONArrayReader(StringIO(text), "value.features",
+                                 buffer_size=16)
+        header = reader.read_header()
+        self.assertEqual(header, {"value" : {"objectIdFieldName" : "OBJECTID"}})
+        # the members after the array are read once the iteration is over
+        self.assertEqual(list(reader), [1, 2, 3])
+        self.assertEqual(reader.header,
+                         {"value" : {"objectIdFieldName" : "OBJECTID",
+                                     "exceededTransferLimit" : True},
+                          "count" : 3})
+    #----------------------------------------------------------------------
+    def test_missing_path(self):
+        text = json.dumps({"error" : {"code" : 400, "message" : "bad"}})
+        reader, items = _read(text, ("value", "features"), 5)
+        self.assertFalse(reader.found)
+        self.assertEqual(items, [])
+        self.assertEqual(reader.header['error']['code'], 400)
+    #----------------------------------------------------------------------
+    def test_invalid_document(self):
+        self.assertRaises(ValueError, _read,
+                          '{"features" : [1, 2', ("features",), 4)
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests of arcrest.common.pbf against hand encoded FeatureCollectionPBuffer
+messages.
+"""
+import struct
+import unittest
+from arcrest.common import pbf
+
+#----------------------------------------------------------------------
+def _varint(value):
+    """ encodes an unsigned varint """
+    out = []
+    while True:
+        b = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(chr(b | 0x80))
+        else:
+            out.append(chr(b))
+            return "".join(out)
+#----------------------------------------------------------------------
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+#----------------------------------------------------------------------
+def _key(field, wire):
+    return _varint(field << 3 | wire)
+#----------------------------------------------------------------------
+def _int(field, value):
+    return _key(field, 0) + _varint(value)
+#----------------------------------------------------------------------
+def _bytes(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+#----------------------------------------------------------------------
+def _double(field, value):
+    return _key(field, 1) + struct.pack("<d", value)
+#----------------------------------------------------------------------
+def _packed(field, values):
+    return _bytes(field, "".join(_varint(v) for v in values))
+#----------------------------------------------------------------------
+def _coords(points):
+    """ delta and zigzag encodes a list of integer points """
+    values = []
+    last = [0] * len(points[0])
+    for point in points:
+        for i, v in enumerate(point):
+            values.append(_zigzag(v - last[i]))
+            last[i] = v
+    return values
+#----------------------------------------------------------------------
+def _message(query_result):
+    return _bytes(2, query_result)
+#----------------------------------------------------------------------
+def _feature_result(geometry_type, features, transform=None,
+                    has_z=False, fields=None):
+    if fields is None:
+        fields = [("OBJECTID", 6), ("NAME", 4), ("VALUE", 3)]
+    body = _bytes(1, "OBJECTID") + _int(7, geometry_type)
+    body += _bytes(8, _int(1, 102100) + _int(2, 3857))
+    if has_z:
+        body += _int(10, 1)
+    # features before the transform and fields, as the decoder must wait
+    # for both
+    for feature in features:
+        body += _bytes(15, feature)
+    if transform is not None:
+        body += _bytes(12, transform)
+    for name, kind in fields:
+        body += _bytes(13, _bytes(1, name) + _int(2, kind))
+    return _message(_bytes(1, body))
+#----------------------------------------------------------------------
+def _transform(scale, translate, origin=0):
+    return _int(1, origin) + \
+           _bytes(2, _double(1, scale[0]) + _double(2, scale[1])) + \
+           _bytes(3, _double(1, translate[0]) + _double(2, translate[1]))
+########################################################################
+class DecodeTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def test_points(self):
+        attributes = _bytes(1, _int(7, 1)) + \
+                     _bytes(1, _bytes(1, "first")) + \
+                     _bytes(1, _double(3, 2.5))
+        geometry = _bytes(3, "".join(_varint(v) for v in _coords([[10, 4]])))
+        data = _feature_result(0, [attributes + _bytes(2, geometry)],
+                               transform=_transform((0.5, 0.25), (100.0, 50.0)))
+        result = pbf.decode(data, use_numpy=False)
+        self.assertEqual(result['objectIdFieldName'], "OBJECTID")
+        self.assertEqual(result['geometryType'], "esriGeometryPoint")
+        self.assertEqual(result['spatialReference'],
+                         {"wkid" : 102100, "latestWkid" : 3857})
+        self.assertEqual([f['name'] for f in result['fields']],
+                         ["OBJECTID", "NAME", "VALUE"])
+        self.assertEqual(result['fields'][0]['type'], "esriFieldTypeOID")
+        feature = result['features'][0]
+        self.assertEqual(feature['attributes'],
+                         {"OBJECTID" : 1, "NAME" : "first", "VALUE" : 2.5})
+        # the origin is the upper left corner, y grows downwards
+        self.assertEqual(feature['geometry'], {"x" : 105.0, "y" : 49.0})
+    #----------------------------------------------------------------------
+    def test_polygon_parts(self):
+        outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+        hole = [[2, 2], [4, 2], [4, 4], [2, 2]]
+        geometry = _packed(2, [len(outer), len(hole)]) + \
+                   _packed(3, _coords(outer + hole))
+        data = _feature_result(3, [_bytes(1, _int(7, 9)) + _bytes(2, geometry)],
+                               transform=_transform((1.0, 1.0), (0.0, 0.0), 1))
+        feature = pbf.decode(data, use_numpy=False)['features'][0]
+        self.assertEqual(feature['attributes']['OBJECTID'], 9)
+        self.assertEqual(feature['geometry'],
+                         {"rings" : [[[float(x), float(y)] for x, y in outer],
+                                     [[float(x), float(y)] for x, y in hole]]})
+    #----------------------------------------------------------------------
+    def test_signed_values(self):
+        attributes = _bytes(1, _int(7, 2)) + \
+                     _bytes(1, _int(4, _zigzag(-3))) + \
+                     _bytes(1, _int(6, 2 ** 64 - 5))
+        data = _feature_result(127, [attributes],
+                               fields=[("OBJECTID", 6), ("SMALL", 0),
+                                       ("BIG", 1)])
+        feature = pbf.decode(data, use_numpy=False)['features'][0]
+        self.assertEqual(feature['attributes'],
+                         {"OBJECTID" : 2, "SMALL" : -3, "BIG" : -5})
+        self.assertFalse('geometry' in feature)
+    #----------------------------------------------------------------------
+    def test_count_and_ids(self):
+        self.assertEqual(pbf.decode(_message(_bytes(2, _int(1, 42)))),
+                         {"count" : 42})
+        result = pbf.decode(_message(_bytes(3, _bytes(1, "FID") +
+                                            _packed(3, [1, 5, 300]))))
+        self.assertEqual(result, {"objectIdFieldName" : "FID",
+                                  "objectIds" : [1, 5, 300]})
+    #----------------------------------------------------------------------
+    @unittest.skipIf(pbf.numpy is None, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        ring = [[i * 1000, (i * 7919) % 5000 - 2500, i] for i in xrange(200)]
+        ring.append(ring[0])
+        geometry = _packed(2, [len(ring)]) + _packed(3, _coords(ring))
+        data = _feature_result(3, [_bytes(1, _int(7, 1)) + _bytes(2, geometry)],
+                               transform=_transform((0.1, 0.1), (5.0, 5.0)),
+                               has_z=True)
+        self.assertEqual(pbf.decode(data, use_numpy=True),
+                         pbf.decode(data, use_numpy=False))
+    #----------------------------------------------------------------------
+    def test_is_pbf(self):
+        self.assertFalse(pbf.is_pbf(' {"error" : {}}'))
+        self.assertTrue(pbf.is_pbf(_message(_bytes(2, _int(1, 1)))))
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
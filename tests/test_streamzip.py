@@ -0,0 +1,107 @@
+"""
+Tests of arcrest.web.streamzip with archives written by zipfile and a data
+descriptor entry like the ones of streamed downloads.
+"""
+import os
+import zlib
+import struct
+import shutil
+import zipfile
+import tempfile
+import unittest
+from cStringIO import StringIO
+from arcrest.web import streamzip
+
+########################################################################
+class _Stream(object):
+    """ a response returning at most chunk bytes per read """
+    #----------------------------------------------------------------------
+    def __init__(self, data, chunk=7):
+        self._data = StringIO(data)
+        self._chunk = chunk
+    #----------------------------------------------------------------------
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._chunk:
+            size = self._chunk
+        return self._data.read(size)
+#----------------------------------------------------------------------
+def _descriptor_entry(name, data):
+    """ a deflated local entry whose crc and sizes follow the data """
+    deflater = zlib.compressobj(9, zlib.DEFLATED, -15)
+    compressed = deflater.compress(data) + deflater.flush()
+    header = struct.pack("<4sHHHHHIIIHH", "PK\x03\x04", 20, 0x8, 8,
+                         0, 0, 0, 0, 0, len(name), 0)
+    descriptor = struct.pack("<4sIII", "PK\x07\x08",
+                             zlib.crc32(data) & 0xFFFFFFFF,
+                             len(compressed), len(data))
+    return header + name + compressed + descriptor
+########################################################################
+class UnzipStreamTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    #----------------------------------------------------------------------
+    def _read(self, *parts):
+        with open(os.path.join(self.folder, *parts), "rb") as f:
+            return f.read()
+    #----------------------------------------------------------------------
+    def test_stored_and_deflated(self):
+        text = "".join("line %s\n" % i for i in xrange(5000))
+        binary = "".join(chr(i % 256) for i in xrange(3000))
+        buf = StringIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr(zipfile.ZipInfo("data/"), "")
+            z.writestr("data/lines.txt", text, zipfile.ZIP_DEFLATED)
+            z.writestr("data/raw.bin", binary, zipfile.ZIP_STORED)
+            z.writestr("empty.txt", "", zipfile.ZIP_DEFLATED)
+        counts = []
+        paths = streamzip.unzip_stream(_Stream(buf.getvalue()), self.folder,
+                                       buffer_size=64,
+                                       callback=counts.append)
+        self.assertEqual([os.path.relpath(p, self.folder) for p in paths],
+                         [os.path.join("data", "lines.txt"),
+                          os.path.join("data", "raw.bin"), "empty.txt"])
+        self.assertEqual(self._read("data", "lines.txt"), text)
+        self.assertEqual(self._read("data", "raw.bin"), binary)
+        self.assertEqual(self._read("empty.txt"), "")
+        self.assertTrue(len(counts) > 0)
+    #----------------------------------------------------------------------
+    def test_data_descriptor(self):
+        first = "first file " * 1000
+        second = "second"
+        data = _descriptor_entry("a.txt", first) + \
+               _descriptor_entry("b.txt", second) + "PK\x05\x06"
+        streamzip.unzip_stream(_Stream(data, 1000), self.folder,
+                               buffer_size=100)
+        self.assertEqual(self._read("a.txt"), first)
+        self.assertEqual(self._read("b.txt"), second)
+    #----------------------------------------------------------------------
+    def test_bad_crc(self):
+        buf = StringIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr("a.txt", "abcdef", zipfile.ZIP_STORED)
+        data = buf.getvalue().replace("abcdef", "abcdeX", 1)
+        self.assertRaises(IOError, streamzip.unzip_stream,
+                          _Stream(data), self.folder)
+    #----------------------------------------------------------------------
+    def test_unsafe_path(self):
+        buf = StringIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr("../outside.txt", "x")
+        self.assertRaises(IOError, streamzip.unzip_stream,
+                          _Stream(buf.getvalue()), self.folder)
+        self.assertFalse(os.path.exists(
+            os.path.join(os.path.dirname(self.folder), "outside.txt")))
+    #----------------------------------------------------------------------
+    def test_truncated(self):
+        buf = StringIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr("a.txt", "x" * 1000, zipfile.ZIP_DEFLATED)
+        self.assertRaises(IOError, streamzip.unzip_stream,
+                          _Stream(buf.getvalue()[:40]), self.folder)
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests of arcrest.common.syncindex, the content hashes and the SQLite index.
+"""
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from arcrest.common import syncindex
+
+_URL = "http://example.com/arcgis/rest/services/test/FeatureServer/0"
+########################################################################
+class HashTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def test_key_value(self):
+        self.assertEqual(syncindex.key_value(12.0), "12")
+        self.assertEqual(syncindex.key_value(12), "12")
+        self.assertEqual(syncindex.key_value(12.5), "12.5")
+        self.assertEqual(syncindex.key_value(u"caf\xe9"), "caf\xc3\xa9")
+    #----------------------------------------------------------------------
+    def test_feature_hash_is_canonical(self):
+        first = syncindex.feature_hash({"A" : 1, "B" : u"x"},
+                                       {"x" : 1.0, "y" : 2.0,
+                                        "spatialReference" : {"wkid" : 4326}})
+        second = syncindex.feature_hash({"B" : "x", "A" : 1},
+                                        {"y" : 2.0, "x" : 1.0})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first,
+                            syncindex.feature_hash({"A" : 1, "B" : "x"},
+                                                   {"x" : 1.0, "y" : 2.5}))
+        self.assertNotEqual(first,
+                            syncindex.feature_hash({"A" : 1, "B" : "x"}))
+    #----------------------------------------------------------------------
+    def test_feature_hash_fields(self):
+        fields = ["name", "VALUE"]
+        self.assertEqual(
+            syncindex.feature_hash({"NAME" : "a", "value" : 1, "OBJECTID" : 5},
+                                   fields=fields),
+            syncindex.feature_hash({"Name" : "a", "Value" : 1, "OBJECTID" : 9},
+                                   fields=fields))
+    #----------------------------------------------------------------------
+    def test_dates(self):
+        date = datetime.datetime(2015, 1, 2, 3, 4, 5)
+        self.assertEqual(syncindex.feature_hash({"D" : date}),
+                         syncindex.feature_hash({"D" : 1420167845000}))
+    #----------------------------------------------------------------------
+    def test_attribute_hash(self):
+        attributes = {"A" : 1}
+        value = syncindex.attribute_hash(attributes)
+        self.assertTrue(value.startswith(syncindex.ATTRIBUTES_PREFIX))
+        # never equal to the hash of a feature, with or without geometry
+        self.assertNotEqual(value, syncindex.feature_hash(attributes))
+        self.assertEqual(value[len(syncindex.ATTRIBUTES_PREFIX):],
+                         syncindex.feature_hash(attributes))
+########################################################################
+class SyncIndexTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "sync.sqlite")
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    #----------------------------------------------------------------------
+    def test_persisted(self):
+        with syncindex.SyncIndex(self.path, _URL, "KEY") as index:
+            index.set(1.0, 10, "aaa")
+            index.set("two", 20, "bbb")
+            index.set("gone", 30, "ccc")
+            index.remove("gone")
+        with syncindex.SyncIndex(self.path, _URL, "KEY") as index:
+            self.assertEqual(len(index), 2)
+            self.assertEqual(index.get(1), (10, "aaa"))
+            self.assertTrue("two" in index)
+            self.assertFalse("gone" in index)
+            self.assertEqual(sorted(index.items()),
+                             [("1", 10, "aaa"), ("two", 20, "bbb")])
+    #----------------------------------------------------------------------
+    def test_cleared_for_another_layer_or_key(self):
+        with syncindex.SyncIndex(self.path, _URL, "KEY") as index:
+            index.set(1, 10, "aaa")
+        with syncindex.SyncIndex(self.path, _URL, "OTHER") as index:
+            self.assertEqual(len(index), 0)
+            index.set(1, 10, "aaa")
+        with syncindex.SyncIndex(self.path, _URL + "1", "OTHER") as index:
+            self.assertEqual(len(index), 0)
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Tests of arcrest.common.tilegrid, the polygon coverage is checked against
+a brute force test of every tile of the polygon's extent.
+"""
+import math
+import random
+import unittest
+from arcrest.common import tilegrid
+
+#----------------------------------------------------------------------
+def _tile_info(levels=4):
+    return {"rows" : 256, "cols" : 256, "dpi" : 96, "format" : "PNG",
+            "origin" : {"x" : 0.0, "y" : 1024.0},
+            "lods" : [{"level" : l, "resolution" : 2.0 / 2 ** l}
+                      for l in xrange(levels)]}
+#----------------------------------------------------------------------
+def _point_in_rings(rings, x, y):
+    inside = False
+    for ring in rings:
+        for i in xrange(len(ring) - 1):
+            (x1, y1), (x2, y2) = ring[i], ring[i + 1]
+            if (y1 > y) != (y2 > y) and \
+               x < x1 + (x2 - x1) * (y - y1) / float(y2 - y1):
+                inside = not inside
+    return inside
+#----------------------------------------------------------------------
+def _crosses(segment, box):
+    """ True if a segment passes through the inside of a box """
+    (x1, y1), (x2, y2) = segment
+    xmin, ymin, xmax, ymax = box
+    t0, t1 = 0.0, 1.0
+    for p, q in ((x1 - x2, x1 - xmin), (x2 - x1, xmax - x1),
+                 (y1 - y2, y1 - ymin), (y2 - y1, ymax - y1)):
+        if p == 0:
+            if q <= 0:
+                return False
+            continue
+        t = q / float(p)
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+    return t0 < t1
+#----------------------------------------------------------------------
+def _brute_force(grid, rings, level):
+    """ tests every tile of the extent: an edge crosses it or its center
+        is inside """
+    points = [p for ring in rings for p in ring]
+    extent = {"xmin" : min(p[0] for p in points),
+              "ymin" : min(p[1] for p in points),
+              "xmax" : max(p[0] for p in points),
+              "ymax" : max(p[1] for p in points)}
+    segments = [(ring[i], ring[i + 1]) for ring in rings
+                for i in xrange(len(ring) - 1)]
+    found = []
+    for tile in grid.tiles(extent, [level]):
+        box = grid.tile_extent(*tile)
+        center = ((box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0)
+        if _point_in_rings(rings, *center) or \
+           any(_crosses(s, box) for s in segments):
+            found.append(tile)
+    return found
+#----------------------------------------------------------------------
+def _star(cx, cy, radius, points, rnd):
+    ring = []
+    for i in xrange(points):
+        angle = 2 * math.pi * i / points
+        r = radius * rnd.uniform(0.2, 1.0)
+        ring.append([cx + r * math.cos(angle), cy + r * math.sin(angle)])
+    ring.append(ring[0])
+    return ring
+########################################################################
+class TileGridTest(unittest.TestCase):
+    #----------------------------------------------------------------------
+    def setUp(self):
+        self.grid = tilegrid.TileGrid(_tile_info())
+    #----------------------------------------------------------------------
+    def test_tile_range(self):
+        # level 1 tiles are 256 units wide, the extent ends on a boundary
+        extent = {"xmin" : 10, "ymin" : 10, "xmax" : 512, "ymax" : 1000}
+        self.assertEqual(self.grid.tile_range(extent, 1), (0, 0, 3, 1))
+        self.assertEqual(self.grid.tile_extent(1, 3, 1),
+                         (256.0, 0.0, 512.0, 256.0))
+        self.assertEqual(self.grid.count(extent, [0, 1]), 2 + 8)
+        self.assertEqual(list(self.grid.tiles(extent, [0])),
+                         [(0, 0, 0), (0, 1, 0)])
+    #----------------------------------------------------------------------
+    def test_polygon_against_brute_force(self):
+        rnd = random.Random(4)
+        for attempt in xrange(20):
+            outer = _star(rnd.uniform(300, 700), rnd.uniform(300, 700),
+                          rnd.uniform(50, 300), rnd.randint(3, 12), rnd)
+            rings = [outer]
+            if attempt % 2 == 0:
+                # a hole, the tiles entirely inside it are skipped
+                hole = [[x * 0.3 + outer[0][0] * 0.7,
+                         y * 0.3 + outer[0][1] * 0.7] for x, y in outer]
+                rings.append(hole[::-1])
+            for level in self.grid.levels:
+                self.assertEqual(
+                    list(self.grid.polygon_tiles(rings, [level])),
+                    _brute_force(self.grid, rings, level),
+                    "polygon %s, level %s" % (attempt, level))
+    #----------------------------------------------------------------------
+    def test_polygon_hole_skips_tiles(self):
+        outer = [[1.5, 1.5], [1.5, 1022.5], [1022.5, 1022.5],
+                 [1022.5, 1.5], [1.5, 1.5]]
+        hole = [[100.5, 100.5], [900.5, 100.5], [900.5, 900.5],
+                [100.5, 900.5], [100.5, 100.5]]
+        tiles = list(self.grid.polygon_tiles([outer, hole], [3]))
+        # level 3 tiles are 64 units, 16 x 16 of them, the hole entirely
+        # covers the tiles of columns and rows 2 to 13
+        self.assertEqual(len(tiles), 16 * 16 - 12 * 12)
+        self.assertFalse((3, 8, 8) in tiles)
+    #----------------------------------------------------------------------
+    def test_polygon_resume(self):
+        ring = _star(500, 500, 400, 9, random.Random(1))
+        tiles = list(self.grid.polygon_tiles([ring]))
+        for i in (0, 5, len(tiles) // 2, len(tiles) - 1):
+            self.assertEqual(
+                list(self.grid.polygon_tiles([ring], start=tiles[i])),
+                tiles[i + 1:])
+    #----------------------------------------------------------------------
+    def test_web_mercator(self):
+        grid = tilegrid.TileGrid(tilegrid.web_mercator_tile_info(3))
+        self.assertEqual(grid.levels, [0, 1, 2, 3])
+        world = {"xmin" : -2e7, "ymin" : -2e7, "xmax" : 2e7, "ymax" : 2e7}
+        self.assertEqual(grid.count(world), 1 + 4 + 16 + 64)
+#----------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()